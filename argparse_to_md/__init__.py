@@ -1,10 +1,35 @@
+import typing as t
+
 try:
     from ._version import __version__
 except ImportError:
     # This happens when the package is not installed, e.g. when running pre-commit in CI
     __version__ = "0.0.0"
 
-from .loader import FunctionLoader
-from .markdown_processor import process_markdown
+if t.TYPE_CHECKING:
+    from .loader import FunctionLoader
+    from .markdown_processor import process_markdown
 
 __all__ = ["process_markdown", "FunctionLoader", "__version__"]
+
+
+def __getattr__(name: str) -> t.Any:
+    # Submodules defining the public names are only imported on first access, so that starting the CLI
+    # (e.g. the daemon client, or --version) doesn't pay for what it doesn't use.
+    value: t.Any
+    if name == "FunctionLoader":
+        from .loader import FunctionLoader
+
+        value = FunctionLoader
+    elif name == "process_markdown":
+        from .markdown_processor import process_markdown
+
+        value = process_markdown
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> t.List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -1,12 +1,24 @@
 import argparse
-import difflib
-import io
 import os
-import sys
+import typing as t
 
 from . import __version__
-from .loader import FunctionLoader
-from .markdown_processor import process_markdown
+from .defaults import DEFAULT_CACHE_DIR, DEFAULT_SOCKET_PATH, DEFAULT_WATCH_INTERVAL
+
+
+def _input_path(path: str) -> str:
+    # Input files are opened one at a time when they are processed, only check that they exist here.
+    # Glob patterns are expanded later, they may legitimately match nothing.
+    if not os.path.exists(path) and not any(c in path for c in "*?["):
+        raise argparse.ArgumentTypeError(f"can't open '{path}': no such file or directory")
+    return path
+
+
+def _output_spec(spec: str) -> t.Tuple[str, str]:
+    output_format, sep, path = spec.partition("=")
+    if not sep or not output_format or not path:
+        raise argparse.ArgumentTypeError(f"invalid output '{spec}', expected FORMAT=FILE")
+    return output_format, path
 
 
 def get_parser() -> argparse.ArgumentParser:
@@ -16,9 +28,45 @@ def get_parser() -> argparse.ArgumentParser:
         "--input",
         nargs="+",
         action="extend",
-        type=argparse.FileType("r+"),
+        type=_input_path,
         default=[],
-        help="Markdown file to update (can be specified multiple times).",
+        help="Markdown file to update (can be specified multiple times). Directories are searched recursively for "
+        "the files matching --include, glob patterns (quoted, e.g. 'docs/**/*.md') are expanded. Only the found "
+        "files which contain markers are processed, files and directories ignored by .gitignore are skipped.",
+    )
+    parser.add_argument(
+        "--include",
+        nargs="+",
+        action="extend",
+        metavar="PATTERN",
+        help="Names of the files to process in the input directories, in .gitignore pattern syntax "
+        "(can be specified multiple times). Default: *.md",
+    )
+    parser.add_argument(
+        "--exclude",
+        nargs="+",
+        action="extend",
+        default=[],
+        metavar="PATTERN",
+        help="Files and directories to skip in the input directories, in .gitignore pattern syntax "
+        "(can be specified multiple times).",
+    )
+    parser.add_argument(
+        "--parser",
+        metavar="MODULE:FUNCTION[:OPTIONS]",
+        help="Parser to render into the --output files, in the same syntax as in the markers, "
+        "e.g. 'mytool.cli:get_parser:max_depth=1'. The module is imported once for all the outputs.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        nargs="+",
+        action="extend",
+        type=_output_spec,
+        default=[],
+        metavar="FORMAT=FILE",
+        help="Render the --parser into FILE, in the given format: markdown, rst, man, html or json "
+        "(can be specified multiple times). Files are only written if their contents change.",
     )
     parser.add_argument(
         "--extra-sys-path", nargs="+", help="Extra paths to add to PYTHONPATH before loading the module"
@@ -29,51 +77,157 @@ def get_parser() -> argparse.ArgumentParser:
         help="Check if the files need to be updated, but don't modify them. "
         "Non-zero exit code is returned if any file needs to be updated.",
     )
+    parser.add_argument(
+        "--format",
+        choices=["text", "json"],
+        default="text",
+        help="Format of the report of the changes. 'text' prints the names of the files and, with --check, the diffs "
+        "of the changed blocks to stderr. 'json' prints the changed files with the marker, the line range and "
+        "the diff of each changed block to stdout.",
+    )
+    parser.add_argument(
+        "--changed-files",
+        nargs="*",
+        metavar="FILE",
+        help="Files changed since the last run, e.g. passed by pre-commit. Only the blocks which depend on these "
+        "files, and the blocks in the input files which are listed themselves, are regenerated. "
+        "Requires the cache; without it, or for the blocks not known to the cache, all blocks are regenerated.",
+    )
+    parser.add_argument(
+        "--loader",
+        choices=["import", "static"],
+        default="import",
+        help="How to obtain the parsers: 'import' imports the module and calls the function, "
+        "'static' evaluates the function from the module source code without importing it, "
+        "falling back to 'import' if the function can't be evaluated statically.",
+    )
+    parser.add_argument(
+        "--dump-model",
+        metavar="DIR",
+        help="Instead of updating the input files, write snapshots of the parsers used by their blocks "
+        "(and of --parser) into DIR, as MODULE.FUNCTION.json. With --check, only check that the snapshots are "
+        "up to date. The snapshots can then be rendered with --from-model, without importing the modules.",
+    )
+    parser.add_argument(
+        "--from-model",
+        metavar="DIR",
+        help="Render the blocks from the parser snapshots in DIR written by --dump-model, without importing "
+        "any modules.",
+    )
+    parser.add_argument(
+        "--stub-modules",
+        nargs="+",
+        default=[],
+        metavar="MODULE",
+        help="Modules to replace with stubs when importing, along with their submodules, even if they are installed. "
+        "Useful for heavy dependencies which the parser factories don't need. Missing modules imported by the "
+        "project files are replaced with stubs anyway.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of input files processed in parallel, and of worker processes used to import the modules "
+        "and call the parser factories. With the default value of 1, files are processed one by one "
+        "and modules are imported into the argparse_to_md process itself.",
+    )
+    parser.add_argument(
+        "--sandbox",
+        action="store_true",
+        help="Import each module and call the parser factory in a separate child process, within the limits below. "
+        "If the module fails to load, hangs or exceeds a limit, the error is reported for the block, the block "
+        "keeps its contents and the other blocks and files are still processed; the exit code is 1.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        metavar="SECONDS",
+        help="With --sandbox: wall clock time limit of importing a module and calling the factory. Default: 60",
+    )
+    parser.add_argument(
+        "--max-cpu-time",
+        type=int,
+        metavar="SECONDS",
+        help="With --sandbox: CPU time limit of the child process (Unix only).",
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=int,
+        metavar="MB",
+        help="With --sandbox: address space limit of the child process, in megabytes (Unix only).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Directory where the rendered blocks are cached between runs. Default: {DEFAULT_CACHE_DIR}",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't use the cache, always import the modules and render the blocks.",
+    )
+    parser.add_argument(
+        "--no-memoize",
+        action="store_true",
+        help="Call the parser factory and render the output for every block, even if the same module and function "
+        "were already used in another block. Use this if the parser factories are not pure.",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="text",
+        choices=["text", "json"],
+        help="Print the time spent in each processing phase, per file and per block, to stderr. "
+        "The report is human-readable by default, or JSON if 'json' is given.",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="Also measure peak memory usage of each phase with tracemalloc. Slows down processing.",
+    )
+    parser.add_argument(
+        "--watch",
+        nargs="?",
+        type=float,
+        const=DEFAULT_WATCH_INTERVAL,
+        metavar="INTERVAL",
+        help="After processing the files, keep watching the input files and the source files of the parsers, "
+        "and update the files whenever they change. Imported modules are kept loaded between the updates, only the "
+        "changed modules are reloaded. Files are checked for changes every INTERVAL seconds "
+        f"(default: {DEFAULT_WATCH_INTERVAL}). Can't be combined with --jobs.",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Run in the background, keeping the modules loaded, and serve the requests of argparse_to_md_client "
+        "over a Unix socket. Modules are reloaded when their source files change.",
+    )
+    parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET_PATH,
+        help=f"Path of the Unix socket used by --daemon and argparse_to_md_client. Default: {DEFAULT_SOCKET_PATH}",
+    )
     parser.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
     return parser
 
 
-def main() -> None:
+def main(argv: t.Optional[t.List[str]] = None) -> None:
     parser = get_parser()
-    args = parser.parse_args()
-
-    if not args.input:
-        raise SystemExit("No input files specified")
+    args = parser.parse_args(argv)
 
-    # Include the process CWD in the loader's search path so that modules
-    # at the repo root can be found even when input files are in subdirectories.
-    # When running as a pre-commit hook, CWD is the repo root (per githooks(5)).
-    extra_paths = [os.path.realpath(p) for p in (args.extra_sys_path or [])]
-    process_cwd = os.path.realpath(os.getcwd())
-    if process_cwd not in extra_paths:
-        extra_paths.append(process_cwd)
-    loader = FunctionLoader(extra_paths)
+    # The processing code is only imported after the arguments are parsed,
+    # so that --help, --version and argument errors don't pay for importing it.
+    if args.daemon:
+        from .daemon import Daemon
 
-    changes_required = False
-    for in_markdown in args.input:
-        in_markdown_str = in_markdown.read()
-        in_markdown.seek(0)
-        out_markdown = io.StringIO()
-        process_markdown(in_markdown, out_markdown, loader)
-        out_markdown_str = out_markdown.getvalue()
+        Daemon(args.socket).serve_forever()
+        return
 
-        if in_markdown_str != out_markdown_str:
-            if args.check:
-                print(f"Changes required in {in_markdown.name}:", file=sys.stderr)
-                for line in difflib.unified_diff(
-                    in_markdown_str.splitlines(), out_markdown_str.splitlines(), lineterm=""
-                ):
-                    print(line, file=sys.stderr)
-                changes_required = True
-            else:
-                print(f"Updating {in_markdown.name}...", file=sys.stderr)
-                in_markdown.seek(0)
-                in_markdown.truncate()
-                in_markdown.write(out_markdown.getvalue())
-                in_markdown.close()
+    from .processing import run_cli
 
-    if args.check and changes_required:
-        raise SystemExit(2)
+    run_cli(args)
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import typing as t
+
+from . import __version__
+from .defaults import DEFAULT_CACHE_DIR
+
+# Cache entries which were not used for this long are removed by RenderCache.prune
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+# File in the cache directory which records the dependencies of each block, see RenderCache.get_dependencies
+INDEX_FILE_NAME = "index.json"
+INDEX_FORMAT_VERSION = 1
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _tool_signature() -> str:
+    """
+    Hash of the source files of argparse_to_md itself, which the output also depends on.
+
+    Computed once per process and made part of the cache keys, so that the entries don't need to track these files.
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith(".py"):
+            h.update(name.encode() + b"\0" + _hash_file(os.path.join(package_dir, name)).encode())
+    return h.hexdigest()
+
+
+def _file_signature(path: str) -> t.Dict[str, t.Any]:
+    st = os.stat(path)
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": _hash_file(path)}
+
+
+def ensure_cache_dir(path: str) -> None:
+    """Create the cache directory, if it doesn't exist yet, along with a .gitignore file."""
+    if os.path.isdir(path):
+        return
+    os.makedirs(path, exist_ok=True)
+    # Keep the cache out of version control, similar to what pytest does for .pytest_cache
+    with open(os.path.join(path, ".gitignore"), "w") as f:
+        f.write("# Created by argparse_to_md automatically.\n*\n")
+
+
+class RenderCache:
+    """
+    Cache of rendered markdown blocks.
+
+    Each entry is keyed on the block (module, function, options) and the search path used to import the module.
+
+    If cache_dir is set, entries are also stored on disk, to be reused by later runs. A persistent entry stores the
+    rendered markdown and the signatures of all source files which were loaded while importing the module. It is only
+    used if none of these files have changed, so a hit doesn't require importing anything.
+
+    If memoize is set, entries are also kept in memory for the lifetime of the cache object, so that identical blocks
+    in several places or files are only rendered once.
+
+    The dependencies of the persistent entries are also recorded in a separate index, which is saved by save_index.
+    It allows finding out which blocks may be affected by a change without reading or validating the entries.
+    """
+
+    def __init__(
+        self, cache_dir: t.Optional[str] = DEFAULT_CACHE_DIR, max_age: float = DEFAULT_MAX_AGE, memoize: bool = True
+    ):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.memoize = memoize
+        self._memory: t.Dict[str, str] = {}
+        self._index: t.Optional[t.Dict[str, t.List[str]]] = None
+        self._index_changed = False
+        self._index_lock = threading.Lock()
+        # Keys of the blocks which were served or stored by this object
+        self._used_keys: t.Set[str] = set()
+
+    @staticmethod
+    def make_key(
+        module: str,
+        function: str,
+        options: t.Optional[str],
+        search_path: t.Sequence[str],
+        stub_modules: t.Sequence[str] = (),
+    ) -> str:
+        key_data = json.dumps(
+            [__version__, _tool_signature(), module, function, options or "", list(search_path), list(stub_modules)]
+        )
+        return hashlib.sha256(key_data.encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        assert self.cache_dir is not None
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key: str) -> t.Optional[str]:
+        """
+        Return the cached output for the key, or None if there is no valid entry.
+        Stale entries are removed.
+        """
+        if key in self._memory:
+            self._used_keys.add(key)
+            return self._memory[key]
+        if self.cache_dir is None:
+            return None
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not self._dependencies_unchanged(entry.get("dependencies", {})):
+            self._remove(entry_path)
+            return None
+
+        # Update the timestamp of the entry, used for age-based eviction
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        self._record_dependencies(key, entry.get("dependencies", {}))
+        output = entry.get("output")
+        if not isinstance(output, str):
+            return None
+        if self.memoize:
+            self._memory[key] = output
+        return output
+
+    def put(self, key: str, output: str, dependencies: t.Sequence[str]) -> None:
+        if self.memoize:
+            self._memory[key] = output
+        if not dependencies:
+            # Nothing to validate the entry against
+            return
+        if self.cache_dir is None:
+            # Not persistent, but the dependencies are still needed to invalidate the memoized output
+            self._record_dependencies(key, dependencies)
+            return
+        signatures = {}
+        for path in dependencies:
+            try:
+                signatures[path] = _file_signature(path)
+            except OSError:
+                # Can't track this file, so the entry can't be validated later
+                return
+        entry = {"dependencies": signatures, "output": output}
+
+        self._ensure_cache_dir()
+        self._write_json(self._entry_path(key), entry)
+        self._record_dependencies(key, signatures)
+
+    def get_dependencies(self, key: str) -> t.Optional[t.List[str]]:
+        """
+        Return the real paths of the source files the block depended on when it was last rendered,
+        or None if the block isn't in the index.
+        """
+        return self._load_index().get(key)
+
+    def used_dependencies(self) -> t.Set[str]:
+        """Return the real paths of the source files all the blocks served or stored by this object depend on."""
+        index = self._load_index()
+        return {path for key in self._used_keys for path in index.get(key, [])}
+
+    def invalidate(self, changed_files: t.AbstractSet[str]) -> None:
+        """Forget the memoized output of the blocks which depend on any of the given files (real paths)."""
+        index = self._load_index()
+        for key in list(self._memory):
+            if any(path in changed_files for path in index.get(key, [])):
+                del self._memory[key]
+
+    def save_index(self) -> None:
+        """Save the dependency index, dropping the blocks which are no longer in the cache."""
+        if self.cache_dir is None or not self._index_changed:
+            return
+        index = self._load_index()
+        blocks = {key: deps for key, deps in index.items() if os.path.exists(self._entry_path(key))}
+        self._ensure_cache_dir()
+        index_path = os.path.join(self.cache_dir, INDEX_FILE_NAME)
+        self._write_json(index_path, {"version": INDEX_FORMAT_VERSION, "blocks": blocks})
+        self._index_changed = False
+
+    def _load_index(self) -> t.Dict[str, t.List[str]]:
+        with self._index_lock:
+            if self._index is None:
+                index: t.Dict[str, t.List[str]] = {}
+                if self.cache_dir is not None:
+                    try:
+                        with open(os.path.join(self.cache_dir, INDEX_FILE_NAME), encoding="utf-8") as f:
+                            data = json.load(f)
+                        if data.get("version") == INDEX_FORMAT_VERSION:
+                            index = data["blocks"]
+                    except (OSError, ValueError, KeyError):
+                        pass
+                self._index = index
+            return self._index
+
+    def _record_dependencies(self, key: str, dependencies: t.Iterable[str]) -> None:
+        paths = sorted(os.path.realpath(path) for path in dependencies)
+        index = self._load_index()
+        with self._index_lock:
+            self._used_keys.add(key)
+            if index.get(key) != paths:
+                index[key] = paths
+                self._index_changed = True
+
+    def prune(self) -> None:
+        """Remove entries which haven't been used for longer than max_age."""
+        if self.cache_dir is None:
+            return
+        try:
+            dir_entries = list(os.scandir(self.cache_dir))
+        except OSError:
+            return
+        deadline = time.time() - self.max_age
+        for dir_entry in dir_entries:
+            if not dir_entry.name.endswith(".json") or dir_entry.name == INDEX_FILE_NAME:
+                continue
+            try:
+                if dir_entry.stat().st_mtime < deadline:
+                    os.remove(dir_entry.path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _dependencies_unchanged(dependencies: t.Dict[str, t.Dict[str, t.Any]]) -> bool:
+        for path, signature in dependencies.items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            if st.st_mtime_ns == signature["mtime_ns"] and st.st_size == signature["size"]:
+                continue
+            # The file was touched, check if the contents have changed
+            if st.st_size != signature["size"] or _hash_file(path) != signature["sha256"]:
+                return False
+        return True
+
+    def _ensure_cache_dir(self) -> None:
+        assert self.cache_dir is not None
+        ensure_cache_dir(self.cache_dir)
+
+    def _write_json(self, path: str, data: t.Any) -> None:
+        # Write to a temporary file first, so that concurrent runs never see a partially written file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with open(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
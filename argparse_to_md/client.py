@@ -0,0 +1,71 @@
+"""
+Thin client for the argparse_to_md daemon (see argparse_to_md --daemon).
+
+Takes the same arguments as argparse_to_md. If a daemon is serving the current directory, the request is passed to
+it, which avoids importing the modules again on every run. Otherwise, the files are processed in this process.
+"""
+
+import json
+import os
+import socket
+import sys
+import typing as t
+
+from . import __version__
+from .defaults import DEFAULT_SOCKET_PATH
+
+
+def _socket_path(argv: t.List[str]) -> str:
+    for i, arg in enumerate(argv):
+        if arg == "--socket" and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith("--socket="):
+            return arg.split("=", 1)[1]
+    return DEFAULT_SOCKET_PATH
+
+
+def send_request(socket_path: str, argv: t.List[str]) -> t.Optional[t.Dict[str, t.Any]]:
+    """
+    Pass the arguments to the daemon listening on the socket and wait for the result.
+
+    Returns the response, or None if no daemon is running or the daemon can't handle the request.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    request = {"version": __version__, "cwd": os.path.realpath(os.getcwd()), "argv": argv}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            sock.shutdown(socket.SHUT_WR)
+            with sock.makefile("rb") as f:
+                response = json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(response, dict) or response.get("status") != "ok":
+        return None
+    # A malformed response is treated like a declined request, the files are processed in-process then
+    if not isinstance(response.get("exit_code"), int):
+        return None
+    if not isinstance(response.get("stdout"), str) or not isinstance(response.get("stderr"), str):
+        return None
+    return response
+
+
+def main() -> None:
+    argv = sys.argv[1:]
+    response = send_request(_socket_path(argv), argv)
+    if response is None:
+        from .__main__ import main as main_in_process
+
+        main_in_process(argv)
+        return
+
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    if response["exit_code"]:
+        raise SystemExit(response["exit_code"])
+
+
+if __name__ == "__main__":
+    main()
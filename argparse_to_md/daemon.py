@@ -0,0 +1,152 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import time
+import traceback
+import typing as t
+
+from . import __version__
+from .__main__ import get_parser
+from .cache import RenderCache, ensure_cache_dir
+from .loader import FunctionLoader
+from .processing import check_args, get_search_path, run, watch_dependencies
+from .snapshots import SnapshotFunctionLoader
+from .static_loader import StaticFunctionLoader
+from .watch import FileWatcher
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: "_DaemonServer"
+
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        response = self.server.daemon.handle(request)
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class _DaemonServer(socketserver.UnixStreamServer):
+    def __init__(self, socket_path: str, daemon: "Daemon"):
+        super().__init__(socket_path, _RequestHandler)
+        self.daemon = daemon
+
+
+class Daemon:
+    """
+    Serves argparse_to_md requests from argparse_to_md_client, keeping the loaders and the caches between requests.
+
+    The daemon serves one directory, the one it was started in; requests from other directories are declined and
+    processed by the client itself. Requests are handled one at a time. Before handling a request, the source files
+    of the loaded modules are checked for changes, and the affected modules are reloaded.
+    """
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.cwd = os.path.realpath(os.getcwd())
+        # Loaders and caches are kept for each combination of the arguments which affects them
+        self.loaders: t.Dict[t.Tuple[t.Any, ...], FunctionLoader] = {}
+        self.caches: t.Dict[t.Tuple[t.Any, ...], RenderCache] = {}
+        self.watcher = FileWatcher()
+
+    def serve_forever(self) -> None:
+        if not hasattr(socket, "AF_UNIX"):
+            raise SystemExit("--daemon is not supported on this platform")
+        self._remove_stale_socket()
+        socket_dir = os.path.dirname(self.socket_path)
+        if socket_dir:
+            ensure_cache_dir(socket_dir)
+        server = _DaemonServer(self.socket_path, self)
+        print(f"Listening on {self.socket_path}, press Ctrl+C to stop...", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(self.socket_path)
+
+    def _remove_stale_socket(self) -> None:
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                # Left over by a daemon which didn't exit cleanly
+                os.remove(self.socket_path)
+                return
+        raise SystemExit(f"Another daemon is already listening on {self.socket_path}")
+
+    def handle(self, request: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        """Process one request, return the response to send to the client."""
+        if request.get("version") != __version__:
+            return {"status": "declined", "reason": f"daemon version is {__version__}"}
+        if request.get("cwd") != self.cwd:
+            return {"status": "declined", "reason": f"daemon serves {self.cwd}"}
+        argv = request.get("argv", [])
+        if any(arg.split("=", 1)[0] in ("--daemon", "--watch", "--sandbox") for arg in argv):
+            return {"status": "declined", "reason": "not supported by the daemon"}
+
+        start_time = time.perf_counter()
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        # Requests are handled one at a time, so redirecting the process-wide streams is safe
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                exit_code = self._process(argv)
+            except SystemExit as e:
+                if isinstance(e.code, int) or e.code is None:
+                    exit_code = e.code or 0
+                else:
+                    print(e.code, file=sys.stderr)
+                    exit_code = 1
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+        print(f"Processed request in {time.perf_counter() - start_time:.3f} s, exit code {exit_code}", file=sys.stderr)
+        return {"status": "ok", "exit_code": exit_code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+    def _process(self, argv: t.List[str]) -> int:
+        args = get_parser().parse_args(argv)
+        check_args(args)
+        self._reload_changed()
+        loader, cache = self._get_loader(args), self._get_cache(args)
+        exit_code = run(args, loader, cache)
+        watch_dependencies(self.watcher, loader, cache)
+        return exit_code
+
+    def _reload_changed(self) -> None:
+        changed_files = self.watcher.poll()
+        if not changed_files:
+            return
+        for loader in self.loaders.values():
+            for module_name in loader.reload_modules(changed_files):
+                print(f"Reloaded {module_name}", file=sys.stderr)
+        for cache in self.caches.values():
+            cache.invalidate(changed_files)
+
+    def _get_loader(self, args: argparse.Namespace) -> FunctionLoader:
+        if args.from_model is not None:
+            snapshot_key = ("from_model", os.path.realpath(args.from_model), args.no_memoize)
+            if snapshot_key not in self.loaders:
+                self.loaders[snapshot_key] = SnapshotFunctionLoader(args.from_model, not args.no_memoize)
+            return self.loaders[snapshot_key]
+        search_path = get_search_path(args)
+        key = (tuple(search_path), args.loader, args.no_memoize, tuple(args.stub_modules))
+        if key not in self.loaders:
+            loader_class = StaticFunctionLoader if args.loader == "static" else FunctionLoader
+            self.loaders[key] = loader_class(search_path, not args.no_memoize, args.stub_modules)
+        return self.loaders[key]
+
+    def _get_cache(self, args: argparse.Namespace) -> RenderCache:
+        key = (None if args.no_cache else os.path.realpath(args.cache_dir), args.no_memoize)
+        if key not in self.caches:
+            self.caches[key] = RenderCache(None if args.no_cache else args.cache_dir, memoize=not args.no_memoize)
+        return self.caches[key]
@@ -0,0 +1,16 @@
+"""
+Default values of the command line options.
+
+Kept free of dependencies, so that argparse_to_md --help and --version don't import the modules using them.
+"""
+
+import os
+
+# Directory where the rendered blocks are cached between runs
+DEFAULT_CACHE_DIR = os.path.join(".cache", "argparse_to_md")
+
+# Unix socket of the daemon, see daemon.py
+DEFAULT_SOCKET_PATH = os.path.join(".cache", "argparse_to_md", "daemon.sock")
+
+# Default interval between checks for changes in --watch mode, in seconds
+DEFAULT_WATCH_INTERVAL = 0.25
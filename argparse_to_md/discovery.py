@@ -0,0 +1,230 @@
+import os
+import re
+import typing as t
+from dataclasses import dataclass
+
+from .markdown_processor import map_markdown_file
+
+DEFAULT_INCLUDE = ["*.md"]
+
+# Files without this string can't contain a start marker, checked on the raw bytes before anything is decoded
+MARKER_PREFIX = b"argparse_to_md:"
+
+_GLOB_CHARS = "*?["
+
+
+def is_glob_pattern(path: str) -> bool:
+    return any(c in path for c in _GLOB_CHARS)
+
+
+@dataclass
+class _Rule:
+    regex: t.Pattern[str]
+    # Rules only apply to the paths under this directory, with a trailing "/"
+    base: str = ""
+    negate: bool = False
+    dir_only: bool = False
+    # Added to the paths relative to the search root, for the rules of the .gitignore files above it
+    prefix: str = ""
+
+    def matches(self, path: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        path = self.prefix + path
+        if not path.startswith(self.base):
+            return False
+        return self.regex.match(path[len(self.base) :]) is not None
+
+
+def _compile_pattern(pattern: str, anchored: t.Optional[bool] = None) -> t.Pattern[str]:
+    """
+    Translate a .gitignore style pattern into a regex matching the relative paths (with "/" separators).
+
+    "*" and "?" don't match "/", "**" matches any number of directories. Unless anchored is given, patterns
+    containing a "/" are matched against the whole path, other patterns against the name at any level.
+    """
+    if anchored is None:
+        anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    regex = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            regex.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            regex.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            regex.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            char_class = pattern[i + 1 : end]
+            if char_class.startswith("!"):
+                char_class = "^" + char_class[1:]
+            regex.append("[" + char_class.replace("\\", "\\\\") + "]")
+            i = end + 1
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile(("" if anchored else "(?:.*/)?") + "".join(regex) + r"\Z")
+
+
+def _parse_rule(pattern: str, base: str = "", anchored: t.Optional[bool] = None) -> _Rule:
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    return _Rule(_compile_pattern(pattern, anchored), base, negate, dir_only)
+
+
+def _read_gitignore(directory: str, base: str) -> t.List[_Rule]:
+    try:
+        with open(os.path.join(directory, ".gitignore"), encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    rules = []
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("\\"):
+            line = line[1:]
+        rules.append(_parse_rule(line, base))
+    return rules
+
+
+def _matches(rules: t.List[_Rule], path: str, is_dir: bool) -> bool:
+    # Like in .gitignore files, the last matching rule wins
+    matched = False
+    for rule in rules:
+        if rule.matches(path, is_dir):
+            matched = not rule.negate
+    return matched
+
+
+def _parent_gitignore_rules(directory: str) -> t.List[_Rule]:
+    """Return the rules of the .gitignore files in the parent directories, up to the root of the repository."""
+    parents = []
+    current = os.path.realpath(directory)
+    while True:
+        if os.path.exists(os.path.join(current, ".git")):
+            break
+        parent = os.path.dirname(current)
+        if parent == current:
+            # Not in a repository, .gitignore files outside of the directory don't apply
+            return []
+        parents.append(parent)
+        current = parent
+
+    # Paths are matched relative to the root of the repository
+    prefix = os.path.relpath(os.path.realpath(directory), current).replace(os.sep, "/") + "/"
+    rules = []
+    for parent in reversed(parents):
+        parent_rel = os.path.relpath(parent, current).replace(os.sep, "/")
+        for rule in _read_gitignore(parent, "" if parent_rel == "." else parent_rel + "/"):
+            rule.prefix = prefix
+            rules.append(rule)
+    return rules
+
+
+def has_marker(path: str) -> bool:
+    """Cheap check whether the file may contain a start marker, without decoding it."""
+    try:
+        with map_markdown_file(path) as buffer:
+            return buffer.find(MARKER_PREFIX) >= 0
+    except OSError:
+        return False
+
+
+def _walk(
+    directory: str,
+    rel: str,
+    rules: t.List[_Rule],
+    include: t.List[_Rule],
+    exclude: t.List[_Rule],
+    use_gitignore: bool,
+    found: t.List[str],
+) -> None:
+    if use_gitignore:
+        rules = rules + _read_gitignore(directory, rel)
+    with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        path = rel + entry.name
+        # Symlinked directories are not followed, to avoid cycles
+        is_dir = entry.is_dir(follow_symlinks=False)
+        if entry.name == ".git" or _matches(rules, path, is_dir) or _matches(exclude, path, is_dir):
+            continue
+        if is_dir:
+            _walk(entry.path, path + "/", rules, include, exclude, use_gitignore, found)
+        elif entry.is_file() and _matches(include, path, False) and has_marker(entry.path):
+            found.append(entry.path)
+
+
+def _glob_base(pattern: str) -> t.Tuple[str, str]:
+    # Split the pattern into the longest directory prefix without glob characters, and the rest
+    parts = pattern.replace(os.sep, "/").split("/")
+    for i, part in enumerate(parts):
+        if is_glob_pattern(part):
+            return "/".join(parts[:i]) or ".", "/".join(parts[i:])
+    return pattern, ""
+
+
+def find_input_files(
+    inputs: t.Sequence[str],
+    include: t.Optional[t.Sequence[str]] = None,
+    exclude: t.Sequence[str] = (),
+    use_gitignore: bool = True,
+) -> t.List[str]:
+    """
+    Expand the input paths into the list of markdown files to process.
+
+    Files are returned as given. Directories are searched recursively for the files matching the include patterns
+    (by default, "*.md") and none of the exclude patterns. Glob patterns are searched from their longest directory
+    prefix, e.g. "docs" for "docs/**/*.md". Patterns use the .gitignore syntax; directories and files ignored
+    by .gitignore files are skipped, unless use_gitignore is False. Found files which don't contain the marker
+    prefix are skipped without being decoded.
+
+    :param inputs: File paths, directories and glob patterns.
+    :param include: Patterns of the file names to search for in the directories.
+    :param exclude: Patterns of the files and directories to skip, relative to the searched directory.
+    :param use_gitignore: If set, the rules of the .gitignore files apply.
+    :return: List of file paths, without duplicates.
+    """
+    include_rules = [_parse_rule(pattern) for pattern in (DEFAULT_INCLUDE if include is None else include)]
+    exclude_rules = [_parse_rule(pattern) for pattern in exclude]
+    files = []
+    for input_path in inputs:
+        if os.path.isfile(input_path):
+            files.append(input_path)
+            continue
+        if os.path.isdir(input_path):
+            directory, directory_include = input_path, include_rules
+        elif is_glob_pattern(input_path):
+            directory, pattern = _glob_base(input_path)
+            if not os.path.isdir(directory):
+                continue
+            # The pattern selects the files, relative to its directory prefix
+            directory_include = [_parse_rule(pattern, anchored=True)]
+        else:
+            continue
+        rules = _parent_gitignore_rules(directory) if use_gitignore else []
+        found: t.List[str] = []
+        _walk(directory, "", rules, directory_include, exclude_rules, use_gitignore, found)
+        files.extend(os.path.normpath(path) for path in found)
+
+    unique_files = []
+    seen = set()
+    for path in files:
+        real_path = os.path.realpath(path)
+        if real_path not in seen:
+            seen.add(real_path)
+            unique_files.append(path)
+    return unique_files
@@ -1,128 +1,53 @@
 import argparse
+import fnmatch
+import re
 import typing as t
 from dataclasses import dataclass
 
+from .model import ActionModel, ParserModel
+from .templates import Template, compile_template, load_template
+
 HELP_WIDTH = 100
 
 
+# Normalize group titles
+_GROUP_TITLES = {
+    "positional arguments": "Positional arguments",
+    "optional arguments": "Optional arguments",
+    "options": "Optional arguments",
+}
+
+
 @dataclass
 class MarkdownHelpFormatterOptions:
     subheading_level: int = 0
     pad_lists: bool = False
-
-
-def _get_metavar(action: argparse.Action) -> t.Union[str, tuple]:
-    if action.metavar is not None:
-        return action.metavar
-    if action.choices is not None:
-        return "{" + ",".join(str(c) for c in action.choices) + "}"
-    if action.option_strings:
-        return action.dest.upper()
-    return action.dest
-
-
-def _format_args(action: argparse.Action, metavar: t.Union[str, tuple]) -> str:
-    if isinstance(metavar, tuple):
-        if action.nargs is None:
-            return str(metavar[0])
-        elif action.nargs == argparse.OPTIONAL:
-            return "[%s]" % metavar[0]
-        elif action.nargs == argparse.ZERO_OR_MORE:
-            if len(metavar) == 2:
-                return "[%s [%s ...]]" % metavar
-            return "[%s ...]" % metavar[0]
-        elif action.nargs == argparse.ONE_OR_MORE:
-            if len(metavar) == 2:
-                return "%s [%s ...]" % metavar
-            return "%s [%s ...]" % (metavar[0], metavar[0])
-        elif isinstance(action.nargs, int):
-            return " ".join(metavar[i] if i < len(metavar) else metavar[-1] for i in range(action.nargs))
-        return " ".join(str(m) for m in metavar)
-
-    if action.nargs is None:
-        return metavar
-    elif action.nargs == argparse.OPTIONAL:
-        return "[%s]" % metavar
-    elif action.nargs == argparse.ZERO_OR_MORE:
-        return "[%s ...]" % metavar
-    elif action.nargs == argparse.ONE_OR_MORE:
-        return "%s [%s ...]" % (metavar, metavar)
-    elif action.nargs == argparse.REMAINDER:
-        return "..."
-    elif action.nargs == argparse.PARSER:
-        return "%s ..." % metavar
-    elif action.nargs == argparse.SUPPRESS:
-        return ""
-    else:
-        return " ".join([metavar] * int(action.nargs))
-
-
-def _is_extend_action(action: argparse.Action) -> bool:
-    extend_cls = getattr(argparse, "_ExtendAction", None)
-    return extend_cls is not None and isinstance(action, extend_cls)
-
-
-def _format_usage_part(action: argparse.Action) -> t.Optional[str]:
-    if action.help is argparse.SUPPRESS:
-        return None
-
-    metavar = _get_metavar(action)
-
-    if not action.option_strings:
-        return _format_args(action, metavar)
-    else:
-        if action.nargs == 0:
-            part = action.option_strings[0]
-        elif _is_extend_action(action) and action.nargs == argparse.ONE_OR_MORE:
-            opt = action.option_strings[0]
-            part = "%s %s [%s %s ...]" % (opt, metavar, opt, metavar)
-        else:
-            args_str = _format_args(action, metavar)
-            part = "%s %s" % (action.option_strings[0], args_str)
-
-        if not action.required:
-            part = "[%s]" % part
-        return part
-
-
-def _build_usage_parts(actions: list, mutex_groups: list) -> t.List[str]:
-    # Map each action to its mutex group (if any)
-    action_to_group: t.Dict[int, t.Any] = {}
-    for group in mutex_groups:
-        for action in group._group_actions:  # pylint: disable=protected-access
-            action_to_group[id(action)] = group
-
-    parts: t.List[str] = []
-    seen_groups: t.Set[int] = set()
-
-    for action in actions:
-        group = action_to_group.get(id(action))
-
-        if group is not None and id(group) not in seen_groups:
-            seen_groups.add(id(group))
-            group_parts = []
-            for group_action in group._group_actions:  # pylint: disable=protected-access
-                part = _format_usage_part(group_action)
-                if part is not None:
-                    # Strip outer [] since the group provides its own brackets
-                    if part.startswith("[") and part.endswith("]"):
-                        part = part[1:-1]
-                    group_parts.append(part)
-            if group_parts:
-                sep = " | ".join(group_parts)
-                if group.required:
-                    parts.append("(%s)" % sep)
-                else:
-                    parts.append("[%s]" % sep)
-        elif group is None:
-            part = _format_usage_part(action)
-            if part is not None:
-                parts.append(part)
-
-    return parts
-
-
-def _wrap_usage_line(prog: str, parts: t.List[str], width: int) -> str:
+    # Maximum depth of subcommands to render: None for unlimited, 0 to render only the top level parser
+    max_depth: t.Optional[int] = None
+    # Name of the renderer, see renderers.py. The options above apply to all the formats, except for pad_lists.
+    format: str = "markdown"
+    # Paths of the template files replacing the default markdown fragments, see templates.py
+    usage_template: t.Optional[str] = None
+    group_template: t.Optional[str] = None
+    action_template: t.Optional[str] = None
+    # Path of the parser model snapshot to render, instead of loading the parser (see snapshots.py)
+    model: t.Optional[str] = None
+    # Subtree to render: names of the subcommands leading to the parser rendered at the top of the block,
+    # and glob patterns of the subcommand paths below it (e.g. "migrate/*") to render or to leave out
+    path: t.Tuple[str, ...] = ()
+    include: t.Tuple[str, ...] = ()
+    exclude: t.Tuple[str, ...] = ()
+
+
+# Default markdown fragments. Subcommands are separated from the previous section, and their label from the usage.
+_USAGE_TEMPLATE = compile_template("{heading}{label}:\n```\n{usage}\n```\n{description}", "usage")
+_SUBCOMMAND_USAGE_TEMPLATE = compile_template("\n{heading}{label}:\n\n```\n{usage}\n```\n{description}", "usage")
+_GROUP_TEMPLATE = compile_template("\n{title}:\n{actions}", "group")
+_PADDED_GROUP_TEMPLATE = compile_template("\n{title}:\n\n{actions}", "group")
+_ACTION_TEMPLATE = compile_template("- {invocation}: {help}\n", "action")
+
+
+def _wrap_usage_line(prog: str, parts: t.Sequence[str], width: int) -> str:
     if not parts:
         return prog
 
@@ -148,102 +73,232 @@ def _wrap_usage_line(prog: str, parts: t.List[str], width: int) -> str:
     return "\n".join(lines)
 
 
+def _format_invocation_md(action: ActionModel) -> str:
+    metavar = action.metavar
+    if not action.option_strings and isinstance(metavar, str) and metavar.startswith("{") and metavar.endswith("}"):
+        # Positional with choices
+        inner = metavar[1:-1]
+        choices = [c.strip() for c in inner.split(",")]
+        return "{" + ", ".join("`%s`" % c for c in choices) + "}"
+    return ", ".join("`%s`" % i for i in action.invocations)
+
+
+# Values of the action template fields. Only the fields used by the template are computed.
+_ACTION_FIELDS: t.Dict[str, t.Callable[[ActionModel], str]] = {
+    "invocation": _format_invocation_md,
+    "invocations": lambda action: ", ".join(action.invocations),
+    "option_strings": lambda action: ", ".join(action.option_strings),
+    "dest": lambda action: action.dest,
+    "metavar": lambda action: " ".join(action.metavar) if isinstance(action.metavar, tuple) else action.metavar,
+    "choices": lambda action: ", ".join(action.choices) if action.choices is not None else "",
+    "help": lambda action: "%s" % action.help,
+}
+
+
+def _render_action_md(out: t.List[str], action: ActionModel, template: Template) -> None:
+    template.render_into(out, {field: _ACTION_FIELDS[field](action) for field in template.fields})
+
+
+def _format_action_model_md(action: ActionModel) -> str:
+    out: t.List[str] = []
+    _render_action_md(out, action, _ACTION_TEMPLATE)
+    return "".join(out)
+
+
 def _format_action_md(action: argparse.Action) -> str:
-    metavar = _get_metavar(action)
-
-    if not action.option_strings:
-        # Positional
-        if isinstance(metavar, str) and metavar.startswith("{") and metavar.endswith("}"):
-            inner = metavar[1:-1]
-            choices = [c.strip() for c in inner.split(",")]
-            invocation = "{" + ", ".join("`%s`" % c for c in choices) + "}"
-        else:
-            fmt = _format_args(action, metavar) if isinstance(metavar, tuple) else str(metavar)
-            invocation = "`%s`" % fmt
-    else:
-        if action.nargs == 0:
-            parts = ["`%s`" % os for os in action.option_strings]
-        elif _is_extend_action(action) and action.nargs == argparse.ONE_OR_MORE:
-            parts = ["`%s %s [%s %s ...]`" % (os, metavar, os, metavar) for os in action.option_strings]
-        else:
-            args_str = _format_args(action, metavar)
-            parts = ["`%s %s`" % (os, args_str) for os in action.option_strings]
-        invocation = ", ".join(parts)
+    return _format_action_model_md(ActionModel.from_action(action))
+
+
+def format_usage(parser: ParserModel) -> str:
+    """Return the usage text of the parser, wrapped to HELP_WIDTH."""
+    if parser.usage is not None:
+        return parser.usage % dict(prog=parser.prog)
+    return _wrap_usage_line(parser.prog, parser.usage_parts, HELP_WIDTH)
+
+
+def iter_groups(parser: ParserModel) -> t.Iterator[t.Tuple[str, t.List[ActionModel]]]:
+    """Iterate over the (title, arguments) of the argument groups shown in the help text, skipping empty groups."""
+    for group in parser.groups:
+        group_actions = [a for a in group.actions if a.dest != "help" and a.help is not argparse.SUPPRESS]
+        if not group_actions:
+            continue
+        title = group.title or ""
+        yield _GROUP_TITLES.get(title.lower(), title), group_actions
+
 
-    return "- %s: %s\n" % (invocation, action.help)
+class _Templates(t.NamedTuple):
+    usage: Template
+    subcommand_usage: Template
+    group: Template
+    action: Template
+
+
+def _get_templates(options: MarkdownHelpFormatterOptions) -> _Templates:
+    usage, subcommand_usage = _USAGE_TEMPLATE, _SUBCOMMAND_USAGE_TEMPLATE
+    if options.usage_template:
+        usage = subcommand_usage = load_template(options.usage_template, "usage")
+    group = _PADDED_GROUP_TEMPLATE if options.pad_lists else _GROUP_TEMPLATE
+    if options.group_template:
+        group = load_template(options.group_template, "group")
+    action = load_template(options.action_template, "action") if options.action_template else _ACTION_TEMPLATE
+    return _Templates(usage, subcommand_usage, group, action)
 
 
 def _generate_parser_md(
-    parser: argparse.ArgumentParser,
-    out: t.TextIO,
+    parser: ParserModel,
+    out: t.List[str],
     options: MarkdownHelpFormatterOptions,
-    usage_label: str,
-    group_suffix: str,
+    usage_template: Template,
+    templates: _Templates,
+    action_fragments: t.Dict[int, str],
+    label: str,
+    command: str,
 ) -> None:
     if options.subheading_level > 0:
         subheading_prefix = "#" * options.subheading_level + " "
     else:
         subheading_prefix = ""
 
-    actions = parser._actions  # pylint: disable=protected-access
-    mutex_groups = parser._mutually_exclusive_groups  # pylint: disable=protected-access
-
-    optionals = [a for a in actions if a.option_strings]
-    positionals = [a for a in actions if not a.option_strings]
-
-    if parser.usage is not None:
-        usage_str = parser.usage % dict(prog=parser.prog)
-    else:
-        parts = _build_usage_parts(optionals + positionals, mutex_groups)
-        usage_str = _wrap_usage_line(parser.prog, parts, HELP_WIDTH)
-
-    out.write("%s%s\n```\n%s\n```\n" % (subheading_prefix, usage_label, usage_str))
-
-    if parser.description:
-        out.write("%s\n" % parser.description)
-
-    # Normalize group titles
-    title_map = {
-        "positional arguments": "Positional arguments",
-        "optional arguments": "Optional arguments",
-        "options": "Optional arguments",
-    }
-
-    for group in parser._action_groups:  # pylint: disable=protected-access
-        group_actions = [
-            a
-            for a in group._group_actions  # pylint: disable=protected-access
-            if a.dest != "help" and a.help is not argparse.SUPPRESS
-        ]
-        if not group_actions:
+    usage_template.render_into(
+        out,
+        {
+            "heading": subheading_prefix,
+            "label": label,
+            "command": command,
+            "usage": format_usage(parser),
+            "description": "%s\n" % parser.description if parser.description else "",
+        },
+    )
+
+    group_suffix = " of `%s`" % command if command else ""
+    for title, group_actions in iter_groups(parser):
+        actions: t.List[str] = []
+        for action in group_actions:
+            fragment = action_fragments.get(id(action))
+            if fragment is None:
+                fragment_parts: t.List[str] = []
+                _render_action_md(fragment_parts, action, templates.action)
+                fragment = action_fragments[id(action)] = "".join(fragment_parts)
+            actions.append(fragment)
+        templates.group.render_into(out, {"title": title + group_suffix, "actions": "".join(actions)})
+
+
+def _has_matches_below(path: str, patterns: t.Sequence[str]) -> bool:
+    """Check if the subcommands below the path can match any of the patterns, judging by their literal prefixes."""
+    for pattern in patterns:
+        magic = re.search(r"[*?[]", pattern)
+        literal = pattern[: magic.start()] if magic else pattern
+        if literal.startswith(path + "/") or (magic and path.startswith(literal)):
+            return True
+    return False
+
+
+def _iter_subcommand_tree(
+    parser: ParserModel,
+    max_depth: t.Optional[int],
+    prefix: t.Sequence[str] = (),
+    include: t.Sequence[str] = (),
+    exclude: t.Sequence[str] = (),
+) -> t.Iterator[t.Tuple[t.List[str], t.List[str], ParserModel]]:
+    """
+    Iterate over the subcommands of the parser, depth first, in the order they were added.
+
+    Yields (command path, aliases, parser) once for each distinct parser object. Aliases of a subcommand refer
+    to the same parser object as its primary name, so they are reported together with it.
+
+    :param prefix: Command path of the parser itself, prepended to the yielded paths.
+    :param include: If not empty, only the subcommands whose paths relative to the parser (e.g. "remote/add")
+        match one of these glob patterns are yielded. Subtrees which can't contain any matches are not visited.
+    :param exclude: Subcommands whose relative paths match one of these glob patterns are skipped, along with
+        their subcommands.
+    """
+    seen = {id(parser)}
+    aliases: t.Dict[int, t.List[str]] = {}
+    stack: t.List[t.Tuple[t.List[str], ParserModel]] = [(list(prefix), parser)]
+    while stack:
+        path, current = stack.pop()
+        depth = len(path) - len(prefix)
+        if depth:
+            relative_path = "/".join(path[len(prefix) :])
+            if any(fnmatch.fnmatchcase(relative_path, pattern) for pattern in exclude):
+                continue
+            matched = not include or any(fnmatch.fnmatchcase(relative_path, pattern) for pattern in include)
+            if matched:
+                yield path, aliases[id(current)], current
+            elif not _has_matches_below(relative_path, include):
+                continue
+        if max_depth is not None and depth >= max_depth:
             continue
 
-        title = group.title or ""
-        title = title_map.get(title.lower(), title)
-        title = "%s%s" % (title, group_suffix)
-
-        out.write("\n%s:\n" % title)
-        if options.pad_lists:
-            out.write("\n")
-        for action in group_actions:
-            out.write(_format_action_md(action))
-
-
-def gen_argparse_help(parser: argparse.ArgumentParser, out_readme: t.TextIO, options: MarkdownHelpFormatterOptions):
-    _generate_parser_md(parser, out_readme, options, "Usage:", "")
-
-    subparsers_actions = [
-        action
-        for action in parser._actions  # pylint: disable=protected-access
-        if isinstance(action, argparse._SubParsersAction)  # pylint: disable=protected-access
-    ]
-    for subparsers_action in subparsers_actions:
-        for choice, subparser in subparsers_action.choices.items():
-            out_readme.write("\n")
-            _generate_parser_md(
-                subparser,
-                out_readme,
-                options,
-                "Usage of `%s`:\n" % choice,
-                " of `%s`" % choice,
+        children: t.List[t.Tuple[t.List[str], ParserModel]] = []
+        children_ids = set()
+        for name, subparser in current.subcommands:
+            if id(subparser) not in seen:
+                seen.add(id(subparser))
+                children_ids.add(id(subparser))
+                aliases[id(subparser)] = []
+                children.append((path + [name], subparser))
+            elif id(subparser) in children_ids:
+                aliases[id(subparser)].append(name)
+        stack.extend(reversed(children))
+
+
+def select_subcommand(parser: ParserModel, path: t.Sequence[str]) -> t.Tuple[t.List[str], t.List[str], ParserModel]:
+    """
+    Find the subcommand at the given path of names or aliases, visiting only the parsers along the path.
+
+    :return: (command path of primary names, aliases of the subcommand, parser of the subcommand)
+    :raises ValueError: If there is no such subcommand.
+    """
+    command: t.List[str] = []
+    aliases: t.List[str] = []
+    current = parser
+    for name in path:
+        subparser = next((p for n, p in current.subcommands if n == name), None)
+        if subparser is None:
+            available = ", ".join(n for n, _ in current.subcommands) or "none"
+            raise ValueError(
+                f"Unknown subcommand '{name}' in path '{'/'.join(path)}'. Available subcommands: {available}"
             )
+        names = [n for n, p in current.subcommands if p is subparser]
+        command.append(names[0])
+        aliases = names[1:]
+        current = subparser
+    return command, aliases, current
+
+
+def iter_command_tree(
+    parser: ParserModel, options: MarkdownHelpFormatterOptions
+) -> t.Iterator[t.Tuple[t.List[str], t.List[str], ParserModel]]:
+    """
+    Iterate over the parsers selected by the options, as (command path, aliases, parser).
+
+    The first item is the top of the block: the parser itself, with an empty path, or the subcommand selected
+    by options.path. It is followed by its subcommands selected by options.max_depth, include and exclude.
+    Only the selected part of the tree is visited.
+    """
+    path, aliases, parser = select_subcommand(parser, options.path)
+    yield path, aliases, parser
+    yield from _iter_subcommand_tree(parser, options.max_depth, path, options.include, options.exclude)
+
+
+def gen_argparse_help(
+    parser: t.Union[argparse.ArgumentParser, ParserModel], out_readme: t.TextIO, options: MarkdownHelpFormatterOptions
+):
+    if not isinstance(parser, ParserModel):
+        parser = ParserModel.from_parser(parser)
+
+    # The fragments are collected and written out in one call
+    templates = _get_templates(options)
+    out: t.List[str] = []
+    # Arguments inherited from a common parent parser share their models across the subcommands,
+    # so each of them is rendered once. The models are kept alive by the parser model during the call.
+    action_fragments: t.Dict[int, str] = {}
+    for index, (path, aliases, subparser) in enumerate(iter_command_tree(parser, options)):
+        command = " ".join(path)
+        label = "Usage of `%s`" % command if path else "Usage"
+        if aliases:
+            label += " (aliases: %s)" % ", ".join("`%s`" % alias for alias in aliases)
+        usage_template = templates.subcommand_usage if index else templates.usage
+        _generate_parser_md(subparser, out, options, usage_template, templates, action_fragments, label, command)
+    out_readme.write("".join(out))
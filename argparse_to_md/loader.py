@@ -1,13 +1,62 @@
+import contextlib
 import importlib
+import os
 import sys
+import threading
 import typing as t
-from unittest.mock import MagicMock
+
+from .profiling import NULL_PROFILER, Profiler
+from .stubs import stub_imports
+
+
+def _parent_names(module_name: str) -> t.FrozenSet[str]:
+    parts = module_name.split(".")
+    return frozenset(".".join(parts[: i + 1]) for i in range(len(parts)))
+
+
+class LoadError(Exception):
+    """
+    The parser of a block couldn't be loaded, e.g. the module failed to import in a sandbox.
+
+    Raised by the loaders which isolate the module code. The error is reported for the block, and the other blocks
+    are still processed.
+    """
 
 
 class FunctionLoader:
-    def __init__(self, extra_sys_path: t.Optional[t.List[str]] = None):
+    """
+    Imports the modules and loads the parser factory functions from them.
+
+    :param extra_sys_path: Directories to add to sys.path while importing. Missing modules imported from the files
+        in these directories are replaced with stubs.
+    :param memoize: If set, parsers returned by the factories are reused by load_parser.
+    :param stub_modules: Modules (along with their submodules) to replace with stubs even if they are installed,
+        e.g. heavy dependencies which the parser factories don't need.
+    """
+
+    def __init__(
+        self,
+        extra_sys_path: t.Optional[t.List[str]] = None,
+        memoize: bool = True,
+        stub_modules: t.Sequence[str] = (),
+    ):
         self.extra_sys_path = extra_sys_path or []
+        self.stub_modules = list(stub_modules)
+        # Modules which failed to import from other code (e.g. third party packages) and are stubbed from then on
+        self.missing_modules: t.Set[str] = set()
         self.modules_imported: t.Dict[str, t.Any] = {}
+        # If set, parsers returned by the factories are reused by load_parser
+        self.memoize = memoize
+        self.parsers: t.Dict[t.Tuple[str, str, t.Optional[str]], t.Any] = {}
+        # Source files of all modules which were added to sys.modules while loading functions, in load order
+        self.loaded_files: t.List[str] = []
+        # For each imported module, the source files which were loaded up to and including its import
+        self.module_dependencies: t.Dict[str, t.List[str]] = {}
+        # Serializes imports and factory calls when the loader is shared between threads,
+        # since both sys.path and sys.modules are process-wide
+        self.lock = threading.RLock()
+        # Records the time spent importing modules and calling the factories
+        self.profiler: Profiler = NULL_PROFILER
 
     @staticmethod
     def _sys_path_extend(extra_sys_path) -> t.ContextManager[None]:
@@ -23,6 +72,13 @@ class FunctionLoader:
 
         return SysPathContext()
 
+    def prefetch(self, module_name: str, function_name: str, cwd: t.Optional[str] = None) -> None:
+        """
+        Hint that load_function will be called with the same arguments later.
+
+        Loaders which load functions in the background can use this to start loading early.
+        """
+
     def load_function(self, module_name: str, function_name: str, cwd: t.Optional[str] = None) -> t.Any:
         """
         Load a function from a module by name.
@@ -34,38 +90,122 @@ class FunctionLoader:
         extra_sys_path = list(self.extra_sys_path)
         if cwd is not None:
             extra_sys_path = [cwd] + extra_sys_path
-        with self._sys_path_extend(extra_sys_path):
-            last_missing_module_name = None
+        with self.lock, self._sys_path_extend(extra_sys_path):
+            if module_name in self.modules_imported:
+                return getattr(self.modules_imported[module_name], function_name)
+
+            excluded = _parent_names(module_name)
+            # Modules imported by a failed attempt stay loaded and are dependencies as well
+            modules_before = set(sys.modules)
             while True:
                 try:
-                    if module_name in self.modules_imported:
-                        module = self.modules_imported[module_name]
-                        break
-
-                    module = importlib.import_module(module_name)
-                    self.modules_imported[module_name] = module
+                    with self._stub_imports(extra_sys_path, excluded):
+                        with self.profiler.phase("import", module=module_name):
+                            module = importlib.import_module(module_name)
                     break
+                except ModuleNotFoundError as e:
+                    if e.name is None or e.name in excluded:
+                        print(f"Error importing module {module_name}", file=sys.stderr)
+                        raise
+                    if e.name in self.missing_modules:
+                        raise
+                    # Imported by code outside of the project, which got no stub on the first attempt.
+                    # The modules which were imported successfully stay in sys.modules, so retrying is cheap.
+                    self.missing_modules.add(e.name)
 
-                except ImportError as e:
-                    err = str(e)
-
-                    if "No module named" in err:
-                        # find the module name in the error message
-                        missing_module_name = err.split("'")[1]
-                        if missing_module_name == module_name:
-                            print(f"Error importing module {module_name}", file=sys.stderr)
-                            raise e
-                        if missing_module_name == last_missing_module_name:
-                            print(f"Error importing module {missing_module_name} after adding a mock", file=sys.stderr)
-                            raise e
-                        # create a mock module
-                        missing_module = MagicMock()
-                        # try again to import the module
-                        print(f"Note: creating mock module {missing_module_name}", file=sys.stderr)
-                        sys.modules[missing_module_name] = missing_module
-                        continue
-
-                    else:
-                        raise e
-
+            self.modules_imported[module_name] = module
+            self._record_dependencies(module_name, set(sys.modules) - modules_before)
             return getattr(module, function_name)
+
+    @contextlib.contextmanager
+    def _stub_imports(self, project_roots: t.List[str], excluded: t.AbstractSet[str]) -> t.Iterator[None]:
+        with stub_imports(self.stub_modules, self.missing_modules, project_roots, excluded) as finder:
+            try:
+                yield
+            finally:
+                for name in finder.created:
+                    print(f"Note: creating stub module {name}", file=sys.stderr)
+
+    def load_parser(self, module_name: str, function_name: str, cwd: t.Optional[str] = None) -> t.Any:
+        """
+        Load the parser factory function and call it.
+
+        Unless memoize is False, the factory is only called once for each module, function and cwd,
+        later calls return the same parser object.
+        """
+        key = (module_name, function_name, cwd)
+        if key in self.parsers:
+            return self.parsers[key]
+        parser_factory_function = self.load_function(module_name, function_name, cwd)
+        # Factories may not be thread-safe, don't call them concurrently
+        with self.lock:
+            if key in self.parsers:
+                return self.parsers[key]
+            with self.profiler.phase("factory"):
+                parser = parser_factory_function()
+            if self.memoize:
+                self.parsers[key] = parser
+        return parser
+
+    def reload_modules(self, changed_files: t.AbstractSet[str]) -> t.List[str]:
+        """
+        Reload the modules affected by changes in the given source files, keeping all other modules loaded.
+
+        Modules imported by this loader whose source files have changed are reloaded with importlib.reload,
+        then the modules loaded with load_function which may depend on them. Memoized parsers of these modules
+        are dropped, so that load_parser calls the new factories.
+
+        Modules which import names from a changed module ("from x import y") and are not changed themselves
+        keep referring to the old objects, unless they were loaded with load_function.
+
+        :param changed_files: Real paths of the changed source files.
+        :return: Names of the modules loaded with load_function which were affected.
+        """
+        with self.lock, self._sys_path_extend(self.extra_sys_path):
+            changed_loaded_files = {os.path.realpath(path) for path in self.loaded_files} & changed_files
+            changed_modules = []
+            if changed_loaded_files:
+                for name, module in list(sys.modules.items()):
+                    path = getattr(module, "__file__", None)
+                    if isinstance(path, str) and os.path.realpath(path) in changed_loaded_files:
+                        changed_modules.append((name, module))
+            # Modules are added to sys.modules before their own imports run, so reverse order
+            # reloads the imported modules before the modules which import them.
+            with self._stub_imports(self.extra_sys_path, frozenset()):
+                for name, module in reversed(changed_modules):
+                    if name not in self.modules_imported:
+                        importlib.reload(module)
+
+            affected = [
+                name
+                for name, dependencies in self.module_dependencies.items()
+                if any(os.path.realpath(path) in changed_files for path in dependencies)
+            ]
+            for name in affected:
+                if name in self.modules_imported:
+                    modules_before = set(sys.modules)
+                    with self._stub_imports(self.extra_sys_path, _parent_names(name)):
+                        with self.profiler.phase("import", module=name):
+                            self.modules_imported[name] = importlib.reload(self.modules_imported[name])
+                    self._record_dependencies(name, set(sys.modules) - modules_before)
+                for key in [key for key in self.parsers if key[0] == name]:
+                    del self.parsers[key]
+            return affected
+
+    def _record_dependencies(self, module_name: str, new_module_names: t.Set[str]) -> None:
+        # The module itself may have been imported before, include it explicitly
+        for name in [module_name] + sorted(new_module_names):
+            path = getattr(sys.modules.get(name), "__file__", None)
+            if isinstance(path, str) and path not in self.loaded_files:
+                self.loaded_files.append(path)
+        # Modules loaded by earlier calls may be used by this module without being imported again,
+        # so all files loaded so far are considered as dependencies.
+        self.module_dependencies[module_name] = list(self.loaded_files)
+
+    def get_dependencies(self, module_name: str) -> t.List[str]:
+        """
+        Return the source files the given module may depend on.
+
+        The module must have been loaded with load_function before.
+        """
+        return self.module_dependencies.get(module_name, [])
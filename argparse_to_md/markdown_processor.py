@@ -1,18 +1,63 @@
+import codecs
+import contextlib
+import io
+import locale
+import mmap
 import os
 import re
 import typing as t
+from dataclasses import dataclass
 
-from .formatter import MarkdownHelpFormatterOptions, gen_argparse_help
-from .loader import FunctionLoader
+from .cache import RenderCache
+from .formatter import MarkdownHelpFormatterOptions
+from .loader import FunctionLoader, LoadError
+from .renderers import get_renderer, render
+from .snapshots import load_snapshot
+from .templates import load_template
 
+# Match comments like <!--argparse_to_md:test3:get_parser:arg1=val1:arg2=val2-->
+ARGPARSE_DOC_REGEX = re.compile(r"<!--\s*argparse_to_md:(?P<module>[\w.]+):(?P<function>\w+)(?P<args>:.*)?\s*-->")
+ARGPARSE_DOC_END_REGEX = re.compile(r"<!--\s*argparse_to_md_end\s*-->")
 
-def process_markdown(in_markdown: t.TextIO, out_markdown: t.TextIO, loader: FunctionLoader) -> None:
+# Files smaller than this are read into memory instead of being memory-mapped
+MMAP_MIN_SIZE = 1 << 20
+
+# Regions of a buffer outside of the blocks are decoded (and their lines counted) in pieces of at most this many bytes
+_DECODE_CHUNK_SIZE = 1 << 16
+
+# Finds lines which may contain a start or an end marker in a bytes buffer, confirmed by the regexes above
+_MARKER_LINE_BYTES_REGEX = re.compile(rb"^<!--[^\S\n]*argparse_to_md", re.MULTILINE)
+
+
+def process_markdown(
+    in_markdown: t.TextIO,
+    out_markdown: t.TextIO,
+    loader: FunctionLoader,
+    cache: t.Optional[RenderCache] = None,
+) -> None:
     """
     Process the input markdown file, updating the argparse help text in the file.
 
     :param in_markdown: Input markdown file
     :param out_markdown: Output markdown file
-    :param loader: FunctionLoader instance to load the argparse factory function
+    :param loader: FunctionLoader instance to load the argparse factory function.
+        To profile the processing, set loader.profiler to a Profiler instance.
+    :param cache: Optional: RenderCache to reuse the output rendered in previous runs
+    """
+    for chunk in iter_markdown(in_markdown, loader, cache):
+        out_markdown.write(chunk)
+
+
+def iter_markdown(
+    in_markdown: t.TextIO,
+    loader: FunctionLoader,
+    cache: t.Optional[RenderCache] = None,
+) -> t.Iterator[str]:
+    """
+    Generate the processed markdown piece by piece, reading the input lazily.
+
+    Only one line of the input and one rendered block are held in memory at a time.
+    Arguments have the same meaning as for process_markdown.
     """
     # Read the input file, processing each line:
     # - if we are not processing a block of argparse help text, just copy the line to the output
@@ -20,38 +65,303 @@ def process_markdown(in_markdown: t.TextIO, out_markdown: t.TextIO, loader: Func
     # - skip all lines until we encounter argparse_doc_end comment
 
     in_argparse_to_md_block = False
+    cwd = _markdown_cwd(in_markdown)
 
-    # Match comments like <!--argparse_to_md:test3:get_parser:arg1=val1:arg2=val2-->
-    argparse_doc_regex = re.compile(r"<!--\s*argparse_to_md:(?P<module>[\w.]+):(?P<function>\w+)(?P<args>:.*)?\s*-->")
-    argparse_doc_end_regex = re.compile(r"<!--\s*argparse_to_md_end\s*-->")
-
-    # Get the current working directory of the input file, so we can add it to the sys.path
-    cwd = None
-    if hasattr(in_markdown, "name"):
-        cwd = os.path.dirname(in_markdown.name)
-
-    for line in in_markdown.readlines():
+    for line in in_markdown:
         if not in_argparse_to_md_block:
-            out_markdown.write(line)
-            match = argparse_doc_regex.match(line)
+            yield line
+            # Substring check is much cheaper than the regex, and most lines don't contain markers
+            match = ARGPARSE_DOC_REGEX.match(line) if "argparse_to_md" in line else None
             if match:
                 in_argparse_to_md_block = True
                 module = match.group("module")
                 function = match.group("function")
                 args = match.group("args")
-                parser_factory_function = loader.load_function(module, function, cwd)
-                parser = parser_factory_function()
-                gen_argparse_help(parser, out_markdown, args_to_options(args))
+                yield render_block(module, function, args, cwd, loader, cache)
         else:
-            match = argparse_doc_end_regex.match(line)
+            match = ARGPARSE_DOC_END_REGEX.match(line)
             if match:
                 in_argparse_to_md_block = False
-                out_markdown.write(line)
+                yield line
             else:
                 continue
 
 
-def args_to_options(args: str) -> MarkdownHelpFormatterOptions:
+@contextlib.contextmanager
+def map_markdown_file(path: str) -> t.Iterator[t.Union[bytes, mmap.mmap]]:
+    """Context manager giving the contents of the file as a bytes-like buffer, memory-mapped if the file is large."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < MMAP_MIN_SIZE:
+            yield f.read()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+
+def detect_text_format(buffer: t.Union[bytes, mmap.mmap]) -> t.Tuple[str, str]:
+    """
+    Return the encoding and the line ending of a markdown file loaded with map_markdown_file.
+
+    Files starting with the UTF-8 byte order mark are decoded with "utf-8-sig", which keeps the mark when writing,
+    other files with the locale encoding. The line ending is the one of the first line.
+    """
+    encoding = "utf-8-sig" if buffer[: len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else locale.getpreferredencoding(False)
+    first_newline = buffer.find(b"\n")
+    newline = "\r\n" if first_newline > 0 and buffer[first_newline - 1 : first_newline] == b"\r" else "\n"
+    return encoding, newline
+
+
+def scan_markers(buffer: t.Union[bytes, mmap.mmap]) -> t.List[t.Tuple[int, int]]:
+    """
+    Find all the lines which may contain start or end markers, using a single search over the whole buffer.
+
+    Returns a list of (start, end) byte offsets of such lines, including the line ending.
+    An empty list means that the file doesn't need processing.
+    """
+    spans = []
+    for match in _MARKER_LINE_BYTES_REGEX.finditer(buffer):
+        line_end = buffer.find(b"\n", match.end())
+        line_end = len(buffer) if line_end < 0 else line_end + 1
+        spans.append((match.start(), line_end))
+    return spans
+
+
+@dataclass
+class RenderedBlock:
+    """A block regenerated by iter_markdown_buffer, along with its previous contents."""
+
+    # The start marker line, without the line ending
+    marker: str
+    # Line numbers (1-based) of the start and the end markers in the original file.
+    # If the end marker is missing, end_line is the last line of the file.
+    start_line: int
+    end_line: int
+    old: str
+    new: str
+
+
+def iter_markdown_buffer(
+    buffer: t.Union[bytes, mmap.mmap],
+    marker_spans: t.List[t.Tuple[int, int]],
+    encoding: str,
+    cwd: t.Optional[str],
+    loader: FunctionLoader,
+    cache: t.Optional[RenderCache] = None,
+    changed_files: t.Optional[t.AbstractSet[str]] = None,
+    on_block: t.Optional[t.Callable[[RenderedBlock], None]] = None,
+    on_error: t.Optional[t.Callable[[str, int, LoadError], None]] = None,
+) -> t.Iterator[str]:
+    """
+    Same as iter_markdown, but for a file already loaded into a buffer (e.g. mmap) and indexed with scan_markers.
+
+    Regions of the file outside of the blocks are decoded and returned in pieces of bounded size, without splitting
+    into lines, so that memory usage doesn't depend on the size of the file.
+    Line endings are normalized to "\\n", like when reading a file in text mode.
+
+    If changed_files (a set of real paths) is given, only the blocks which may depend on these files are regenerated,
+    according to the dependency index of the cache. Other blocks keep their current contents.
+
+    If on_block is given, it is called with each regenerated block once its end marker is reached.
+
+    If on_error is given, blocks whose parser can't be loaded (LoadError) keep their current contents, and on_error
+    is called with the start marker, its line number and the error. Otherwise, the error is raised.
+    """
+
+    def decode(start: int, end: int) -> str:
+        return "".join(_iter_decoded(buffer, start, end, encoding))
+
+    # Lines are only counted when the blocks are reported, counting resumes from the last counted offset
+    counted_offset = 0
+    counted_lines = 1
+
+    def line_number(offset: int) -> int:
+        nonlocal counted_offset, counted_lines
+        for piece_start in range(counted_offset, offset, _DECODE_CHUNK_SIZE):
+            counted_lines += buffer[piece_start : min(piece_start + _DECODE_CHUNK_SIZE, offset)].count(b"\n")
+        counted_offset = offset
+        return counted_lines
+
+    pos = 0
+    in_argparse_to_md_block = False
+    keep_block = False
+    block: t.Optional[RenderedBlock] = None
+    for line_start, line_end in marker_spans:
+        line = decode(line_start, line_end)
+        if not in_argparse_to_md_block:
+            match = ARGPARSE_DOC_REGEX.match(line)
+            if match:
+                in_argparse_to_md_block = True
+                yield from _iter_decoded(buffer, pos, line_end, encoding)
+                pos = line_end
+                module = match.group("module")
+                function = match.group("function")
+                args = match.group("args")
+                if changed_files is not None and not _block_affected(
+                    _cache_key(module, function, args, cwd, loader), cache, changed_files
+                ):
+                    keep_block = True
+                    continue
+                try:
+                    output = render_block(module, function, args, cwd, loader, cache)
+                except LoadError as e:
+                    if on_error is None:
+                        raise
+                    on_error(line.rstrip("\n"), line_number(line_start), e)
+                    keep_block = True
+                    continue
+                if on_block is not None:
+                    block = RenderedBlock(line.rstrip("\n"), line_number(line_start), 0, "", output)
+                yield output
+        elif ARGPARSE_DOC_END_REGEX.match(line):
+            in_argparse_to_md_block = False
+            if not keep_block:
+                if block is not None and on_block is not None:
+                    block.end_line = line_number(line_start)
+                    block.old = decode(pos, line_start)
+                    on_block(block)
+                    block = None
+                # Drop the old contents of the block
+                pos = line_start
+            keep_block = False
+
+    if not in_argparse_to_md_block:
+        yield from _iter_decoded(buffer, pos, len(buffer), encoding)
+    elif block is not None and on_block is not None:
+        # The rest of the file is dropped, since the end marker is missing
+        block.end_line = line_number(len(buffer)) - (1 if buffer[-1:] == b"\n" else 0)
+        block.old = decode(pos, len(buffer))
+        on_block(block)
+
+
+def _iter_decoded(buffer: t.Union[bytes, mmap.mmap], start: int, end: int, encoding: str) -> t.Iterator[str]:
+    """Decode buffer[start:end] piece by piece, normalizing the line endings to "\n"."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    held_back = ""
+    for offset in range(start, end, _DECODE_CHUNK_SIZE):
+        text = held_back + decoder.decode(buffer[offset : min(offset + _DECODE_CHUNK_SIZE, end)])
+        # A "\r" at the end of the piece may be the first half of a "\r\n" pair
+        held_back = "\r" if text.endswith("\r") else ""
+        text = _normalize_newlines(text[: len(text) - len(held_back)])
+        if text:
+            yield text
+    text = _normalize_newlines(held_back + decoder.decode(b"", final=True))
+    if text:
+        yield text
+
+
+def _normalize_newlines(text: str) -> str:
+    if "\r" not in text:
+        return text
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def prefetch_markdown(
+    in_markdown: t.TextIO,
+    loader: FunctionLoader,
+    cache: t.Optional[RenderCache] = None,
+    changed_files: t.Optional[t.AbstractSet[str]] = None,
+) -> None:
+    """
+    Let the loader know which functions process_markdown is going to load for this file.
+
+    Blocks which can be served from the cache, or which are not affected by changed_files, are skipped.
+    The file is read until the end; seek back before passing it to process_markdown.
+    """
+    cwd = _markdown_cwd(in_markdown)
+    for line in in_markdown:
+        match = ARGPARSE_DOC_REGEX.match(line) if "argparse_to_md" in line else None
+        if not match:
+            continue
+        module = match.group("module")
+        function = match.group("function")
+        if args_to_options(match.group("args"), cwd).model:
+            # Rendered from the snapshot, without loading the parser
+            continue
+        if cache is not None:
+            key = _cache_key(module, function, match.group("args"), cwd, loader)
+            if changed_files is not None and not _block_affected(key, cache, changed_files):
+                continue
+            if cache.get(key) is not None:
+                continue
+        loader.prefetch(module, function, cwd)
+
+
+def _markdown_cwd(in_markdown: t.TextIO) -> t.Optional[str]:
+    # Get the current working directory of the input file, so we can add it to the sys.path
+    if hasattr(in_markdown, "name"):
+        return os.path.dirname(in_markdown.name)
+    return None
+
+
+def _cache_key(module: str, function: str, args: t.Optional[str], cwd: t.Optional[str], loader: FunctionLoader) -> str:
+    search_path = ([cwd] if cwd is not None else []) + loader.extra_sys_path
+    return RenderCache.make_key(module, function, args, search_path, loader.stub_modules)
+
+
+def _block_affected(key: str, cache: t.Optional[RenderCache], changed_files: t.AbstractSet[str]) -> bool:
+    # Blocks which are not in the dependency index are always regenerated
+    dependencies = cache.get_dependencies(key) if cache is not None else None
+    if dependencies is None:
+        return True
+    return any(path in changed_files for path in dependencies)
+
+
+def render_block(
+    module: str,
+    function: str,
+    args: t.Optional[str],
+    cwd: t.Optional[str],
+    loader: FunctionLoader,
+    cache: t.Optional[RenderCache],
+) -> str:
+    """
+    Render the help of the parser returned by module.function, with the options given in the marker syntax
+    (e.g. ":subheading_level=2:format=rst"). The output is taken from the cache if possible, and stored there.
+    """
+    profiler = loader.profiler
+    with profiler.phase("block", block="%s:%s%s" % (module, function, args or "")):
+        options = args_to_options(args, cwd)
+        cache_key = None
+        if cache is not None:
+            cache_key = _cache_key(module, function, args, cwd, loader)
+            with profiler.phase("cache"):
+                cached_output = cache.get(cache_key)
+            if cached_output is not None:
+                return cached_output
+
+        with profiler.phase("load"):
+            if options.model:
+                parser = load_snapshot(options.model)
+                dependencies = [options.model]
+            else:
+                parser = loader.load_parser(module, function, cwd)
+                dependencies = list(loader.get_dependencies(module))
+        with profiler.phase("render"):
+            out = io.StringIO()
+            try:
+                render(parser, out, options, loader.memoize)
+            except ValueError as e:
+                # The subcommand path can only be checked once the parser is loaded, report it for the block
+                raise LoadError(str(e)) from None
+            output = out.getvalue()
+
+        if cache is not None and cache_key is not None:
+            with profiler.phase("cache"):
+                cache.put(cache_key, output, dependencies + _template_files(options))
+        return output
+
+
+def _template_files(options: MarkdownHelpFormatterOptions) -> t.List[str]:
+    return [path for path in (options.usage_template, options.group_template, options.action_template) if path]
+
+
+def args_to_options(args: t.Optional[str], cwd: t.Optional[str] = None) -> MarkdownHelpFormatterOptions:
+    """
+    Parse the options given in the marker (e.g. "subheading_level=2:pad_lists=1").
+
+    Paths of the template files and of the model snapshot are relative to cwd (the directory of the markdown file),
+    or to the current working directory. The templates are loaded and checked here, so that errors are reported early.
+    """
     if not args:
         return MarkdownHelpFormatterOptions()
 
@@ -73,7 +383,52 @@ def args_to_options(args: str) -> MarkdownHelpFormatterOptions:
         pad_lists = bool(int(args_dict["pad_lists"]))
         del args_dict["pad_lists"]
 
+    max_depth = None
+    if "max_depth" in args_dict:
+        max_depth = int(args_dict["max_depth"])
+        del args_dict["max_depth"]
+
+    output_format = "markdown"
+    if "format" in args_dict:
+        output_format = args_dict["format"]
+        # Raises ValueError for unknown formats
+        get_renderer(output_format)
+        del args_dict["format"]
+
+    # Subcommand path, e.g. "db/migrate", and comma separated glob patterns of the paths below it
+    command_path = tuple(name.strip() for name in args_dict.pop("path", "").split("/") if name.strip())
+    include = tuple(pattern.strip() for pattern in args_dict.pop("include", "").split(",") if pattern.strip())
+    exclude = tuple(pattern.strip() for pattern in args_dict.pop("exclude", "").split(",") if pattern.strip())
+
+    model = args_dict.pop("model", None)
+    if model is not None:
+        model = os.path.join(cwd or "", model)
+
+    templates = {}
+    for kind in ("usage", "group", "action"):
+        path = args_dict.pop(f"{kind}_template", None)
+        if path is None:
+            continue
+        if output_format != "markdown":
+            raise ValueError(f"{kind}_template is only supported with format=markdown")
+        path = os.path.join(cwd or "", path)
+        try:
+            load_template(path, kind)
+        except OSError as e:
+            raise ValueError(f"Can't read {kind} template {path}: {e.strerror}") from None
+        templates[f"{kind}_template"] = path
+
     if args_dict:
         raise ValueError(f"Unknown arguments: {args_dict}")
 
-    return MarkdownHelpFormatterOptions(subheading_level=subheading_level, pad_lists=pad_lists)
+    return MarkdownHelpFormatterOptions(
+        subheading_level=subheading_level,
+        pad_lists=pad_lists,
+        max_depth=max_depth,
+        format=output_format,
+        model=model,
+        path=command_path,
+        include=include,
+        exclude=exclude,
+        **templates,
+    )
@@ -0,0 +1,560 @@
+import argparse
+import functools
+import json
+import threading
+import typing as t
+import weakref
+
+# Compact, immutable description of an ArgumentParser, containing everything needed to generate help text.
+#
+# The model of each parser is extracted in one pass, the models of the subparsers when they are first used.
+# Metavars and usage fragments are computed during the extraction, so rendering doesn't need to look into argparse
+# internals. The model can be converted to and from
+# a JSON-compatible dict, to be stored in a cache or passed between processes.
+
+# Version of the dict/JSON representation, incremented on incompatible changes
+MODEL_FORMAT_VERSION = 2
+
+
+def _get_metavar(action: argparse.Action) -> t.Union[str, tuple]:
+    if action.metavar is not None:
+        return action.metavar
+    if action.choices is not None:
+        return "{" + ",".join(str(c) for c in action.choices) + "}"
+    if action.option_strings:
+        return action.dest.upper()
+    return action.dest
+
+
+def _format_args(action: argparse.Action, metavar: t.Union[str, tuple]) -> str:
+    if isinstance(metavar, tuple):
+        if action.nargs is None:
+            return str(metavar[0])
+        elif action.nargs == argparse.OPTIONAL:
+            return "[%s]" % metavar[0]
+        elif action.nargs == argparse.ZERO_OR_MORE:
+            if len(metavar) == 2:
+                return "[%s [%s ...]]" % metavar
+            return "[%s ...]" % metavar[0]
+        elif action.nargs == argparse.ONE_OR_MORE:
+            if len(metavar) == 2:
+                return "%s [%s ...]" % metavar
+            return "%s [%s ...]" % (metavar[0], metavar[0])
+        elif isinstance(action.nargs, int):
+            return " ".join(metavar[i] if i < len(metavar) else metavar[-1] for i in range(action.nargs))
+        return " ".join(str(m) for m in metavar)
+
+    if action.nargs is None:
+        return metavar
+    elif action.nargs == argparse.OPTIONAL:
+        return "[%s]" % metavar
+    elif action.nargs == argparse.ZERO_OR_MORE:
+        return "[%s ...]" % metavar
+    elif action.nargs == argparse.ONE_OR_MORE:
+        return "%s [%s ...]" % (metavar, metavar)
+    elif action.nargs == argparse.REMAINDER:
+        return "..."
+    elif action.nargs == argparse.PARSER:
+        return "%s ..." % metavar
+    elif action.nargs == argparse.SUPPRESS:
+        return ""
+    else:
+        return " ".join([metavar] * int(action.nargs))
+
+
+def _is_extend_action(action: argparse.Action) -> bool:
+    extend_cls = getattr(argparse, "_ExtendAction", None)
+    return extend_cls is not None and isinstance(action, extend_cls)
+
+
+def _format_usage_part(action: argparse.Action) -> t.Optional[str]:
+    if action.help is argparse.SUPPRESS:
+        return None
+
+    metavar = _get_metavar(action)
+
+    if not action.option_strings:
+        return _format_args(action, metavar)
+    else:
+        if action.nargs == 0:
+            part = action.option_strings[0]
+        elif _is_extend_action(action) and action.nargs == argparse.ONE_OR_MORE:
+            opt = action.option_strings[0]
+            part = "%s %s [%s %s ...]" % (opt, metavar, opt, metavar)
+        else:
+            args_str = _format_args(action, metavar)
+            part = "%s %s" % (action.option_strings[0], args_str)
+
+        if not action.required:
+            part = "[%s]" % part
+        return part
+
+
+def _format_mutex_group_part(
+    group: t.Any, usage_part: t.Callable[[argparse.Action], t.Optional[str]]
+) -> t.Optional[str]:
+    group_parts = []
+    for group_action in group._group_actions:  # pylint: disable=protected-access
+        part = usage_part(group_action)
+        if part is not None:
+            # Strip outer [] since the group provides its own brackets
+            if part.startswith("[") and part.endswith("]"):
+                part = part[1:-1]
+            group_parts.append(part)
+    if not group_parts:
+        return None
+    sep = " | ".join(group_parts)
+    return "(%s)" % sep if group.required else "[%s]" % sep
+
+
+def _build_usage_parts(
+    actions: list,
+    mutex_groups: list,
+    usage_part: t.Callable[[argparse.Action], t.Optional[str]] = _format_usage_part,
+    mutex_group_part: t.Optional[t.Callable[[t.Any], t.Optional[str]]] = None,
+) -> t.List[str]:
+    """
+    Return the fragments of the usage line for the actions, with the mutex groups in place of their first action.
+
+    usage_part and mutex_group_part return the fragment of one action or one group; they can be replaced with
+    memoized versions, when the same actions appear in many parsers.
+    """
+    if mutex_group_part is None:
+        mutex_group_part = functools.partial(_format_mutex_group_part, usage_part=usage_part)
+
+    # Map each action to its mutex group (if any)
+    action_to_group: t.Dict[int, t.Any] = {}
+    for group in mutex_groups:
+        for action in group._group_actions:  # pylint: disable=protected-access
+            action_to_group[id(action)] = group
+
+    parts: t.List[str] = []
+    seen_groups: t.Set[int] = set()
+
+    for action in actions:
+        group = action_to_group.get(id(action))
+
+        if group is not None and id(group) not in seen_groups:
+            seen_groups.add(id(group))
+            part = mutex_group_part(group)
+            if part is not None:
+                parts.append(part)
+        elif group is None:
+            part = usage_part(action)
+            if part is not None:
+                parts.append(part)
+
+    return parts
+
+
+def _action_invocations(action: argparse.Action) -> t.List[str]:
+    # Plain-text invocations of the action, one per option string, as shown in the list of arguments
+    metavar = _get_metavar(action)
+    if not action.option_strings:
+        return [_format_args(action, metavar) if isinstance(metavar, tuple) else str(metavar)]
+    if action.nargs == 0:
+        return list(action.option_strings)
+    if _is_extend_action(action) and action.nargs == argparse.ONE_OR_MORE:
+        return ["%s %s [%s %s ...]" % (opt, metavar, opt, metavar) for opt in action.option_strings]
+    args_str = _format_args(action, metavar)
+    return ["%s %s" % (opt, args_str) for opt in action.option_strings]
+
+
+class _FrozenModel:
+    __slots__: t.Tuple[str, ...] = ()
+    # Fields of the model, the same as __slots__ unless the model has private slots
+    _fields: t.Tuple[str, ...] = ()
+
+    def __init__(self, **kwargs: t.Any):
+        for name in self._fields:
+            object.__setattr__(self, name, kwargs[name])
+
+    def __setattr__(self, name: str, value: t.Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self._fields)
+
+    def __repr__(self) -> str:
+        fields = ", ".join("%s=%r" % (name, getattr(self, name)) for name in self._fields)
+        return "%s(%s)" % (type(self).__name__, fields)
+
+
+class ActionModel(_FrozenModel):
+    """
+    Argument of a parser.
+
+    metavar is the resolved metavar, usage_part is the fragment of the usage line for this argument
+    (None if the argument is suppressed), invocations are the ways to specify the argument, one per option string.
+    For subparsers actions, subcommands lists the (name, parser) pairs; aliases refer to the same ParserModel.
+    """
+
+    __slots__ = _fields = (
+        "option_strings",
+        "dest",
+        "nargs",
+        "choices",
+        "help",
+        "required",
+        "kind",
+        "metavar",
+        "usage_part",
+        "invocations",
+        "subcommands",
+    )
+
+    option_strings: t.Tuple[str, ...]
+    dest: str
+    nargs: t.Union[None, int, str]
+    choices: t.Optional[t.Tuple[str, ...]]
+    help: t.Optional[str]
+    required: bool
+    kind: str
+    metavar: t.Union[str, t.Tuple[str, ...]]
+    usage_part: t.Optional[str]
+    invocations: t.Tuple[str, ...]
+    subcommands: t.Optional[t.Tuple[t.Tuple[str, "ParserModel"], ...]]
+
+    @classmethod
+    def from_action(cls, action: argparse.Action) -> "ActionModel":
+        return _Extractor().action(action)
+
+
+class GroupModel(_FrozenModel):
+    """Argument group, as shown in the help text."""
+
+    __slots__ = _fields = ("title", "description", "actions")
+
+    title: t.Optional[str]
+    description: t.Optional[str]
+    actions: t.Tuple[ActionModel, ...]
+
+
+class MutexGroupModel(_FrozenModel):
+    """Mutually exclusive group of arguments."""
+
+    __slots__ = _fields = ("required", "actions")
+
+    required: bool
+    actions: t.Tuple[ActionModel, ...]
+
+
+class ParserModel(_FrozenModel):
+    """
+    Parser or subparser.
+
+    usage is the custom usage string (None if the usage should be generated), usage_parts are the fragments
+    of the generated usage line, in order.
+
+    Models of subparsers extracted by from_parser are filled in when one of their fields is first accessed, so that
+    only the subcommands which are rendered are extracted. Their identity can be used before that, e.g. to find
+    the aliases of a subcommand.
+    """
+
+    _fields = ("prog", "usage", "description", "usage_parts", "actions", "groups", "mutex_groups")
+    # (argparse parser, _Extractor) while the fields are not filled in yet, None afterwards
+    __slots__ = _fields + ("_pending",)
+
+    prog: str
+    usage: t.Optional[str]
+    description: t.Optional[str]
+    usage_parts: t.Tuple[str, ...]
+    actions: t.Tuple[ActionModel, ...]
+    groups: t.Tuple[GroupModel, ...]
+    mutex_groups: t.Tuple[MutexGroupModel, ...]
+
+    def __init__(self, **kwargs: t.Any):
+        super().__init__(**kwargs)
+        object.__setattr__(self, "_pending", None)
+
+    @classmethod
+    def _lazy(cls, parser: argparse.ArgumentParser, extractor: "_Extractor") -> "ParserModel":
+        model = cls.__new__(cls)
+        object.__setattr__(model, "_pending", (parser, extractor))
+        return model
+
+    def __getattr__(self, name: str) -> t.Any:
+        # Only called for the slots which are not set, i.e. the fields of a model which is not filled in yet
+        pending = object.__getattribute__(self, "_pending")
+        if pending is None or name not in self._fields:
+            raise AttributeError(name)
+        parser, extractor = pending
+        extractor.fill(self, parser)
+        return object.__getattribute__(self, name)
+
+    @property
+    def subcommands(self) -> t.Iterator[t.Tuple[str, "ParserModel"]]:
+        """Iterate over (name, parser) pairs of all subcommands, including aliases."""
+        for action in self.actions:
+            if action.subcommands is not None:
+                yield from action.subcommands
+
+    @classmethod
+    def from_parser(cls, parser: argparse.ArgumentParser) -> "ParserModel":
+        """Extract the model from an ArgumentParser. Subparsers are extracted when their models are first used."""
+        extractor = _Extractor()
+        # The top level model is filled in right away and isn't registered, so the extractor doesn't refer to it
+        model = cls(**extractor._parser_fields(parser))  # pylint: disable=protected-access
+        extractor.release_if_done()
+        return model
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        """
+        Convert the model into a JSON-compatible dict.
+
+        Parsers and actions are stored in flat lists, so that a subparser registered under several names, or an
+        action shared by several parsers, is only stored once.
+        """
+        return _Serializer().serialize(self)
+
+    @classmethod
+    def from_dict(cls, data: t.Dict[str, t.Any]) -> "ParserModel":
+        if data.get("version") != MODEL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported parser model version: {data.get('version')}")
+        return _Deserializer(data["parsers"], data["actions"]).parser(0)
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text: str) -> "ParserModel":
+        return cls.from_dict(json.loads(text))
+
+
+class _Extractor:
+    def __init__(self) -> None:
+        # Subparsers registered under several names are only extracted once
+        self.parsers: t.Dict[int, t.Tuple["weakref.ref[argparse.ArgumentParser]", ParserModel]] = {}
+        # Actions inherited from parent parsers (parents=[...]) are the same objects in each child parser,
+        # so they are extracted once and the subparsers share their models.
+        # The argparse objects are only referenced weakly: actions refer to their parser (action.container), and
+        # the models of the subparsers which are not filled in yet would otherwise keep the top level parser alive.
+        # An entry is only used if its object is still alive, so reused ids don't return stale models.
+        self.actions: t.Dict[int, t.Tuple["weakref.ref[argparse.Action]", ActionModel]] = {}
+        # Children get copies of the parents' mutex groups, containing the same actions.
+        # Keyed by the ids of the action models, which are kept in the values so that the ids stay unique.
+        self.mutex_group_parts: t.Dict[
+            t.Tuple[bool, t.Tuple[int, ...]], t.Tuple[t.Tuple[ActionModel, ...], t.Optional[str]]
+        ] = {}
+        # Number of subparser models which are not filled in yet. The tables are cleared when it drops to zero.
+        self.pending = 0
+        # Subparsers may be filled in by the threads rendering the model at the same time
+        self.lock = threading.Lock()
+
+    def release_if_done(self) -> None:
+        """Drop the tables once no model needs them anymore."""
+        if self.pending == 0:
+            self.parsers.clear()
+            self.actions.clear()
+            self.mutex_group_parts.clear()
+
+    def _usage_part(self, action: argparse.Action) -> t.Optional[str]:
+        return self.action(action).usage_part
+
+    def _mutex_group_part(self, group: t.Any) -> t.Optional[str]:
+        models = tuple(self.action(a) for a in group._group_actions)  # pylint: disable=protected-access
+        key = (group.required, tuple(id(m) for m in models))
+        if key not in self.mutex_group_parts:
+            self.mutex_group_parts[key] = (models, _format_mutex_group_part(group, self._usage_part))
+        return self.mutex_group_parts[key][1]
+
+    def parser(self, parser: argparse.ArgumentParser) -> ParserModel:
+        """Return the model of the parser, to be filled in when it is used."""
+        entry = self.parsers.get(id(parser))
+        if entry is not None and entry[0]() is parser:
+            return entry[1]
+        model = ParserModel._lazy(parser, self)  # pylint: disable=protected-access
+        self.parsers[id(parser)] = (weakref.ref(parser), model)
+        self.pending += 1
+        return model
+
+    def fill(self, model: ParserModel, parser: argparse.ArgumentParser) -> None:
+        """Extract the fields of the model from the parser, unless it was already done."""
+        with self.lock:
+            if object.__getattribute__(model, "_pending") is None:
+                return
+            for name, value in self._parser_fields(parser).items():
+                object.__setattr__(model, name, value)
+            object.__setattr__(model, "_pending", None)
+            self.pending -= 1
+            self.release_if_done()
+
+    def _parser_fields(self, parser: argparse.ArgumentParser) -> t.Dict[str, t.Any]:
+        argparse_actions = parser._actions  # pylint: disable=protected-access
+        argparse_mutex_groups = parser._mutually_exclusive_groups  # pylint: disable=protected-access
+        actions = {id(a): self.action(a) for a in argparse_actions}
+
+        optionals = [a for a in argparse_actions if a.option_strings]
+        positionals = [a for a in argparse_actions if not a.option_strings]
+
+        return dict(
+            prog=parser.prog,
+            usage=parser.usage,
+            description=parser.description,
+            usage_parts=tuple(
+                _build_usage_parts(
+                    optionals + positionals, argparse_mutex_groups, self._usage_part, self._mutex_group_part
+                )
+            ),
+            actions=tuple(actions.values()),
+            groups=tuple(
+                GroupModel(
+                    title=g.title,
+                    description=g.description,
+                    actions=tuple(actions[id(a)] for a in g._group_actions),  # pylint: disable=protected-access
+                )
+                for g in parser._action_groups  # pylint: disable=protected-access
+            ),
+            mutex_groups=tuple(
+                MutexGroupModel(
+                    required=g.required,
+                    actions=tuple(actions[id(a)] for a in g._group_actions),  # pylint: disable=protected-access
+                )
+                for g in argparse_mutex_groups
+            ),
+        )
+
+    def action(self, action: argparse.Action) -> ActionModel:
+        entry = self.actions.get(id(action))
+        if entry is None or entry[0]() is not action:
+            entry = (weakref.ref(action), self._extract_action(action))
+            self.actions[id(action)] = entry
+        return entry[1]
+
+    def _extract_action(self, action: argparse.Action) -> ActionModel:
+        subcommands = None
+        choices = None
+        kind = "store"
+        if isinstance(action, argparse._SubParsersAction):  # pylint: disable=protected-access
+            kind = "subparsers"
+            subcommands = tuple((name, self.parser(subparser)) for name, subparser in action.choices.items())
+            choices = tuple(name for name, _ in subcommands)
+        else:
+            if _is_extend_action(action):
+                kind = "extend"
+            if action.choices is not None:
+                choices = tuple(str(c) for c in action.choices)
+
+        metavar = _get_metavar(action)
+        return ActionModel(
+            option_strings=tuple(action.option_strings),
+            dest=action.dest,
+            nargs=action.nargs,
+            choices=choices,
+            help=action.help,
+            required=action.required,
+            kind=kind,
+            metavar=tuple(metavar) if isinstance(metavar, (tuple, list)) else metavar,
+            usage_part=_format_usage_part(action),
+            invocations=tuple(_action_invocations(action)),
+            subcommands=subcommands,
+        )
+
+
+class _Serializer:
+    def __init__(self) -> None:
+        self.parser_index: t.Dict[int, int] = {}
+        self.parsers: t.List[t.Any] = []
+        self.action_index: t.Dict[int, int] = {}
+        self.actions: t.List[t.Any] = []
+
+    def serialize(self, model: ParserModel) -> t.Dict[str, t.Any]:
+        self.parser(model)
+        return {"version": MODEL_FORMAT_VERSION, "parsers": self.parsers, "actions": self.actions}
+
+    def parser(self, model: ParserModel) -> int:
+        if id(model) in self.parser_index:
+            return self.parser_index[id(model)]
+        # Reserve the index first, nested subparsers are appended after this one
+        index = len(self.parsers)
+        self.parser_index[id(model)] = index
+        self.parsers.append(None)
+
+        positions = {id(a): i for i, a in enumerate(model.actions)}
+        self.parsers[index] = {
+            "prog": model.prog,
+            "usage": model.usage,
+            "description": model.description,
+            "usage_parts": list(model.usage_parts),
+            "actions": [self.action_ref(a) for a in model.actions],
+            "groups": [[g.title, g.description, [positions[id(a)] for a in g.actions]] for g in model.groups],
+            "mutex_groups": [[g.required, [positions[id(a)] for a in g.actions]] for g in model.mutex_groups],
+        }
+        return index
+
+    def action_ref(self, action: ActionModel) -> int:
+        if id(action) in self.action_index:
+            return self.action_index[id(action)]
+        index = len(self.actions)
+        self.action_index[id(action)] = index
+        self.actions.append(None)
+        self.actions[index] = self.action(action)
+        return index
+
+    def action(self, action: ActionModel) -> t.Dict[str, t.Any]:
+        result = {name: getattr(action, name) for name in ActionModel._fields if name != "subcommands"}
+        for name in ("option_strings", "choices", "invocations", "metavar"):
+            # A tuple metavar is stored as a list, a string metavar as is
+            if isinstance(result[name], tuple):
+                result[name] = list(result[name])
+        if action.subcommands is not None:
+            result["subcommands"] = [[name, self.parser(parser)] for name, parser in action.subcommands]
+        return result
+
+
+class _Deserializer:
+    def __init__(self, parsers: t.List[t.Dict[str, t.Any]], actions: t.List[t.Dict[str, t.Any]]):
+        self.data = parsers
+        self.actions_data = actions
+        self.parsers: t.Dict[int, ParserModel] = {}
+        self.actions: t.Dict[int, ActionModel] = {}
+
+    def parser(self, index: int) -> ParserModel:
+        if index in self.parsers:
+            return self.parsers[index]
+        d = self.data[index]
+        actions = tuple(self.action_ref(i) for i in d["actions"])
+        model = ParserModel(
+            prog=d["prog"],
+            usage=d["usage"],
+            description=d["description"],
+            usage_parts=tuple(d["usage_parts"]),
+            actions=actions,
+            groups=tuple(
+                GroupModel(title=title, description=description, actions=tuple(actions[i] for i in indices))
+                for title, description, indices in d["groups"]
+            ),
+            mutex_groups=tuple(
+                MutexGroupModel(required=required, actions=tuple(actions[i] for i in indices))
+                for required, indices in d["mutex_groups"]
+            ),
+        )
+        self.parsers[index] = model
+        return model
+
+    def action_ref(self, index: int) -> ActionModel:
+        if index not in self.actions:
+            self.actions[index] = self.action(self.actions_data[index])
+        return self.actions[index]
+
+    def action(self, d: t.Dict[str, t.Any]) -> ActionModel:
+        subcommands = None
+        if d.get("subcommands") is not None:
+            subcommands = tuple((name, self.parser(index)) for name, index in d["subcommands"])
+        # argparse.SUPPRESS is compared by identity, which doesn't survive serialization
+        help_text = argparse.SUPPRESS if d["help"] == argparse.SUPPRESS else d["help"]
+        return ActionModel(
+            option_strings=tuple(d["option_strings"]),
+            dest=d["dest"],
+            nargs=d["nargs"],
+            choices=tuple(d["choices"]) if d["choices"] is not None else None,
+            help=help_text,
+            required=d["required"],
+            kind=d["kind"],
+            metavar=tuple(d["metavar"]) if isinstance(d["metavar"], list) else d["metavar"],
+            usage_part=d["usage_part"],
+            invocations=tuple(d["invocations"]),
+            subcommands=subcommands,
+        )
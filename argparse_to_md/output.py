@@ -0,0 +1,107 @@
+import contextlib
+import os
+import shutil
+import stat
+import tempfile
+import typing as t
+
+# Output is kept in memory up to this size, larger outputs are spooled to a temporary file
+SPOOL_MAX_SIZE = 1 << 20
+
+_COPY_CHUNK_SIZE = 1 << 16
+
+
+class ChangeDetectingWriter:
+    """
+    Text stream which compares the written text against the original file as it is written.
+
+    As long as the output matches the original, nothing is stored. Once the output differs, the matching prefix
+    is copied from the original and the rest of the output is spooled into a temporary file. This keeps memory
+    usage bounded regardless of the file size, and unchanged files cost nothing but reading them.
+    """
+
+    def __init__(self, original: t.TextIO, spool_max_size: int = SPOOL_MAX_SIZE):
+        self.original = original
+        self.spool_max_size = spool_max_size
+        self.spool: t.Optional[t.IO[str]] = None
+        self.matched_chars = 0
+
+    def write(self, s: str) -> int:
+        if self.spool is not None:
+            return self.spool.write(s)
+        original_part = self.original.read(len(s))
+        if original_part == s:
+            self.matched_chars += len(s)
+            return len(s)
+        self._start_spooling()
+        assert self.spool is not None
+        return self.spool.write(s)
+
+    def _start_spooling(self) -> None:
+        self.spool = tempfile.SpooledTemporaryFile(max_size=self.spool_max_size, mode="w+", encoding="utf-8")
+        self.original.seek(0)
+        remaining = self.matched_chars
+        while remaining:
+            chunk = self.original.read(min(remaining, _COPY_CHUNK_SIZE))
+            if not chunk:
+                break
+            self.spool.write(chunk)
+            remaining -= len(chunk)
+
+    def finish(self) -> bool:
+        """Return True if the output differs from the original file."""
+        if self.spool is None and self.original.read(1):
+            # Output is a prefix of the original file
+            self._start_spooling()
+        return self.spool is not None
+
+    def copy_to(self, out: t.TextIO) -> None:
+        """Write the complete output to the given stream. Only valid if finish() returned True."""
+        assert self.spool is not None
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, out, _COPY_CHUNK_SIZE)
+
+    def getvalue(self) -> str:
+        """Return the complete output as a string. Only valid if finish() returned True."""
+        assert self.spool is not None
+        self.spool.seek(0)
+        return self.spool.read()
+
+    def close(self) -> None:
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+
+@contextlib.contextmanager
+def write_atomically(path: str, encoding: str, newline: str) -> t.Iterator[t.TextIO]:
+    """
+    Context manager giving a text stream which replaces the file at the given path once the block completes.
+
+    The output is written to a temporary file in the same directory, which is then renamed over the original file
+    with os.replace, so the file is never left partially written. If the block raises, the file is not modified.
+    Permissions of the original file are kept; if the path is a symlink, the file it points to is replaced.
+    The file is created if it doesn't exist.
+    """
+    path = os.path.realpath(path)
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with open(fd, "w", encoding=encoding, newline=newline) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            # New file, use the permissions open() would have created it with
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        with contextlib.suppress(OSError):
+            os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
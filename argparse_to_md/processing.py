@@ -0,0 +1,548 @@
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import re
+import sys
+import time
+import traceback
+import typing as t
+from dataclasses import dataclass, field
+
+from .cache import RenderCache
+from .discovery import find_input_files
+from .loader import FunctionLoader, LoadError
+from .markdown_processor import (
+    ARGPARSE_DOC_REGEX,
+    RenderedBlock,
+    args_to_options,
+    detect_text_format,
+    iter_markdown_buffer,
+    map_markdown_file,
+    prefetch_markdown,
+    render_block,
+    scan_markers,
+)
+from .model import ParserModel
+from .output import ChangeDetectingWriter, write_atomically
+from .profiling import NULL_PROFILER, Profiler
+from .renderers import get_renderer
+from .snapshots import SnapshotFunctionLoader, snapshot_path, snapshot_text
+from .watch import FileWatcher
+
+
+def run_cli(args: argparse.Namespace) -> None:
+    """
+    Process the files according to the command line arguments.
+    Exit with code 1 if some blocks couldn't be rendered, with code 2 if --check finds changes.
+    """
+    check_args(args)
+
+    loader_class: t.Type[FunctionLoader] = FunctionLoader
+    if args.loader == "static":
+        from .static_loader import StaticFunctionLoader
+
+        loader_class = StaticFunctionLoader
+    memoize = not args.no_memoize
+    cache = RenderCache(None if args.no_cache else args.cache_dir, memoize=memoize)
+    if args.from_model is not None:
+        snapshot_loader = SnapshotFunctionLoader(args.from_model, memoize)
+        exit_code = run(args, snapshot_loader, cache)
+        if args.watch is not None:
+            watch_files(args, snapshot_loader, cache)
+    elif args.sandbox:
+        # Only needed for sandboxing, and importing multiprocessing is relatively slow
+        from .sandbox import DEFAULT_TIMEOUT, SandboxedFunctionLoader
+
+        with SandboxedFunctionLoader(
+            get_search_path(args),
+            loader_class,
+            memoize,
+            args.stub_modules,
+            args.jobs,
+            args.timeout if args.timeout is not None else DEFAULT_TIMEOUT,
+            args.max_cpu_time,
+            args.max_memory * 1024 * 1024 if args.max_memory is not None else None,
+        ) as sandboxed_loader:
+            exit_code = run(args, sandboxed_loader, cache)
+            if args.watch is not None:
+                watch_files(args, sandboxed_loader, cache)
+    elif args.jobs > 1:
+        # Only needed for parallel processing, and importing multiprocessing is relatively slow
+        from .workers import PooledFunctionLoader
+
+        with PooledFunctionLoader(
+            get_search_path(args), args.jobs, loader_class, memoize, args.stub_modules
+        ) as pooled_loader:
+            exit_code = run(args, pooled_loader, cache)
+    else:
+        loader = loader_class(get_search_path(args), memoize, args.stub_modules)
+        exit_code = run(args, loader, cache)
+        if args.watch is not None:
+            watch_files(args, loader, cache)
+
+    if exit_code:
+        raise SystemExit(exit_code)
+
+
+# Same syntax as the markers, without the comment around it
+PARSER_SPEC_REGEX = re.compile(r"(?P<module>[\w.]+):(?P<function>\w+)(?P<args>:.*)?\Z")
+
+
+def check_args(args: argparse.Namespace) -> None:
+    """Check the combination of the processing arguments, exit with an error if it isn't valid."""
+    if not args.input and not args.output:
+        raise SystemExit("No input files specified")
+    if bool(args.parser) != bool(args.output):
+        raise SystemExit("--parser and --output have to be used together")
+    if args.parser and not PARSER_SPEC_REGEX.match(args.parser):
+        raise SystemExit(f"Invalid --parser '{args.parser}', expected MODULE:FUNCTION[:OPTIONS]")
+    for output_format, _ in args.output:
+        try:
+            get_renderer(output_format)
+        except ValueError as e:
+            raise SystemExit(str(e))
+    if args.watch is not None and args.jobs > 1:
+        raise SystemExit("--watch can't be combined with --jobs")
+    limits = (args.timeout, args.max_cpu_time, args.max_memory)
+    if not args.sandbox and any(limit is not None for limit in limits):
+        raise SystemExit("--timeout, --max-cpu-time and --max-memory require --sandbox")
+    if sys.platform == "win32" and (args.max_cpu_time is not None or args.max_memory is not None):
+        raise SystemExit("--max-cpu-time and --max-memory are not supported on Windows")
+    if args.dump_model is not None and args.from_model is not None:
+        raise SystemExit("--dump-model can't be combined with --from-model")
+    if args.dump_model is not None and args.watch is not None:
+        raise SystemExit("--dump-model can't be combined with --watch")
+    if args.from_model is not None and (args.sandbox or args.loader != "import"):
+        raise SystemExit("--from-model doesn't load any modules, it can't be combined with --sandbox or --loader")
+
+
+def get_search_path(args: argparse.Namespace) -> t.List[str]:
+    """Return the extra paths the loader should search for the modules in."""
+    # Include the process CWD in the loader's search path so that modules
+    # at the repo root can be found even when input files are in subdirectories.
+    # When running as a pre-commit hook, CWD is the repo root (per githooks(5)).
+    extra_paths = [os.path.realpath(p) for p in (args.extra_sys_path or [])]
+    process_cwd = os.path.realpath(os.getcwd())
+    if process_cwd not in extra_paths:
+        extra_paths.append(process_cwd)
+    return extra_paths
+
+
+def get_input_files(args: argparse.Namespace) -> t.List[str]:
+    """Return the markdown files to process, found in the input paths given in the arguments."""
+    return find_input_files(args.input, args.include, args.exclude)
+
+
+def run(args: argparse.Namespace, loader: FunctionLoader, cache: RenderCache) -> int:
+    """
+    Process the input files with the given loader and cache, according to the arguments.
+    Return the exit code: 1 if some blocks couldn't be rendered, 2 if --check finds changes, 0 otherwise.
+    """
+    changed_files = None
+    if args.changed_files is not None:
+        changed_files = {os.path.realpath(path) for path in args.changed_files}
+    profiler: Profiler = NULL_PROFILER
+    if args.profile or args.profile_memory:
+        profiler = Profiler(trace_memory=args.profile_memory)
+        profiler.start()
+    loader.profiler = profiler
+    try:
+        with profiler.phase("discover"):
+            input_files = get_input_files(args)
+        if args.jobs > 1:
+            for path in input_files:
+                with map_markdown_file(path) as buffer:
+                    encoding = detect_text_format(buffer)[0]
+                with open(path, encoding=encoding) as in_markdown:
+                    prefetch_markdown(in_markdown, loader, cache, _blocks_changed_files(path, changed_files))
+        if args.dump_model is not None:
+            exit_code = dump_models(args, input_files, loader)
+        else:
+            exit_code = process_files(args, input_files, loader, cache, changed_files)
+
+        cache.prune()
+        cache.save_index()
+    finally:
+        loader.profiler = NULL_PROFILER
+        profiler.stop()
+        if profiler is not NULL_PROFILER:
+            report = profiler.report_json() if args.profile == "json" else profiler.report_text()
+            print(report, file=sys.stderr)
+    return exit_code
+
+
+@dataclass
+class BlockChange:
+    marker: str
+    # Line numbers (1-based) of the start and the end markers of the block
+    start_line: int
+    end_line: int
+    # Unified diff of the block contents, with the line numbers of the file
+    diff: t.List[str]
+
+
+@dataclass
+class BlockError:
+    marker: str
+    # Line number (1-based) of the start marker, 0 for the --output files
+    line: int
+    message: str
+
+
+@dataclass
+class FileResult:
+    file: str = ""
+    # Messages to print to stderr, in order
+    messages: t.List[str] = field(default_factory=list)
+    changes_required: bool = False
+    # Blocks which need to be updated, only filled in if the diffs were requested
+    blocks: t.List[BlockChange] = field(default_factory=list)
+    # Blocks which couldn't be rendered, and kept their contents
+    errors: t.List[BlockError] = field(default_factory=list)
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "file": self.file,
+            "blocks": [
+                {
+                    "marker": block.marker,
+                    "start_line": block.start_line,
+                    "end_line": block.end_line,
+                    "diff": "\n".join(block.diff),
+                }
+                for block in self.blocks
+            ],
+            "errors": [{"marker": error.marker, "line": error.line, "message": error.message} for error in self.errors],
+        }
+
+
+def _blocks_changed_files(path: str, changed_files: t.Optional[t.AbstractSet[str]]) -> t.Optional[t.AbstractSet[str]]:
+    # If the markdown file itself has changed, all of its blocks are regenerated
+    if changed_files is None or os.path.realpath(path) in changed_files:
+        return None
+    return changed_files
+
+
+def process_file(
+    path: str,
+    loader: FunctionLoader,
+    cache: RenderCache,
+    check: bool,
+    changed_files: t.Optional[t.AbstractSet[str]] = None,
+    diff: t.Optional[bool] = None,
+) -> FileResult:
+    """
+    Process one input file, updating it unless check is True.
+
+    The file is only opened while it is processed. If it needs to be updated, the new contents are written to
+    a temporary file which then replaces the original, keeping its encoding and line endings.
+    Files which don't need to be updated are not modified. Blocks whose parser can't be loaded (see LoadError)
+    keep their contents and are reported in the errors of the result.
+
+    If changed_files is given, only the blocks affected by the changes in these files are regenerated.
+    If diff is True (by default, if check is True), the diffs of the changed blocks are added to the result.
+    """
+    result = FileResult(path)
+    if diff is None:
+        diff = check
+    changed_blocks: t.List[RenderedBlock] = []
+
+    def on_block(block: RenderedBlock) -> None:
+        if block.old != block.new:
+            changed_blocks.append(block)
+
+    def on_error(marker: str, line: int, error: LoadError) -> None:
+        result.errors.append(BlockError(marker, line, str(error)))
+        result.messages.append(f"Error in {path}:{line}: {error}")
+
+    profiler = loader.profiler
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(profiler.phase("file", file=path))
+        with map_markdown_file(path) as buffer:
+            with profiler.phase("scan"):
+                marker_spans = scan_markers(buffer)
+            if not marker_spans:
+                # No markers, skip the file without decoding it
+                return result
+
+            # The output is compared against the original file while it is generated,
+            # so that only the output of files which change is kept.
+            encoding, newline = detect_text_format(buffer)
+            original = stack.enter_context(open(path, encoding=encoding))
+            writer = ChangeDetectingWriter(original)
+            stack.callback(writer.close)
+            cwd = os.path.dirname(path)
+            chunks = iter_markdown_buffer(
+                buffer,
+                marker_spans,
+                encoding,
+                cwd,
+                loader,
+                cache,
+                _blocks_changed_files(path, changed_files),
+                on_block if diff else None,
+                on_error,
+            )
+            for chunk in chunks:
+                writer.write(chunk)
+
+        if not writer.finish():
+            return result
+
+        result.changes_required = True
+        if diff:
+            with profiler.phase("diff"):
+                if changed_blocks:
+                    result.blocks = [_block_change(path, block) for block in changed_blocks]
+                else:
+                    # Only the text outside of the blocks has changed,
+                    # e.g. the line endings. Report the whole file, with an empty marker.
+                    original.seek(0)
+                    original_text = original.read()
+                    file_diff = _unified_diff(path, original_text, writer.getvalue(), 0)
+                    result.blocks = [BlockChange("", 1, original_text.count("\n") + 1, file_diff)]
+        if check:
+            result.messages.append(f"Changes required in {path}:")
+            for block_change in result.blocks:
+                result.messages.extend(block_change.diff)
+        else:
+            result.messages.append(f"Updating {path}...")
+            # Some platforms don't allow replacing a file which is open
+            original.close()
+            with profiler.phase("write"), write_atomically(path, encoding, newline) as out:
+                writer.copy_to(out)
+    return result
+
+
+_HUNK_HEADER_REGEX = re.compile(r"^@@ -(\d+)(,\d+)? \+(\d+)(,\d+)? @@")
+
+
+def _unified_diff(name: str, old: str, new: str, line_offset: int) -> t.List[str]:
+    import difflib
+
+    lines = []
+    for line in difflib.unified_diff(old.splitlines(), new.splitlines(), name, name, lineterm=""):
+        # Hunk line numbers are relative to the compared text, make them refer to the lines of the file
+        match = _HUNK_HEADER_REGEX.match(line) if line_offset else None
+        if match:
+            old_start, old_count, new_start, new_count = match.groups()
+            line = "@@ -%d%s +%d%s @@" % (
+                int(old_start) + line_offset,
+                old_count or "",
+                int(new_start) + line_offset,
+                new_count or "",
+            )
+        lines.append(line)
+    return lines
+
+
+def _block_change(name: str, block: RenderedBlock) -> BlockChange:
+    # The contents of the block start on the line after the start marker
+    diff = _unified_diff(name, block.old, block.new, block.start_line)
+    return BlockChange(block.marker, block.start_line, block.end_line, diff)
+
+
+def render_output(
+    args: argparse.Namespace, output_format: str, path: str, loader: FunctionLoader, cache: RenderCache
+) -> FileResult:
+    """Render the parser given with --parser into the file in the given format, updating it unless --check is set."""
+    match = PARSER_SPEC_REGEX.match(args.parser)
+    assert match is not None
+    result = FileResult(path)
+    options = "%s:format=%s" % (match.group("args") or "", output_format)
+    try:
+        output = render_block(match.group("module"), match.group("function"), options, None, loader, cache)
+    except LoadError as e:
+        result.errors.append(BlockError(args.parser, 0, str(e)))
+        result.messages.append(f"Error in {path}: {e}")
+        return result
+    try:
+        with open(path, encoding="utf-8") as f:
+            original = f.read()
+    except FileNotFoundError:
+        original = ""
+    if output == original:
+        return result
+
+    result.changes_required = True
+    if args.check or args.format == "json":
+        diff = _unified_diff(path, original, output, 0)
+        result.blocks = [BlockChange("", 1, max(original.count("\n"), 1), diff)]
+    if args.check:
+        result.messages.append(f"Changes required in {path}:")
+        result.messages.extend(result.blocks[0].diff)
+    else:
+        result.messages.append(f"Updating {path}...")
+        with loader.profiler.phase("write"), write_atomically(path, "utf-8", "\n") as out:
+            out.write(output)
+    return result
+
+
+def render_outputs(args: argparse.Namespace, loader: FunctionLoader, cache: RenderCache) -> t.List[FileResult]:
+    """Render the --output files, the parser is only loaded once for all of them."""
+    return [render_output(args, output_format, path, loader, cache) for output_format, path in args.output]
+
+
+def process_files(
+    args: argparse.Namespace,
+    input_files: t.List[str],
+    loader: FunctionLoader,
+    cache: RenderCache,
+    changed_files: t.Optional[t.AbstractSet[str]] = None,
+) -> int:
+    """
+    Process all the input files, return the exit code (see run).
+    With --format=json, a report of the files and blocks which need to be updated, and of the blocks which couldn't
+    be rendered, is printed to stdout.
+    """
+    json_report = args.format == "json"
+
+    def process(path: str) -> FileResult:
+        return process_file(path, loader, cache, args.check, changed_files, args.check or json_report)
+
+    changes_required = False
+    errors = False
+    reported_results = []
+    executor = None
+    if args.jobs > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=args.jobs)
+        results: t.Iterable[FileResult] = executor.map(process, input_files)
+    else:
+        results = map(process, input_files)
+    if args.output:
+        results = itertools.chain(render_outputs(args, loader, cache), results)
+    try:
+        # Results are reported in the order of the input files, regardless of the order of completion
+        for result in results:
+            if not json_report:
+                for message in result.messages:
+                    print(message, file=sys.stderr)
+            if result.changes_required:
+                changes_required = True
+            if result.errors:
+                errors = True
+            if result.changes_required or result.errors:
+                reported_results.append(result)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if json_report:
+        report = {"check": args.check, "files": [result.to_dict() for result in reported_results]}
+        print(json.dumps(report, indent=2))
+    if errors:
+        return 1
+    return 2 if args.check and changes_required else 0
+
+
+def _iter_parser_specs(path: str) -> t.Iterator[t.Tuple[str, str, t.Optional[str]]]:
+    # (module, function, options) of the blocks in the markdown file
+    with map_markdown_file(path) as buffer:
+        encoding = detect_text_format(buffer)[0]
+        for line_start, line_end in scan_markers(buffer):
+            match = ARGPARSE_DOC_REGEX.match(buffer[line_start:line_end].decode(encoding))
+            if match:
+                yield match.group("module"), match.group("function"), match.group("args")
+
+
+def dump_models(args: argparse.Namespace, input_files: t.List[str], loader: FunctionLoader) -> int:
+    """
+    Write the snapshots of the parsers used by the blocks of the input files, and by --parser, into --dump-model.
+
+    Blocks which are rendered from a snapshot (with the model option) are skipped. Snapshots are only written if
+    their contents change; with --check, out of date snapshots are reported instead. Return the exit code (see run).
+    """
+    specs: t.Dict[t.Tuple[str, str], t.Optional[str]] = {}
+    if args.parser:
+        match = PARSER_SPEC_REGEX.match(args.parser)
+        assert match is not None
+        specs[(match.group("module"), match.group("function"))] = None
+    for path in input_files:
+        input_dir = os.path.dirname(path)
+        for module, function, options in _iter_parser_specs(path):
+            if not args_to_options(options, input_dir).model:
+                specs.setdefault((module, function), input_dir)
+
+    exit_code = 0
+    os.makedirs(args.dump_model, exist_ok=True)
+    for (module, function), cwd in specs.items():
+        path = snapshot_path(args.dump_model, module, function)
+        try:
+            with loader.profiler.phase("load"):
+                parser = loader.load_parser(module, function, cwd)
+        except LoadError as e:
+            print(f"Error in {path}: {e}", file=sys.stderr)
+            exit_code = 1
+            continue
+        with loader.profiler.phase("model"):
+            model = parser if isinstance(parser, ParserModel) else ParserModel.from_parser(parser)
+            text = snapshot_text(model)
+        try:
+            with open(path, encoding="utf-8") as f:
+                up_to_date = f.read() == text
+        except FileNotFoundError:
+            up_to_date = False
+        if up_to_date:
+            continue
+        if args.check:
+            print(f"Model snapshot {path} is out of date", file=sys.stderr)
+            exit_code = exit_code or 2
+        else:
+            print(f"Updating {path}...", file=sys.stderr)
+            with loader.profiler.phase("write"), write_atomically(path, "utf-8", "\n") as out:
+                out.write(text)
+    return exit_code
+
+
+def watch_dependencies(watcher: FileWatcher, loader: FunctionLoader, cache: RenderCache) -> None:
+    """Watch the source files of the modules loaded by the loader and of the blocks served by the cache."""
+    for dependencies in list(loader.module_dependencies.values()):
+        watcher.add(dependencies)
+    watcher.add(cache.used_dependencies())
+
+
+def watch_files(args: argparse.Namespace, loader: FunctionLoader, cache: RenderCache) -> None:
+    """
+    Process the input files again whenever they or the source files of the parsers change, until interrupted.
+
+    Only the modules and the blocks affected by the changed files are reloaded and regenerated.
+    """
+    paths = [os.path.realpath(path) for path in get_input_files(args)]
+    watcher = FileWatcher()
+    watcher.add(paths)
+    watch_dependencies(watcher, loader, cache)
+    print("Watching for changes, press Ctrl+C to stop...", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(args.watch)
+            changed_files = watcher.poll()
+            if not changed_files:
+                continue
+
+            start_time = time.perf_counter()
+            try:
+                for module_name in loader.reload_modules(changed_files):
+                    print(f"Reloaded {module_name}", file=sys.stderr)
+                cache.invalidate(changed_files)
+                for result in render_outputs(args, loader, cache) if args.output else []:
+                    for message in result.messages:
+                        print(message, file=sys.stderr)
+                for path in paths:
+                    result = process_file(path, loader, cache, args.check, changed_files)
+                    for message in result.messages:
+                        print(message, file=sys.stderr)
+                    if result.changes_required and not args.check:
+                        # Don't report our own changes as changes on the next poll
+                        watcher.update([path])
+                cache.save_index()
+            except Exception:
+                # Keep watching, the error may be fixed by the next change
+                traceback.print_exc()
+            watch_dependencies(watcher, loader, cache)
+            print(f"Processed changes in {time.perf_counter() - start_time:.3f} s", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,147 @@
+import contextlib
+import json
+import threading
+import time
+import tracemalloc
+import typing as t
+from dataclasses import asdict, dataclass, field
+
+
+@dataclass
+class PhaseRecord:
+    # Phase name, e.g. "file", "block", "import", "factory", "render"
+    name: str
+    # Wall time in seconds
+    duration: float
+    # Peak traced memory during the phase in bytes, None if memory tracing is disabled
+    peak_memory: t.Optional[int] = None
+    # Context of the phase, inherited from the enclosing phases, e.g. {"file": "README.md", "block": "mod:func"}
+    context: t.Dict[str, str] = field(default_factory=dict)
+
+
+class _ActivePhase:
+    def __init__(self, context: t.Dict[str, str]):
+        self.context = context
+        self.peak_memory = 0
+
+
+class Profiler:
+    """
+    Records wall time (and optionally peak memory) of the processing phases.
+
+    Phases can be nested; each phase inherits the context of the enclosing phase. Callbacks registered with
+    subscribe are called with a PhaseRecord whenever a phase ends, which lets library users collect their own
+    statistics.
+
+    Memory is measured with tracemalloc, which is process-wide: when files are processed in parallel, peak memory
+    of a phase includes allocations made by other threads at the same time.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.records: t.List[PhaseRecord] = []
+        self._callbacks: t.List[t.Callable[[PhaseRecord], None]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_tracemalloc = False
+
+    def subscribe(self, callback: t.Callable[[PhaseRecord], None]) -> None:
+        """Register a function to be called with the PhaseRecord of every phase which ends."""
+        self._callbacks.append(callback)
+
+    def start(self) -> None:
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def stop(self) -> None:
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    @contextlib.contextmanager
+    def phase(self, name: str, **context: str) -> t.Iterator[None]:
+        stack: t.List[_ActivePhase] = self._local.__dict__.setdefault("stack", [])
+        parent_context = stack[-1].context if stack else {}
+        active = _ActivePhase({**parent_context, **context})
+
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            # The peak counter is shared, save the parent's peak before resetting it
+            if stack:
+                stack[-1].peak_memory = max(stack[-1].peak_memory, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        stack.append(active)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start_time
+            stack.pop()
+            peak_memory = None
+            if tracing:
+                peak_memory = max(active.peak_memory, tracemalloc.get_traced_memory()[1])
+                if stack:
+                    stack[-1].peak_memory = max(stack[-1].peak_memory, peak_memory)
+            self._add_record(PhaseRecord(name, duration, peak_memory, active.context))
+
+    def _add_record(self, record: PhaseRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+        for callback in self._callbacks:
+            callback(record)
+
+    def summary(self) -> t.Dict[str, t.Dict[str, t.Any]]:
+        """Aggregate the records by phase name: count, total and maximum duration, maximum peak memory."""
+        result: t.Dict[str, t.Dict[str, t.Any]] = {}
+        for record in self.records:
+            entry = result.setdefault(record.name, {"count": 0, "total": 0.0, "max": 0.0, "peak_memory": None})
+            entry["count"] += 1
+            entry["total"] += record.duration
+            entry["max"] = max(entry["max"], record.duration)
+            if record.peak_memory is not None:
+                entry["peak_memory"] = max(entry["peak_memory"] or 0, record.peak_memory)
+        return result
+
+    def report_json(self) -> str:
+        return json.dumps({"summary": self.summary(), "records": [asdict(r) for r in self.records]}, indent=2)
+
+    def report_text(self, slowest: int = 10) -> str:
+        lines = ["%-14s %7s %11s %11s %13s" % ("Phase", "Count", "Total, s", "Max, s", "Peak memory")]
+        for name, entry in self.summary().items():
+            lines.append(
+                "%-14s %7d %11.4f %11.4f %13s"
+                % (name, entry["count"], entry["total"], entry["max"], _format_size(entry["peak_memory"]))
+            )
+
+        for name, key in (("file", "file"), ("block", "block")):
+            records = sorted((r for r in self.records if r.name == name), key=lambda r: r.duration, reverse=True)
+            if not records:
+                continue
+            lines.append("")
+            lines.append("Slowest %ss:" % name)
+            for record in records[:slowest]:
+                label = record.context.get(key, "")
+                if name == "block":
+                    label = "%s (%s)" % (label, record.context.get("file", ""))
+                lines.append("  %9.4f s %13s  %s" % (record.duration, _format_size(record.peak_memory), label))
+        return "\n".join(lines)
+
+
+def _format_size(size: t.Optional[int]) -> str:
+    if size is None:
+        return "-"
+    if size < 1024 * 1024:
+        return "%.1f KiB" % (size / 1024)
+    return "%.1f MiB" % (size / (1024 * 1024))
+
+
+class NullProfiler(Profiler):
+    """Profiler which doesn't record anything, used when profiling is disabled."""
+
+    def phase(self, name: str, **context: str) -> t.ContextManager[None]:  # type: ignore[override]
+        return contextlib.nullcontext()
+
+
+NULL_PROFILER = NullProfiler()
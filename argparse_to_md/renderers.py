@@ -0,0 +1,285 @@
+"""
+Renderers of the parser model into documentation formats.
+
+Each renderer is a function taking the ParserModel, the output stream and the formatter options. The parser is
+imported and its model extracted once, and the model can then be rendered into any number of formats.
+Renderers are looked up by name: the built-in ones are registered below, others can be added with
+register_renderer, or by packages through the "argparse_to_md.renderers" entry point group.
+"""
+
+import argparse
+import html
+import json
+import sys
+import typing as t
+import weakref
+
+from .formatter import MarkdownHelpFormatterOptions, format_usage, gen_argparse_help, iter_command_tree, iter_groups
+from .model import ActionModel, ParserModel
+
+Renderer = t.Callable[[ParserModel, t.TextIO, MarkdownHelpFormatterOptions], None]
+
+ENTRY_POINT_GROUP = "argparse_to_md.renderers"
+
+_RENDERERS: t.Dict[str, Renderer] = {}
+_entry_points_loaded = False
+
+# Models of the parsers rendered so far, so that rendering a parser into several formats extracts the model once
+# The models don't refer to the top level parsers, so the entries are dropped together with the parsers.
+_models: "weakref.WeakKeyDictionary[argparse.ArgumentParser, ParserModel]" = weakref.WeakKeyDictionary()
+
+
+def register_renderer(name: str) -> t.Callable[[Renderer], Renderer]:
+    """Decorator registering the function as the renderer of the given format, replacing the previous one."""
+
+    def decorator(renderer: Renderer) -> Renderer:
+        _RENDERERS[name] = renderer
+        return renderer
+
+    return decorator
+
+
+def _load_entry_points() -> None:
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    # importlib.metadata is slow to import, only needed when a format isn't built in
+    from importlib.metadata import entry_points
+
+    if sys.version_info >= (3, 10):
+        group = entry_points(group=ENTRY_POINT_GROUP)
+    else:
+        group = entry_points().get(ENTRY_POINT_GROUP, [])
+    for entry_point in group:
+        _RENDERERS.setdefault(entry_point.name, entry_point.load())
+
+
+def get_renderer(name: str) -> Renderer:
+    """Return the renderer of the given format, raise ValueError if there is none."""
+    if name not in _RENDERERS:
+        _load_entry_points()
+    if name not in _RENDERERS:
+        raise ValueError(f"Unknown format: '{name}'. Available formats: {', '.join(renderer_names())}")
+    return _RENDERERS[name]
+
+
+def renderer_names() -> t.List[str]:
+    """Return the names of the registered formats."""
+    return sorted(_RENDERERS)
+
+
+def render(
+    parser: t.Union[argparse.ArgumentParser, ParserModel],
+    out: t.TextIO,
+    options: MarkdownHelpFormatterOptions,
+    memoize: bool = True,
+) -> None:
+    """
+    Render the help of the parser into the format selected by options.format.
+
+    :param memoize: If set, the model of the parser is reused when the same parser object is rendered again.
+        Clear it if the parser may change between the calls, e.g. if the factories are not pure.
+    """
+    renderer = get_renderer(options.format)
+    if not isinstance(parser, ParserModel):
+        model = _models.get(parser) if memoize else None
+        if model is None:
+            model = ParserModel.from_parser(parser)
+            if memoize:
+                _models[parser] = model
+        parser = model
+    renderer(parser, out, options)
+
+
+register_renderer("markdown")(gen_argparse_help)
+
+
+def _usage_label(path: t.List[str], aliases: t.List[str], quote: t.Callable[[str], str]) -> str:
+    if not path:
+        return "Usage"
+    label = "Usage of %s" % quote(" ".join(path))
+    if aliases:
+        label += " (aliases: %s)" % ", ".join(quote(alias) for alias in aliases)
+    return label
+
+
+# --- reStructuredText ---
+
+_RST_UNDERLINES = "=-~^\"'"
+
+
+def _rst_literal(text: str) -> str:
+    return "``%s``" % text
+
+
+def _generate_parser_rst(
+    parser: ParserModel, out: t.TextIO, options: MarkdownHelpFormatterOptions, label: str, group_suffix: str
+) -> None:
+    if options.subheading_level > 0:
+        underline = _RST_UNDERLINES[min(options.subheading_level, len(_RST_UNDERLINES)) - 1]
+        out.write("%s\n%s\n" % (label, underline * len(label)))
+    else:
+        out.write("%s:\n" % label)
+    usage = "\n".join("    " + line if line else "" for line in format_usage(parser).splitlines())
+    out.write("\n.. code-block:: none\n\n%s\n" % usage)
+
+    if parser.description:
+        out.write("\n%s\n" % parser.description)
+
+    for title, actions in iter_groups(parser):
+        out.write("\n%s%s:\n\n" % (title, group_suffix))
+        for action in actions:
+            out.write("- %s: %s\n" % (", ".join(_rst_literal(i) for i in action.invocations), action.help))
+
+
+@register_renderer("rst")
+def render_rst(parser: ParserModel, out: t.TextIO, options: MarkdownHelpFormatterOptions) -> None:
+    for index, (path, aliases, subparser) in enumerate(iter_command_tree(parser, options)):
+        if index:
+            out.write("\n")
+        label = _usage_label(path, aliases, _rst_literal)
+        group_suffix = " of %s" % _rst_literal(" ".join(path)) if path else ""
+        _generate_parser_rst(subparser, out, options, label, group_suffix)
+
+
+# --- man page (roff) ---
+
+
+def _roff_escape(text: str) -> str:
+    text = text.replace("\\", "\\e").replace("-", "\\-")
+    # Lines starting with these characters would be interpreted as requests
+    return "\n".join("\\&" + line if line.startswith((".", "'")) else line for line in text.splitlines())
+
+
+def _roff_invocation(action: ActionModel, invocation: str) -> str:
+    if not action.option_strings:
+        return "\\fI%s\\fR" % _roff_escape(invocation)
+    option, _, args = invocation.partition(" ")
+    if not args:
+        return "\\fB%s\\fR" % _roff_escape(option)
+    return "\\fB%s\\fR \\fI%s\\fR" % (_roff_escape(option), _roff_escape(args))
+
+
+def _generate_parser_roff(parser: ParserModel, out: t.TextIO, top_level: bool) -> None:
+    out.write(".nf\n%s\n.fi\n" % _roff_escape(format_usage(parser)))
+    if parser.description:
+        out.write(".PP\n%s\n" % _roff_escape(parser.description))
+    for title, actions in iter_groups(parser):
+        # Groups of the top level parser are sections of the page, groups of the subcommands are subsections
+        if top_level:
+            out.write('.SH "%s"\n' % _roff_escape(title.upper()))
+        else:
+            out.write('.SS "%s"\n' % _roff_escape(title))
+        for action in actions:
+            invocations = ", ".join(_roff_invocation(action, i) for i in action.invocations)
+            out.write(".TP\n%s\n%s\n" % (invocations, _roff_escape(action.help or "")))
+
+
+@register_renderer("man")
+def render_man(parser: ParserModel, out: t.TextIO, options: MarkdownHelpFormatterOptions) -> None:
+    tree = iter_command_tree(parser, options)
+    # The page is about the top of the block, which is the subcommand selected by options.path, if any
+    _, _, parser = next(tree)
+    out.write('.TH "%s" "1"\n' % _roff_escape(parser.prog.upper()))
+    out.write(".SH NAME\n%s\n.SH SYNOPSIS\n" % _roff_escape(parser.prog))
+    _generate_parser_roff(parser, out, top_level=True)
+    for path, aliases, subparser in tree:
+        out.write('.SH "COMMAND %s"\n' % _roff_escape(" ".join(path).upper()))
+        if aliases:
+            out.write(".PP\nAliases: %s\n" % _roff_escape(", ".join(aliases)))
+        _generate_parser_roff(subparser, out, top_level=False)
+
+
+# --- HTML ---
+
+
+def _html_code(text: str) -> str:
+    return "<code>%s</code>" % html.escape(text)
+
+
+def _generate_parser_html(
+    parser: ParserModel, out: t.TextIO, options: MarkdownHelpFormatterOptions, label: str, group_suffix: str
+) -> None:
+    if options.subheading_level > 0:
+        level = min(options.subheading_level, 6)
+        out.write("<h%d>%s</h%d>\n" % (level, label, level))
+    else:
+        out.write("<p>%s:</p>\n" % label)
+    out.write("<pre><code>%s</code></pre>\n" % html.escape(format_usage(parser)))
+
+    if parser.description:
+        out.write("<p>%s</p>\n" % html.escape(parser.description))
+
+    for title, actions in iter_groups(parser):
+        out.write("<p>%s%s:</p>\n<ul>\n" % (html.escape(title), group_suffix))
+        for action in actions:
+            invocations = ", ".join(_html_code(i) for i in action.invocations)
+            out.write("<li>%s: %s</li>\n" % (invocations, html.escape(action.help or "")))
+        out.write("</ul>\n")
+
+
+@register_renderer("html")
+def render_html(parser: ParserModel, out: t.TextIO, options: MarkdownHelpFormatterOptions) -> None:
+    for path, aliases, subparser in iter_command_tree(parser, options):
+        label = _usage_label(path, aliases, _html_code)
+        group_suffix = " of %s" % _html_code(" ".join(path)) if path else ""
+        _generate_parser_html(subparser, out, options, label, group_suffix)
+
+
+# --- JSON ---
+
+
+def _action_to_json(action: ActionModel) -> t.Dict[str, t.Any]:
+    return {
+        "option_strings": list(action.option_strings),
+        "dest": action.dest,
+        "metavar": list(action.metavar) if isinstance(action.metavar, tuple) else action.metavar,
+        "nargs": action.nargs,
+        "choices": list(action.choices) if action.choices is not None else None,
+        "required": action.required,
+        "help": action.help,
+    }
+
+
+def _parser_to_json(parser: ParserModel) -> t.Dict[str, t.Any]:
+    return {
+        "prog": parser.prog,
+        "usage": format_usage(parser),
+        "description": parser.description,
+        "arguments": [
+            _action_to_json(action)
+            for action in parser.actions
+            if action.kind != "subparsers" and action.help is not argparse.SUPPRESS
+        ],
+        "mutually_exclusive_groups": [
+            {"required": group.required, "arguments": [action.dest for action in group.actions]}
+            for group in parser.mutex_groups
+        ],
+        "subcommands": [],
+    }
+
+
+@register_renderer("json")
+def render_json(parser: ParserModel, out: t.TextIO, options: MarkdownHelpFormatterOptions) -> None:
+    """
+    Render the parser as a JSON document, e.g. for generating shell completions.
+
+    Subcommands are nested in the "subcommands" list of their parent, each with its name, aliases and parser.
+    Subcommands whose parent is left out by the include option are nested in their closest rendered ancestor,
+    with their path relative to it as the name.
+    """
+    tree = iter_command_tree(parser, options)
+    root_path, _, parser = next(tree)
+    root = _parser_to_json(parser)
+    nodes = {tuple(root_path): root}
+    for path, aliases, subparser in tree:
+        node = _parser_to_json(subparser)
+        nodes[tuple(path)] = node
+        parent = len(path) - 1
+        while tuple(path[:parent]) not in nodes:
+            parent -= 1
+        name = " ".join(path[parent:])
+        nodes[tuple(path[:parent])]["subcommands"].append({"name": name, "aliases": aliases, "parser": node})
+    json.dump(root, out, indent=2)
+    out.write("\n")
@@ -0,0 +1,187 @@
+import functools
+import multiprocessing
+import os
+import signal
+import traceback
+import typing as t
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .loader import FunctionLoader, LoadError
+from .model import ParserModel
+from .workers import _load_parser_description
+
+# Wall clock time limit of loading one parser, if none is given
+DEFAULT_TIMEOUT = 60.0
+
+
+def _set_limits(max_cpu_time: t.Optional[int], max_memory: t.Optional[int]) -> None:
+    if max_cpu_time is None and max_memory is None:
+        # The resource module isn't available on Windows, where only the timeout is supported
+        return
+    import resource
+
+    if max_cpu_time is not None:
+        # The soft limit sends SIGXCPU, the hard limit one second later SIGKILL
+        resource.setrlimit(resource.RLIMIT_CPU, (max_cpu_time, max_cpu_time + 1))
+    if max_memory is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+
+
+def _run_sandboxed(
+    conn: t.Any,
+    loader_class: t.Type[FunctionLoader],
+    extra_sys_path: t.List[str],
+    module_name: str,
+    function_name: str,
+    cwd: t.Optional[str],
+    stub_modules: t.List[str],
+    max_cpu_time: t.Optional[int],
+    max_memory: t.Optional[int],
+) -> None:
+    # Runs in the child process
+    try:
+        _set_limits(max_cpu_time, max_memory)
+        description, dependencies = _load_parser_description(
+            loader_class, extra_sys_path, module_name, function_name, cwd, stub_modules
+        )
+        conn.send(("ok", description, dependencies))
+    except MemoryError:
+        conn.send(("error", "exceeded the memory limit"))
+    except BaseException as e:  # pylint: disable=broad-except
+        # Includes SystemExit and KeyboardInterrupt raised by the module code
+        conn.send(("error", "".join(traceback.format_exception_only(type(e), e)).strip()))
+
+
+class SandboxedFunctionLoader(FunctionLoader):
+    """
+    FunctionLoader which imports the modules and calls the parser factories in child processes, with limits.
+
+    Each (module, function, cwd) is loaded in a fresh process, which is killed if it doesn't finish within the
+    timeout. CPU time and address space of the process can be limited as well (on Unix). Failures, including
+    the exceptions raised by the module code, are raised as LoadError by load_function, so that the callers
+    can report them for the block and go on with the other blocks.
+
+    Results are kept for the whole run, so a module which hangs only costs the timeout once. With jobs > 1,
+    up to jobs processes run at the same time; use prefetch to start loading the functions before they are needed.
+
+    :param timeout: Wall clock time limit of loading one parser, in seconds.
+    :param max_cpu_time: CPU time limit of the child process, in seconds.
+    :param max_memory: Address space limit of the child process, in bytes.
+    """
+
+    def __init__(
+        self,
+        extra_sys_path: t.Optional[t.List[str]] = None,
+        loader_class: t.Type[FunctionLoader] = FunctionLoader,
+        memoize: bool = True,
+        stub_modules: t.Sequence[str] = (),
+        jobs: int = 1,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_cpu_time: t.Optional[int] = None,
+        max_memory: t.Optional[int] = None,
+    ):
+        super().__init__(extra_sys_path, memoize, stub_modules)
+        self.loader_class = loader_class
+        self.timeout = timeout
+        self.max_cpu_time = max_cpu_time
+        self.max_memory = max_memory
+        # Each thread starts one child process and waits for it
+        self._executor = ThreadPoolExecutor(max_workers=jobs)
+        self._results: t.Dict[t.Tuple[str, str, t.Optional[str]], Future] = {}
+
+    def prefetch(self, module_name: str, function_name: str, cwd: t.Optional[str] = None) -> None:
+        key = (module_name, function_name, cwd)
+        with self.lock:
+            if key not in self._results:
+                self._results[key] = self._executor.submit(self._load_in_child, module_name, function_name, cwd)
+
+    def _load_in_child(
+        self, module_name: str, function_name: str, cwd: t.Optional[str]
+    ) -> t.Tuple[t.Dict[str, t.Any], t.List[str]]:
+        name = f"{module_name}:{function_name}"
+        # "spawn" gives the child a clean interpreter, regardless of the platform default
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_run_sandboxed,
+            args=(
+                child_conn,
+                self.loader_class,
+                self.extra_sys_path,
+                module_name,
+                function_name,
+                cwd,
+                self.stub_modules,
+                self.max_cpu_time,
+                self.max_memory,
+            ),
+            daemon=True,
+        )
+        with self.profiler.phase("sandbox", module=module_name):
+            process.start()
+            # Only the child holds the sending end now, so that its exit is seen as the end of the pipe
+            child_conn.close()
+            try:
+                if not parent_conn.poll(self.timeout):
+                    process.kill()
+                    raise LoadError(f"Loading {name} timed out after {self.timeout:g} s")
+                try:
+                    message = parent_conn.recv()
+                except EOFError:
+                    message = None
+            finally:
+                parent_conn.close()
+                process.join()
+
+        if message is None:
+            raise LoadError(f"Loading {name} failed: {self._describe_exit(process.exitcode)}")
+        if message[0] == "error":
+            raise LoadError(f"Loading {name} failed: {message[1]}")
+        _, description, dependencies = message
+        return description, dependencies
+
+    def _describe_exit(self, exitcode: t.Optional[int]) -> str:
+        if exitcode is not None and exitcode < 0:
+            if self.max_cpu_time is not None and -exitcode in (
+                getattr(signal, "SIGXCPU", None),
+                getattr(signal, "SIGKILL", None),
+            ):
+                return f"exceeded the CPU time limit of {self.max_cpu_time} s"
+            return f"the process was terminated by signal {-exitcode}"
+        return f"the process exited with code {exitcode}"
+
+    def load_function(self, module_name: str, function_name: str, cwd: t.Optional[str] = None) -> t.Any:
+        self.prefetch(module_name, function_name, cwd)
+        description, dependencies = self._results[(module_name, function_name, cwd)].result()
+        self.module_dependencies[module_name] = dependencies
+        return functools.partial(ParserModel.from_dict, description)
+
+    def reload_modules(self, changed_files: t.AbstractSet[str]) -> t.List[str]:
+        """
+        Forget the parsers of the modules affected by the changed files, so that they are loaded again.
+
+        Modules which failed to load are always loaded again, the change may have fixed them.
+        """
+        affected = set()
+        with self.lock:
+            for key, result in list(self._results.items()):
+                module_name = key[0]
+                if not result.done():
+                    continue
+                if result.exception() is None:
+                    dependencies = self.module_dependencies.get(module_name, [])
+                    if not any(os.path.realpath(path) in changed_files for path in dependencies):
+                        continue
+                del self._results[key]
+                self.parsers.pop(key, None)
+                affected.add(module_name)
+        return sorted(affected)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "SandboxedFunctionLoader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
@@ -0,0 +1,71 @@
+"""
+Snapshots of the parser models, for rendering the blocks without importing the modules.
+
+A snapshot is the ParserModel of a parser factory in its compact JSON form (see ParserModel.to_json), written by
+--dump-model as MODULE.FUNCTION.json. Blocks are rendered from the snapshots with --from-model, or with the model
+option of a marker.
+"""
+
+import os
+import typing as t
+
+from .loader import FunctionLoader, LoadError
+from .model import ParserModel
+
+
+def snapshot_path(directory: str, module_name: str, function_name: str) -> str:
+    return os.path.join(directory, f"{module_name}.{function_name}.json")
+
+
+def snapshot_text(model: ParserModel) -> str:
+    return model.to_json() + "\n"
+
+
+def load_snapshot(path: str) -> ParserModel:
+    """Load the parser model from the snapshot file, raise LoadError if it is missing or invalid."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    except FileNotFoundError:
+        raise LoadError(f"Model snapshot {path} not found, create it with --dump-model") from None
+    except OSError as e:
+        raise LoadError(f"Can't read model snapshot {path}: {e.strerror}") from None
+    try:
+        return ParserModel.from_json(text)
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        raise LoadError(f"Invalid model snapshot {path}: {e}") from None
+
+
+class SnapshotFunctionLoader(FunctionLoader):
+    """
+    FunctionLoader which returns the parser models stored in a snapshot directory, without importing anything.
+
+    The factories returned by load_function return the ParserModel. A block depends on its snapshot file only.
+    """
+
+    def __init__(self, snapshot_dir: str, memoize: bool = True):
+        # The snapshot directory takes the place of the search path, so that the blocks rendered from the snapshots
+        # are cached separately from the blocks rendered by importing the modules
+        super().__init__([os.path.realpath(snapshot_dir)], memoize)
+        self.snapshot_dir = snapshot_dir
+
+    def load_function(self, module_name: str, function_name: str, cwd: t.Optional[str] = None) -> t.Any:
+        path = snapshot_path(self.snapshot_dir, module_name, function_name)
+        model = load_snapshot(path)
+        with self.lock:
+            dependencies = self.module_dependencies.setdefault(module_name, [])
+            if path not in dependencies:
+                dependencies.append(path)
+        return lambda: model
+
+    def reload_modules(self, changed_files: t.AbstractSet[str]) -> t.List[str]:
+        """Forget the parsers loaded from the changed snapshots."""
+        with self.lock:
+            affected = [
+                name
+                for name, dependencies in self.module_dependencies.items()
+                if any(os.path.realpath(path) in changed_files for path in dependencies)
+            ]
+            for key in [key for key in self.parsers if key[0] in affected]:
+                del self.parsers[key]
+        return affected
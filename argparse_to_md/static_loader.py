@@ -0,0 +1,357 @@
+import argparse
+import ast
+import builtins
+import importlib.machinery
+import os
+import sys
+import typing as t
+
+from .loader import FunctionLoader
+
+# Methods of argparse objects which can be replayed during static evaluation
+_ALLOWED_METHODS = {
+    "add_argument",
+    "add_argument_group",
+    "add_mutually_exclusive_group",
+    "add_subparsers",
+    "add_parser",
+    "set_defaults",
+}
+
+# Keyword arguments of add_argument which don't affect the generated help text.
+# If their values can't be resolved statically, they are simply dropped.
+_IGNORABLE_KWARGS = {"type", "default", "const"}
+
+# Builtins which are safe to evaluate and are commonly used when building parsers
+_SAFE_BUILTINS: t.Dict[str, t.Any] = {
+    name: getattr(builtins, name) for name in ("list", "tuple", "dict", "sorted", "str", "int", "float", "bool")
+}
+
+# Limit on nested calls of helper functions defined in the module
+_MAX_CALL_DEPTH = 16
+
+
+class _Unresolvable(Exception):
+    pass
+
+
+class _Return(Exception):
+    def __init__(self, value: t.Any):
+        self.value = value
+
+
+class _ModuleEvaluator:
+    """
+    Evaluates a parser factory function by interpreting the subset of Python used to build argparse parsers.
+
+    Calls on argparse objects are replayed on real argparse objects, so the result is an ordinary
+    ArgumentParser. Anything outside of the supported subset raises _Unresolvable.
+    """
+
+    def __init__(self, tree: ast.Module):
+        self.argparse_names: t.Set[str] = set()
+        self.imported_names: t.Dict[str, t.Any] = {}
+        self.functions: t.Dict[str, ast.FunctionDef] = {}
+        self.constants: t.Dict[str, ast.expr] = {}
+        self.depth = 0
+
+        # Module-level names whose value can't be known without running the module: names bound more than once,
+        # mutated, or used by the module-level statements which aren't modeled (e.g. "CHOICES.append(...)",
+        # "HELP += ...", if/try/for blocks). Looking them up raises _Unresolvable, so that the module is imported.
+        unresolvable: t.Set[str] = set()
+        bound: t.Set[str] = set()
+        for node in tree.body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                self._handle_import(node, self.imported_names)
+                names = [(alias.asname or alias.name).partition(".")[0] for alias in node.names]
+            elif isinstance(node, ast.FunctionDef):
+                self.functions[node.name] = node
+                names = [node.name]
+            elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                # Evaluated lazily, only if the name is used
+                self.constants[node.targets[0].id] = node.value
+                names = [node.targets[0].id]
+            elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant):
+                continue  # docstring
+            else:
+                unresolvable.update(n.id for n in ast.walk(node) if isinstance(n, ast.Name))
+                continue
+            unresolvable.update(bound.intersection(names))
+            bound.update(names)
+
+        # Module-level names mutated or rebound from within the functions, which may be called during the import
+        for child in ast.walk(tree):
+            if isinstance(child, ast.Global):
+                unresolvable.update(child.names)
+            elif isinstance(child, ast.Call) and isinstance(child.func, ast.Attribute):
+                receiver = child.func.value
+                if isinstance(receiver, ast.Name) and receiver.id in self.constants:
+                    unresolvable.add(receiver.id)
+            elif isinstance(child, (ast.Assign, ast.AugAssign, ast.AnnAssign, ast.Delete)):
+                targets = child.targets if isinstance(child, (ast.Assign, ast.Delete)) else [child.target]
+                for target in targets:
+                    if isinstance(target, (ast.Subscript, ast.Attribute)) and isinstance(target.value, ast.Name):
+                        unresolvable.add(target.value.id)
+                    elif isinstance(child, ast.AugAssign) and isinstance(target, ast.Name):
+                        unresolvable.add(target.id)
+
+        for name in unresolvable:
+            self.argparse_names.discard(name)
+            self.imported_names.pop(name, None)
+            self.functions.pop(name, None)
+            self.constants.pop(name, None)
+
+    def _handle_import(self, node: t.Union[ast.Import, ast.ImportFrom], env: t.Dict[str, t.Any]) -> None:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == "argparse":
+                    self.argparse_names.add(alias.asname or alias.name)
+        elif node.module == "argparse" and node.level == 0:
+            for alias in node.names:
+                if alias.name == "*":
+                    continue
+                value = getattr(argparse, alias.name, None)
+                if value is not None:
+                    env[alias.asname or alias.name] = value
+
+    def call_function(self, name: str, args: t.List[t.Any], kwargs: t.Dict[str, t.Any]) -> t.Any:
+        func = self.functions.get(name)
+        if func is None:
+            raise _Unresolvable(f"function {name} not found")
+        if func.decorator_list or func.args.vararg or func.args.kwarg or func.args.kwonlyargs:
+            raise _Unresolvable(f"unsupported signature of {name}")
+        if self.depth >= _MAX_CALL_DEPTH:
+            raise _Unresolvable("call depth limit reached")
+
+        params = [a.arg for a in func.args.posonlyargs + func.args.args]
+        if len(args) > len(params):
+            raise _Unresolvable(f"too many arguments for {name}")
+        env: t.Dict[str, t.Any] = dict(zip(params, args))
+        for key, value in kwargs.items():
+            if key not in params or key in env:
+                raise _Unresolvable(f"unexpected argument {key} for {name}")
+            env[key] = value
+        defaults = func.args.defaults
+        for param, default in zip(params[len(params) - len(defaults) :], defaults):
+            if param not in env:
+                env[param] = self.eval_expr(default, {})
+        if len(env) != len(params):
+            raise _Unresolvable(f"missing arguments for {name}")
+
+        self.depth += 1
+        try:
+            self.exec_body(func.body, env)
+        except _Return as ret:
+            return ret.value
+        finally:
+            self.depth -= 1
+        return None
+
+    def exec_body(self, body: t.List[ast.stmt], env: t.Dict[str, t.Any]) -> None:
+        for stmt in body:
+            if isinstance(stmt, ast.Expr):
+                if isinstance(stmt.value, ast.Constant) and isinstance(stmt.value.value, str):
+                    continue  # docstring
+                self.eval_expr(stmt.value, env)
+            elif isinstance(stmt, ast.Assign):
+                value = self.eval_expr(stmt.value, env)
+                for target in stmt.targets:
+                    self._assign(target, value, env)
+            elif isinstance(stmt, ast.AnnAssign) and stmt.value is not None:
+                self._assign(stmt.target, self.eval_expr(stmt.value, env), env)
+            elif isinstance(stmt, ast.Return):
+                raise _Return(self.eval_expr(stmt.value, env) if stmt.value is not None else None)
+            elif isinstance(stmt, ast.For) and not stmt.orelse:
+                for item in self.eval_expr(stmt.iter, env):
+                    self._assign(stmt.target, item, env)
+                    self.exec_body(stmt.body, env)
+            elif isinstance(stmt, (ast.Import, ast.ImportFrom)):
+                self._handle_import(stmt, env)
+            elif isinstance(stmt, ast.Pass):
+                continue
+            else:
+                raise _Unresolvable(f"unsupported statement {type(stmt).__name__} at line {stmt.lineno}")
+
+    def _assign(self, target: ast.expr, value: t.Any, env: t.Dict[str, t.Any]) -> None:
+        if isinstance(target, ast.Name):
+            env[target.id] = value
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            values = list(value)
+            if len(values) != len(target.elts):
+                raise _Unresolvable("unpacking mismatch")
+            for elt, item in zip(target.elts, values):
+                self._assign(elt, item, env)
+        else:
+            raise _Unresolvable(f"unsupported assignment target {type(target).__name__}")
+
+    def eval_expr(self, node: ast.expr, env: t.Dict[str, t.Any]) -> t.Any:
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            return self._lookup(node.id, env)
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            items = [self.eval_expr(elt, env) for elt in node.elts]
+            if isinstance(node, ast.Tuple):
+                return tuple(items)
+            return set(items) if isinstance(node, ast.Set) else items
+        if isinstance(node, ast.Dict):
+            result = {}
+            for key, value in zip(node.keys, node.values):
+                if key is None:
+                    raise _Unresolvable("dict unpacking is not supported")
+                result[self.eval_expr(key, env)] = self.eval_expr(value, env)
+            return result
+        if isinstance(node, ast.JoinedStr):
+            return "".join(self._eval_fstring_part(part, env) for part in node.values)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Mod)):
+            left = self.eval_expr(node.left, env)
+            right = self.eval_expr(node.right, env)
+            if not isinstance(left, (str, int, list, tuple)):
+                raise _Unresolvable("unsupported operand")
+            return left + right if isinstance(node.op, ast.Add) else left % right
+        if isinstance(node, ast.Attribute):
+            if isinstance(node.value, ast.Name) and node.value.id in self.argparse_names and node.value.id not in env:
+                try:
+                    return getattr(argparse, node.attr)
+                except AttributeError:
+                    raise _Unresolvable(f"argparse.{node.attr}")
+            raise _Unresolvable(f"attribute {node.attr} at line {node.lineno}")
+        if isinstance(node, ast.Call):
+            return self._eval_call(node, env)
+        raise _Unresolvable(f"unsupported expression {type(node).__name__} at line {node.lineno}")
+
+    def _eval_fstring_part(self, node: ast.expr, env: t.Dict[str, t.Any]) -> str:
+        if isinstance(node, ast.Constant):
+            return str(node.value)
+        if isinstance(node, ast.FormattedValue) and node.format_spec is None and node.conversion == -1:
+            return str(self.eval_expr(node.value, env))
+        raise _Unresolvable("unsupported f-string")
+
+    def _lookup(self, name: str, env: t.Dict[str, t.Any]) -> t.Any:
+        if name in env:
+            return env[name]
+        if name in self.imported_names:
+            return self.imported_names[name]
+        if name in self.constants:
+            return self.eval_expr(self.constants[name], {})
+        if name in _SAFE_BUILTINS:
+            return _SAFE_BUILTINS[name]
+        raise _Unresolvable(f"name {name}")
+
+    def _eval_call(self, node: ast.Call, env: t.Dict[str, t.Any]) -> t.Any:
+        if any(isinstance(arg, ast.Starred) for arg in node.args) or any(kw.arg is None for kw in node.keywords):
+            raise _Unresolvable(f"argument unpacking at line {node.lineno}")
+
+        func = node.func
+        if isinstance(func, ast.Attribute) and not (
+            isinstance(func.value, ast.Name) and func.value.id in self.argparse_names and func.value.id not in env
+        ):
+            # Method call on an object built during evaluation
+            receiver = self.eval_expr(func.value, env)
+            if not isinstance(
+                receiver,
+                (argparse._ActionsContainer, argparse._SubParsersAction),  # pylint: disable=protected-access
+            ):
+                raise _Unresolvable(f"call on {type(receiver).__name__} at line {node.lineno}")
+            if func.attr not in _ALLOWED_METHODS:
+                raise _Unresolvable(f"method {func.attr} at line {node.lineno}")
+            args = [self.eval_expr(arg, env) for arg in node.args]
+            kwargs = self._eval_kwargs(node, env, lenient=func.attr == "add_argument")
+            return self._invoke(getattr(receiver, func.attr), args, kwargs)
+
+        if isinstance(func, ast.Name) and func.id in self.functions and func.id not in env:
+            args = [self.eval_expr(arg, env) for arg in node.args]
+            return self.call_function(func.id, args, self._eval_kwargs(node, env, lenient=False))
+
+        callee = self.eval_expr(func, env)
+        if isinstance(callee, type) and issubclass(callee, argparse.ArgumentParser):
+            args = [self.eval_expr(arg, env) for arg in node.args]
+            return self._invoke(callee, args, self._eval_kwargs(node, env, lenient=False))
+        if any(callee is builtin for builtin in _SAFE_BUILTINS.values()):
+            args = [self.eval_expr(arg, env) for arg in node.args]
+            return self._invoke(callee, args, self._eval_kwargs(node, env, lenient=False))
+        raise _Unresolvable(f"call at line {node.lineno}")
+
+    def _eval_kwargs(self, node: ast.Call, env: t.Dict[str, t.Any], lenient: bool) -> t.Dict[str, t.Any]:
+        kwargs = {}
+        for kw in node.keywords:
+            assert kw.arg is not None
+            try:
+                kwargs[kw.arg] = self.eval_expr(kw.value, env)
+            except _Unresolvable:
+                if lenient and kw.arg in _IGNORABLE_KWARGS:
+                    continue
+                raise
+        return kwargs
+
+    @staticmethod
+    def _invoke(callee: t.Callable, args: t.List[t.Any], kwargs: t.Dict[str, t.Any]) -> t.Any:
+        try:
+            return callee(*args, **kwargs)
+        except (TypeError, ValueError, argparse.ArgumentError) as e:
+            raise _Unresolvable(str(e))
+
+
+class StaticFunctionLoader(FunctionLoader):
+    """
+    FunctionLoader which builds the parser from the source code of the module, without importing it.
+
+    The factory function is evaluated symbolically, supporting the usual ArgumentParser construction patterns:
+    ArgumentParser(...), add_argument, add_argument_group, add_mutually_exclusive_group, add_subparsers and
+    add_parser, as well as calls of helper functions defined in the same module.
+    If the module can't be fully resolved this way, the module is imported as usual.
+    """
+
+    def load_function(self, module_name: str, function_name: str, cwd: t.Optional[str] = None) -> t.Any:
+        if module_name in self.modules_imported:
+            return super().load_function(module_name, function_name, cwd)
+
+        source_path = self.find_module_source(module_name, cwd)
+        if source_path is not None:
+            try:
+                parser = self._evaluate(source_path, function_name)
+            except (_Unresolvable, SyntaxError, ValueError, UnicodeDecodeError, RecursionError):
+                pass
+            else:
+                self.module_dependencies[module_name] = [source_path]
+
+                def factory() -> argparse.ArgumentParser:
+                    return parser
+
+                return factory
+
+        return super().load_function(module_name, function_name, cwd)
+
+    def find_module_source(self, module_name: str, cwd: t.Optional[str] = None) -> t.Optional[str]:
+        """
+        Locate the source file of a module without importing it or its parent packages.
+
+        The directories are searched in the same order as when the module is imported: sys.path first,
+        then cwd and the extra paths, which the loader appends to sys.path.
+        """
+        search_path = sys.path + ([cwd] if cwd is not None else []) + self.extra_sys_path
+        spec = None
+        parts = module_name.split(".")
+        for i, part in enumerate(parts):
+            # Only the last component of the name determines the file to look for. Passing the full dotted name
+            # would make namespace packages look up their parent package in sys.modules, which isn't imported.
+            spec = importlib.machinery.PathFinder.find_spec(part, search_path)
+            if spec is None:
+                return None
+            if i + 1 < len(parts):
+                if spec.submodule_search_locations is None:
+                    return None
+                search_path = list(spec.submodule_search_locations)
+        if spec is None or spec.origin is None or not spec.origin.endswith(".py"):
+            return None
+        return os.path.realpath(spec.origin)
+
+    @staticmethod
+    def _evaluate(source_path: str, function_name: str) -> argparse.ArgumentParser:
+        # Parse the bytes, so that the source encoding declared in the module (PEP 263) is honored
+        with open(source_path, "rb") as f:
+            tree = ast.parse(f.read(), filename=source_path)
+        parser = _ModuleEvaluator(tree).call_function(function_name, [], {})
+        if not isinstance(parser, argparse.ArgumentParser):
+            raise _Unresolvable(f"{function_name} did not return an ArgumentParser")
+        return parser
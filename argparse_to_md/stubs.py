@@ -0,0 +1,233 @@
+import ast
+import contextlib
+import functools
+import importlib.abc
+import importlib.machinery
+import os
+import sys
+import types
+import typing as t
+
+
+class Stub:
+    """
+    Placeholder for any object of a module which isn't available.
+
+    Attribute access, calls and subscripts return other stubs, so that module-level code using the missing module
+    (constants, decorators, base classes, type annotations) keeps working. Unlike MagicMock, stubs don't record
+    how they are used, and each attribute is created once and then stored as a plain instance attribute.
+    """
+
+    # Stored in the instance __dict__, declared for the type checkers
+    _stub_name: str
+
+    def __init__(self, name: str):
+        self.__dict__["_stub_name"] = name
+
+    def __getattr__(self, name: str) -> "Stub":
+        if name.startswith("__") and name.endswith("__"):
+            # Don't pretend to implement protocols and special attributes, e.g. __wrapped__ or __fspath__
+            raise AttributeError(name)
+        child = Stub(f"{self._stub_name}.{name}")
+        self.__dict__[name] = child
+        return child
+
+    def __call__(self, *args: t.Any, **kwargs: t.Any) -> "Stub":
+        return self.__getattr__("_stub_call_result")
+
+    def __getitem__(self, key: t.Any) -> "Stub":
+        return self
+
+    def _operator(self, *args: t.Any) -> "Stub":
+        return self
+
+    # Expressions like "missing.LIMIT + 1" or "missing.A | missing.B" (flags, type annotations)
+    __add__ = __radd__ = __sub__ = __rsub__ = __mul__ = __rmul__ = _operator
+    __truediv__ = __rtruediv__ = __floordiv__ = __rfloordiv__ = __mod__ = __rmod__ = _operator
+    __or__ = __ror__ = __and__ = __rand__ = __xor__ = __rxor__ = __neg__ = __invert__ = _operator
+
+    def __iter__(self) -> t.Iterator[t.Any]:
+        return iter(())
+
+    def __len__(self) -> int:
+        return 0
+
+    def __bool__(self) -> bool:
+        return True
+
+    def __contains__(self, item: t.Any) -> bool:
+        return False
+
+    def __enter__(self) -> "Stub":
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        pass
+
+    def __mro_entries__(self, bases: t.Tuple[t.Any, ...]) -> t.Tuple[type, ...]:
+        # Allows using the stub as a base class: "class Command(missing.Base): ..."
+        if "_stub_class" not in self.__dict__:
+            class_name: str = self._stub_name.rpartition(".")[2]
+            class_bases: t.Tuple[type, ...] = ()
+            namespace: t.Dict[str, t.Any] = {}
+            self.__dict__["_stub_class"] = type(class_name, class_bases, namespace)
+        return (self.__dict__["_stub_class"],)
+
+    def __repr__(self) -> str:
+        return f"<stub {self._stub_name}>"
+
+
+class StubModule(types.ModuleType):
+    """Module which returns a Stub for any attribute, and contains stub submodules."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__path__: t.List[str] = []
+        self.__file__ = None
+
+    def __getattr__(self, name: str) -> Stub:
+        if name.startswith("__") and name.endswith("__"):
+            raise AttributeError(name)
+        child = Stub(f"{self.__name__}.{name}")
+        setattr(self, name, child)
+        return child
+
+
+class StubFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """
+    Import hook which provides StubModules instead of the modules which can't be imported.
+
+    :param prefixes: Modules (along with their submodules) to replace with stubs.
+    :param names: Names of modules which are known to be missing.
+    :param project_roots: Directories with the code being documented. Missing modules imported directly by the files
+        in these directories are replaced with stubs on the first attempt, unless the import is within a try block
+        handling ImportError. Other code, e.g. third party packages, often handles missing optional dependencies
+        itself, so it gets the usual error.
+    :param excluded: Modules which must never be replaced, e.g. the module being loaded and its parent packages.
+    """
+
+    def __init__(
+        self,
+        prefixes: t.Sequence[str] = (),
+        names: t.AbstractSet[str] = frozenset(),
+        project_roots: t.Sequence[str] = (),
+        excluded: t.AbstractSet[str] = frozenset(),
+    ):
+        self.prefixes = tuple(prefixes)
+        self.names = names
+        self.project_roots = [os.path.realpath(root) for root in project_roots]
+        self.excluded = excluded
+        # Names of the stub modules created, in the order of creation
+        self.created: t.List[str] = []
+
+    def find_spec(
+        self, fullname: str, path: t.Optional[t.Sequence[str]], target: t.Optional[types.ModuleType] = None
+    ) -> t.Optional[importlib.machinery.ModuleSpec]:
+        if fullname in self.excluded or not self._should_stub(fullname):
+            return None
+        return importlib.machinery.ModuleSpec(fullname, self, is_package=True)
+
+    def create_module(self, spec: importlib.machinery.ModuleSpec) -> types.ModuleType:
+        self.created.append(spec.name)
+        return StubModule(spec.name)
+
+    def exec_module(self, module: types.ModuleType) -> None:
+        pass
+
+    def _should_stub(self, fullname: str) -> bool:
+        if fullname in self.names or any(fullname == p or fullname.startswith(p + ".") for p in self.prefixes):
+            return True
+        parent_name = fullname.rpartition(".")[0]
+        if parent_name and isinstance(sys.modules.get(parent_name), StubModule):
+            return True
+        return bool(self.project_roots) and self._imported_by_project_file()
+
+    def _imported_by_project_file(self) -> bool:
+        # Find the frame which executes the import statement, skipping this module and the import machinery
+        frame: t.Optional[types.FrameType] = sys._getframe(1)
+        while frame is not None and _is_import_machinery(frame.f_globals.get("__name__", "")):
+            frame = frame.f_back
+        if frame is None:
+            return False
+        importer_file = frame.f_globals.get("__file__")
+        if not isinstance(importer_file, str):
+            return False
+        importer_file = os.path.realpath(importer_file)
+        if "site-packages" in importer_file.split(os.sep) or "dist-packages" in importer_file.split(os.sep):
+            return False
+        if not any(importer_file.startswith(root + os.sep) for root in self.project_roots):
+            return False
+        try:
+            # The modification time is part of the cache key, files may change in watch mode
+            guarded_lines = _guarded_lines(importer_file, os.stat(importer_file).st_mtime_ns)
+        except OSError:
+            guarded_lines = frozenset()
+        return frame.f_lineno not in guarded_lines
+
+
+_IMPORT_ERRORS = ("ImportError", "ModuleNotFoundError", "Exception", "BaseException")
+
+
+@functools.lru_cache(maxsize=None)
+def _guarded_lines(path: str, mtime_ns: int) -> t.FrozenSet[int]:
+    """Return the numbers of the lines in try blocks which handle ImportError."""
+    try:
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read(), path)
+    except (OSError, SyntaxError, ValueError):
+        return frozenset()
+    lines: t.Set[int] = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Try) or not any(_handles_import_error(h) for h in node.handlers):
+            continue
+        for statement in node.body:
+            lines.update(range(statement.lineno, (statement.end_lineno or statement.lineno) + 1))
+    return frozenset(lines)
+
+
+def _handles_import_error(handler: ast.ExceptHandler) -> bool:
+    if handler.type is None:
+        return True
+    types_ = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+    for type_ in types_:
+        name = type_.attr if isinstance(type_, ast.Attribute) else getattr(type_, "id", None)
+        if name in _IMPORT_ERRORS:
+            return True
+    return False
+
+
+def _is_import_machinery(module_name: str) -> bool:
+    return module_name in (__name__, "importlib") or module_name.startswith(("importlib.", "_frozen_importlib"))
+
+
+@contextlib.contextmanager
+def stub_imports(
+    prefixes: t.Sequence[str] = (),
+    names: t.AbstractSet[str] = frozenset(),
+    project_roots: t.Sequence[str] = (),
+    excluded: t.AbstractSet[str] = frozenset(),
+) -> t.Iterator[StubFinder]:
+    """
+    Context manager which installs a StubFinder for the duration of the block.
+
+    Modules matching the prefixes are replaced even if they are installed, unless they were imported before.
+    Stub modules are removed from sys.modules at the end of the block, so they don't affect later imports;
+    modules imported within the block keep references to them. Arguments are the same as for StubFinder.
+    """
+    missing_finder = StubFinder((), names, project_roots, excluded)
+    finders = [missing_finder]
+    # Configured modules have to be replaced before the regular finders find them,
+    # missing modules are only replaced after the regular finders failed to find them.
+    sys.meta_path.append(missing_finder)
+    if prefixes:
+        prefix_finder = StubFinder(prefixes, excluded=excluded)
+        finders.append(prefix_finder)
+        sys.meta_path.insert(0, prefix_finder)
+    try:
+        yield missing_finder
+    finally:
+        for finder in finders:
+            sys.meta_path.remove(finder)
+        for name in [name for finder in finders for name in finder.created]:
+            if isinstance(sys.modules.get(name), StubModule):
+                del sys.modules[name]
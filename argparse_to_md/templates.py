@@ -0,0 +1,90 @@
+"""
+Templates of the markdown output fragments: the usage section of a parser, an argument group and an argument.
+
+Templates use the str.format field syntax ("{name}", with "{{" and "}}" for literal braces), without conversions,
+format specs or attribute access. Each template is parsed and checked once, into a sequence of literal strings
+and field names, and rendering only joins these with the values of the fields.
+"""
+
+import functools
+import os
+import string
+import typing as t
+
+# Fields available in each kind of template
+USAGE_FIELDS = frozenset({"heading", "label", "command", "usage", "description"})
+GROUP_FIELDS = frozenset({"title", "actions"})
+ACTION_FIELDS = frozenset({"invocation", "invocations", "option_strings", "dest", "metavar", "choices", "help"})
+
+FIELDS = {"usage": USAGE_FIELDS, "group": GROUP_FIELDS, "action": ACTION_FIELDS}
+
+
+class Template:
+    """Compiled template, see compile_template."""
+
+    __slots__ = ("name", "fields", "_parts")
+
+    def __init__(self, name: str, parts: t.Sequence[t.Tuple[str, t.Optional[str]]]):
+        self.name = name
+        self._parts = tuple(parts)
+        self.fields = frozenset(field for _, field in self._parts if field is not None)
+
+    def render_into(self, out: t.List[str], values: t.Mapping[str, str]) -> None:
+        """Append the rendered template to the list of strings, to be joined by the caller."""
+        for literal, field in self._parts:
+            if literal:
+                out.append(literal)
+            if field is not None:
+                out.append(values[field])
+
+    def render(self, values: t.Mapping[str, str]) -> str:
+        out: t.List[str] = []
+        self.render_into(out, values)
+        return "".join(out)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_template(text: str, kind: str, name: str = "<template>") -> Template:
+    """
+    Parse the template text and check that it only uses the fields available for its kind.
+
+    Compiled templates are cached, so each distinct template is parsed once per run.
+
+    :param text: Template text.
+    :param kind: "usage", "group" or "action".
+    :param name: Name of the template (e.g. the file path) used in the error messages.
+    :return: Compiled template.
+    :raises ValueError: If the template is malformed or uses unknown fields.
+    """
+    available = FIELDS[kind]
+    parts = []
+    try:
+        parsed = list(string.Formatter().parse(text))
+    except ValueError as e:
+        raise ValueError(f"Invalid {kind} template {name}: {e}") from None
+    for literal, field, format_spec, conversion in parsed:
+        if field is not None and (format_spec or conversion):
+            raise ValueError(f"Invalid {kind} template {name}: conversions and format specs are not supported")
+        if field is not None and field not in available:
+            raise ValueError(
+                f"Unknown field '{{{field}}}' in {kind} template {name}. "
+                f"Available fields: {', '.join(sorted(available))}"
+            )
+        parts.append((literal, field))
+    return Template(name, parts)
+
+
+@functools.lru_cache(maxsize=None)
+def _read_template(path: str, kind: str, mtime_ns: int) -> Template:
+    with open(path, encoding="utf-8") as f:
+        return compile_template(f.read(), kind, path)
+
+
+def load_template(path: str, kind: str) -> Template:
+    """
+    Load and compile the template file. The file is read again only if it has changed since the last call.
+
+    :raises OSError: If the file can't be read.
+    :raises ValueError: If the template is invalid.
+    """
+    return _read_template(path, kind, os.stat(path).st_mtime_ns)
@@ -0,0 +1,49 @@
+import os
+import typing as t
+
+
+def _file_state(path: str) -> t.Optional[t.Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class FileWatcher:
+    """
+    Detects changes of a set of files by polling their modification time and size.
+
+    Polling only needs one stat call per file, which is cheap for the number of files a parser usually depends on,
+    and works the same way on all platforms without extra dependencies.
+    """
+
+    def __init__(self) -> None:
+        self._states: t.Dict[str, t.Optional[t.Tuple[int, int]]] = {}
+
+    @property
+    def paths(self) -> t.List[str]:
+        return list(self._states)
+
+    def add(self, paths: t.Iterable[str]) -> None:
+        """Start watching the given files. Files which are already watched are not affected."""
+        for path in paths:
+            path = os.path.realpath(path)
+            if path not in self._states:
+                self._states[path] = _file_state(path)
+
+    def update(self, paths: t.Iterable[str]) -> None:
+        """Record the current state of the given files, e.g. after writing them, so that it isn't reported."""
+        for path in paths:
+            path = os.path.realpath(path)
+            self._states[path] = _file_state(path)
+
+    def poll(self) -> t.Set[str]:
+        """Return the real paths of the files which have changed, been created or removed since the last poll."""
+        changed = set()
+        for path, state in self._states.items():
+            new_state = _file_state(path)
+            if new_state != state:
+                self._states[path] = new_state
+                changed.add(path)
+        return changed
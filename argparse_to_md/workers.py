@@ -0,0 +1,72 @@
+import functools
+import multiprocessing
+import typing as t
+from multiprocessing.pool import AsyncResult
+
+from .loader import FunctionLoader
+from .model import ParserModel
+
+
+def _load_parser_description(
+    loader_class: t.Type[FunctionLoader],
+    extra_sys_path: t.List[str],
+    module_name: str,
+    function_name: str,
+    cwd: t.Optional[str],
+    stub_modules: t.List[str],
+) -> t.Tuple[t.Dict[str, t.Any], t.List[str]]:
+    # Runs in a worker process
+    loader = loader_class(extra_sys_path, stub_modules=stub_modules)
+    parser = loader.load_function(module_name, function_name, cwd)()
+    return ParserModel.from_parser(parser).to_dict(), loader.get_dependencies(module_name)
+
+
+class PooledFunctionLoader(FunctionLoader):
+    """
+    FunctionLoader which imports the modules and calls the parser factories in worker processes.
+
+    Each factory is loaded in a fresh process, so the import side effects of one module don't affect the others.
+    The workers send back the parser model in its dict form, the factories returned by load_function
+    return the ParserModel. Use prefetch to start loading the functions in parallel before they are needed.
+    """
+
+    def __init__(
+        self,
+        extra_sys_path: t.Optional[t.List[str]] = None,
+        jobs: t.Optional[int] = None,
+        loader_class: t.Type[FunctionLoader] = FunctionLoader,
+        memoize: bool = True,
+        stub_modules: t.Sequence[str] = (),
+    ):
+        super().__init__(extra_sys_path, memoize, stub_modules)
+        self.loader_class = loader_class
+        # "spawn" gives each worker a clean interpreter, regardless of the platform default
+        self._pool = multiprocessing.get_context("spawn").Pool(jobs, maxtasksperchild=1)
+        self._results: t.Dict[t.Tuple[str, str, t.Optional[str]], AsyncResult] = {}
+
+    def prefetch(self, module_name: str, function_name: str, cwd: t.Optional[str] = None) -> None:
+        key = (module_name, function_name, cwd)
+        with self.lock:
+            if key not in self._results:
+                self._results[key] = self._pool.apply_async(
+                    _load_parser_description,
+                    (self.loader_class, self.extra_sys_path, module_name, function_name, cwd, self.stub_modules),
+                )
+
+    def load_function(self, module_name: str, function_name: str, cwd: t.Optional[str] = None) -> t.Any:
+        self.prefetch(module_name, function_name, cwd)
+        description, dependencies = self._results[(module_name, function_name, cwd)].get()
+        self.module_dependencies[module_name] = dependencies
+        return functools.partial(ParserModel.from_dict, description)
+
+    def close(self) -> None:
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self) -> "PooledFunctionLoader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            self._pool.terminate()
+        self.close()
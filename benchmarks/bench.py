@@ -0,0 +1,257 @@
+"""
+Benchmarks of argparse_to_md formatting and markdown processing on synthetic, very large parsers.
+
+Usage:
+    python benchmarks/bench.py run [--scale SCALE] [--repeat N] [-o results.json]
+    python benchmarks/bench.py compare baseline.json results.json [--threshold 0.2]
+"""
+
+import argparse
+import atexit
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+import typing as t
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from argparse_to_md.discovery import find_input_files  # noqa: E402
+from argparse_to_md.formatter import (  # noqa: E402
+    HELP_WIDTH,
+    MarkdownHelpFormatterOptions,
+    _format_action_md,
+    _wrap_usage_line,
+    gen_argparse_help,
+)
+from argparse_to_md.loader import FunctionLoader  # noqa: E402
+from argparse_to_md.markdown_processor import process_markdown  # noqa: E402
+from argparse_to_md.model import ParserModel, _build_usage_parts  # noqa: E402
+
+# --- synthetic parsers ---
+
+
+def make_wide_parser(n_options: int) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="wide", description="Parser with many options")
+    for i in range(n_options):
+        if i % 3 == 0:
+            parser.add_argument(f"--flag-{i}", action="store_true", help=f"flag number {i}")
+        elif i % 3 == 1:
+            parser.add_argument(f"-o{i}", f"--option-{i}", metavar="VALUE", help=f"option number {i}")
+        else:
+            parser.add_argument(f"--list-{i}", nargs="+", action="extend", help=f"list option number {i}")
+    for i in range(n_options // 10):
+        parser.add_argument(f"positional_{i}", nargs="?", help=f"positional number {i}")
+    return parser
+
+
+def make_mutex_parser(n_options: int) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="mutex")
+    for g in range(4):
+        group = parser.add_mutually_exclusive_group(required=g % 2 == 0)
+        for i in range(n_options // 4):
+            group.add_argument(f"--group{g}-option-{i}", help=f"option {i} of group {g}")
+    return parser
+
+
+def make_subcommand_parser(n_subcommands: int, n_options: int) -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    for i in range(n_options):
+        common.add_argument(f"--common-{i}", help=f"common option {i}")
+    parser = argparse.ArgumentParser(prog="tree", parents=[common])
+    subparsers = parser.add_subparsers(dest="command", help="command to run")
+    for i in range(n_subcommands):
+        sub = subparsers.add_parser(f"command-{i}", parents=[common], description=f"command number {i}")
+        sub.add_argument("target", help="target of the command")
+    return parser
+
+
+def make_choices_parser(n_choices: int) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="choices")
+    parser.add_argument("--target", choices=[f"choice-{i}" for i in range(n_choices)], help="target")
+    parser.add_argument("mode", choices=[f"mode-{i}" for i in range(n_choices)], help="mode")
+    return parser
+
+
+def make_markdown(n_blocks: int, filler_lines: int) -> str:
+    parts = []
+    for i in range(n_blocks):
+        parts.append("Some text about the tool, without any markers in it.\n" * filler_lines)
+        parts.append(f"<!--argparse_to_md:synthetic:parser_{i % 4}-->\n")
+        parts.append("stale content\n" * 10)
+        parts.append("<!--argparse_to_md_end-->\n")
+    return "".join(parts)
+
+
+def make_docs_tree(n_dirs: int, files_per_dir: int) -> str:
+    """Create a temporary docs tree where only a few files contain markers, return its path."""
+    root = tempfile.mkdtemp(prefix="argparse_to_md_bench_")
+    atexit.register(shutil.rmtree, root, ignore_errors=True)
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("node_modules/\n")
+    filler = "Some text about the tool, without any markers in it.\n" * 200
+    for d in range(n_dirs):
+        for subdir in (f"section-{d}", os.path.join("node_modules", f"package-{d}")):
+            os.makedirs(os.path.join(root, subdir))
+            for i in range(files_per_dir):
+                marker = "<!--argparse_to_md:synthetic:parser_0-->\n" if (d * files_per_dir + i) % 100 == 0 else ""
+                with open(os.path.join(root, subdir, f"page-{i}.md"), "w") as f:
+                    f.write(filler + marker)
+    return root
+
+
+class SyntheticLoader(FunctionLoader):
+    """Loader which returns the synthetic parser factories instead of importing modules."""
+
+    def __init__(self, factories: t.Dict[str, t.Callable[[], argparse.ArgumentParser]]):
+        super().__init__()
+        self.factories = factories
+
+    def load_function(self, module_name: str, function_name: str, cwd: t.Optional[str] = None) -> t.Any:
+        return self.factories[function_name]
+
+
+# --- benchmark cases ---
+
+
+def _usage_inputs(parser: argparse.ArgumentParser) -> t.Tuple[list, list]:
+    actions = parser._actions  # pylint: disable=protected-access
+    optionals = [a for a in actions if a.option_strings]
+    positionals = [a for a in actions if not a.option_strings]
+    return optionals + positionals, parser._mutually_exclusive_groups  # pylint: disable=protected-access
+
+
+def _is_selected(name: str, names: t.Optional[t.List[str]]) -> bool:
+    return not names or any(name.startswith(prefix) for prefix in names)
+
+
+def make_cases(scale: float, names: t.Optional[t.List[str]] = None) -> t.Dict[str, t.Callable[[], t.Any]]:
+    """
+    Return the benchmark cases, name -> function to time. Sizes are multiplied by scale.
+
+    If names are given, only the cases with names starting with one of them are returned, and the inputs which are
+    expensive to create (the docs tree on disk) are only created for these cases.
+    """
+
+    def n(value: int) -> int:
+        return max(1, int(value * scale))
+
+    wide = make_wide_parser(n(3000))
+    mutex = make_mutex_parser(n(2000))
+    tree = make_subcommand_parser(n(300), n(40))
+    choices = make_choices_parser(n(20000))
+    wide_actions, wide_mutex_groups = _usage_inputs(wide)
+    mutex_actions, mutex_groups = _usage_inputs(mutex)
+    wide_parts = _build_usage_parts(wide_actions, wide_mutex_groups)
+    options = MarkdownHelpFormatterOptions(subheading_level=2)
+
+    factories = {"parser_0": lambda: wide, "parser_1": lambda: mutex, "parser_2": lambda: tree}
+    factories["parser_3"] = lambda: choices
+    markdown = make_markdown(n(8), n(20000))
+
+    def extract_all(parser: argparse.ArgumentParser) -> ParserModel:
+        # Models of the subparsers are extracted when they are first used
+        model = ParserModel.from_parser(parser)
+        for _, subparser in model.subcommands:
+            subparser.actions
+        return model
+
+    def render(parser: argparse.ArgumentParser) -> t.Callable[[], None]:
+        return lambda: gen_argparse_help(parser, io.StringIO(), options)
+
+    def process() -> None:
+        # Fresh loader, so that memoized parsers don't hide the cost of the factories
+        process_markdown(io.StringIO(markdown), io.StringIO(), SyntheticLoader(factories))
+
+    cases = {
+        "build_usage_parts/wide": lambda: _build_usage_parts(wide_actions, wide_mutex_groups),
+        "build_usage_parts/mutex": lambda: _build_usage_parts(mutex_actions, mutex_groups),
+        "wrap_usage_line/wide": lambda: _wrap_usage_line(wide.prog, wide_parts, HELP_WIDTH),
+        "format_action_md/wide": lambda: [_format_action_md(a) for a in wide_actions],
+        "format_action_md/choices": lambda: [_format_action_md(a) for a in choices._actions],
+        "extract_model/tree": lambda: extract_all(tree),
+        "gen_argparse_help/wide": render(wide),
+        "gen_argparse_help/mutex": render(mutex),
+        "gen_argparse_help/tree": render(tree),
+        "gen_argparse_help/choices": render(choices),
+        "process_markdown/large": process,
+    }
+    if _is_selected("find_input_files/docs_tree", names):
+        docs_tree = make_docs_tree(n(100), n(30))
+        cases["find_input_files/docs_tree"] = lambda: find_input_files([docs_tree])
+    return {name: func for name, func in cases.items() if _is_selected(name, names)}
+
+
+def run_benchmarks(scale: float = 1.0, repeat: int = 5, names: t.Optional[t.List[str]] = None) -> t.Dict[str, t.Any]:
+    """Run the benchmarks, return the best time of each case in seconds along with the environment info."""
+    results = {}
+    for name, func in make_cases(scale, names).items():
+        results[name] = min(timeit.repeat(func, number=1, repeat=repeat))
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": scale,
+        "results": results,
+    }
+
+
+def compare_results(
+    baseline: t.Dict[str, t.Any], current: t.Dict[str, t.Any], threshold: float
+) -> t.List[t.Tuple[str, float, float, float]]:
+    """Return (name, baseline time, current time, ratio) for the cases which got slower by more than threshold."""
+    regressions = []
+    for name, current_time in current["results"].items():
+        baseline_time = baseline["results"].get(name)
+        if not baseline_time:
+            continue
+        ratio = current_time / baseline_time
+        if ratio > 1 + threshold:
+            regressions.append((name, baseline_time, current_time, ratio))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="bench.py", description="argparse_to_md benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--scale", type=float, default=1.0, help="multiplier for the size of the inputs")
+    run_parser.add_argument("--repeat", type=int, default=5, help="number of repetitions, the best time is used")
+    run_parser.add_argument("-k", "--select", nargs="+", help="only run the cases with names starting with these")
+    run_parser.add_argument("-o", "--output", help="JSON file to store the results in (e.g. the baseline)")
+    compare_parser = subparsers.add_parser("compare", help="compare results against a baseline")
+    compare_parser.add_argument("baseline", help="baseline results JSON file")
+    compare_parser.add_argument("current", help="current results JSON file")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.2, help="relative slowdown reported as a regression (default: 0.2)"
+    )
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_benchmarks(args.scale, args.repeat, args.select)
+        for name, seconds in results["results"].items():
+            print("%-28s %10.4f s" % (name, seconds))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline.get("scale") != current.get("scale"):
+        raise SystemExit("Results were obtained with different --scale values, can't compare them")
+    regressions = compare_results(baseline, current, args.threshold)
+    for name, baseline_time, current_time, ratio in regressions:
+        print("REGRESSION %-28s %10.4f s -> %10.4f s (x%.2f)" % (name, baseline_time, current_time, ratio))
+    if regressions:
+        raise SystemExit(1)
+    print("No regressions beyond %d%%" % (args.threshold * 100))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import textwrap
+from pathlib import Path
+
+from argparse_to_md.loader import FunctionLoader
+
+
+def write_cli_module(path: Path, help_text: str) -> None:
+    """Write a module with a get_parser factory, whose prog is the module name and --foo has the given help."""
+    path.write_text(
+        textwrap.dedent(
+            f"""
+            import argparse
+
+            def get_parser():
+                parser = argparse.ArgumentParser(prog="{path.stem}")
+                parser.add_argument("--foo", help="{help_text}")
+                return parser
+            """
+        )
+    )
+
+
+class FailingLoader(FunctionLoader):
+    """Loader for the tests which check that no module is imported."""
+
+    def load_function(self, module_name, function_name, cwd=None):
+        raise AssertionError(f"{module_name} should not be imported")
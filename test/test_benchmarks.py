@@ -0,0 +1,23 @@
+from benchmarks import bench
+from benchmarks.bench import compare_results, run_benchmarks
+
+
+def test_benchmarks_run_at_small_scale():
+    results = run_benchmarks(scale=0.01, repeat=1)
+    assert "gen_argparse_help/tree" in results["results"]
+    assert "process_markdown/large" in results["results"]
+    assert all(seconds > 0 for seconds in results["results"].values())
+
+
+def test_selected_cases_only_build_their_inputs(monkeypatch):
+    def fail(*args):
+        raise AssertionError("docs tree created for unselected cases")
+
+    monkeypatch.setattr(bench, "make_docs_tree", fail)
+    assert list(bench.make_cases(0.01, ["gen_argparse_help/tree"])) == ["gen_argparse_help/tree"]
+
+
+def test_compare_reports_regressions_beyond_threshold():
+    baseline = {"results": {"a": 1.0, "b": 1.0, "c": 1.0}}
+    current = {"results": {"a": 1.1, "b": 1.5, "new": 10.0}}
+    assert compare_results(baseline, current, threshold=0.2) == [("b", 1.0, 1.5, 1.5)]
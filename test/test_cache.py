@@ -0,0 +1,155 @@
+import io
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from argparse_to_md import cache as cache_module
+from argparse_to_md.cache import RenderCache
+from argparse_to_md.loader import FunctionLoader
+from argparse_to_md.markdown_processor import process_markdown
+
+from .helpers import FailingLoader, write_cli_module
+
+MARKDOWN = "Usage:\n<!--argparse_to_md:cached_cli:get_parser-->\n<!--argparse_to_md_end-->\n"
+
+
+def _process(md_path: Path, loader: FunctionLoader, cache: RenderCache) -> str:
+    out_md = io.StringIO()
+    with open(md_path) as in_md:
+        process_markdown(in_md, out_md, loader, cache)
+    return out_md.getvalue()
+
+
+def test_cache_hit_does_not_import(tmp_path):
+    write_cli_module(tmp_path / "cached_cli.py", "foo help")
+    md_path = tmp_path / "README.md"
+    md_path.write_text(MARKDOWN)
+    cache = RenderCache(str(tmp_path / "cache"))
+    try:
+        first = _process(md_path, FunctionLoader(), cache)
+    finally:
+        sys.modules.pop("cached_cli", None)
+    assert "`--foo FOO`: foo help" in first
+    assert (tmp_path / "cache" / ".gitignore").exists()
+
+    # A new RenderCache object, as in the next run
+    assert _process(md_path, FailingLoader(), RenderCache(str(tmp_path / "cache"))) == first
+
+
+def test_tool_files_are_hashed_once_and_not_tracked(tmp_path, monkeypatch):
+    hashed = []
+    hash_file = cache_module._hash_file
+
+    def record(path):
+        hashed.append(path)
+        return hash_file(path)
+
+    monkeypatch.setattr(cache_module, "_hash_file", record)
+    cache_module._tool_signature.cache_clear()
+    module_path = tmp_path / "cached_cli.py"
+    module_path.write_text("")
+    cache = RenderCache(str(tmp_path / "cache"))
+    for i in range(3):
+        key = RenderCache.make_key("cached_cli", f"get_parser_{i}", None, [str(tmp_path)])
+        cache.put(key, "output", [str(module_path)])
+    package_files = [path for path in hashed if path != str(module_path)]
+    assert package_files and len(package_files) == len(set(package_files))
+
+    # Entries only depend on the files of the documented modules
+    with open(os.path.join(tmp_path / "cache", key + ".json")) as f:
+        assert list(json.load(f)["dependencies"]) == [str(module_path)]
+
+
+def test_cache_invalidated_by_source_change(tmp_path):
+    module_path = tmp_path / "cached_cli.py"
+    write_cli_module(module_path, "foo help")
+    md_path = tmp_path / "README.md"
+    md_path.write_text(MARKDOWN)
+    cache = RenderCache(str(tmp_path / "cache"))
+    try:
+        _process(md_path, FunctionLoader(), cache)
+    finally:
+        sys.modules.pop("cached_cli", None)
+
+    write_cli_module(module_path, "new foo help")
+    try:
+        output = _process(md_path, FunctionLoader(), RenderCache(str(tmp_path / "cache")))
+    finally:
+        sys.modules.pop("cached_cli", None)
+    assert "`--foo FOO`: new foo help" in output
+
+
+def test_cache_prune(tmp_path):
+    dep = tmp_path / "dep.py"
+    dep.write_text("")
+    cache = RenderCache(str(tmp_path / "cache"), max_age=60)
+    cache.put("old", "old output", [str(dep)])
+    cache.put("new", "new output", [str(dep)])
+    old_entry = tmp_path / "cache" / "old.json"
+    os.utime(old_entry, (0, 0))
+
+    cache.prune()
+
+    assert not old_entry.exists()
+    assert cache.get("new") == "new output"
+
+
+def test_memoized_blocks_are_rendered_once(tmp_path):
+    write_cli_module(tmp_path / "cached_cli.py", "foo help")
+    md_path = tmp_path / "README.md"
+    md_path.write_text(MARKDOWN + MARKDOWN + MARKDOWN.replace("get_parser", "get_parser:subheading_level=2"))
+    calls = []
+
+    class CountingLoader(FunctionLoader):
+        def load_function(self, module_name, function_name, cwd=None):
+            factory = super().load_function(module_name, function_name, cwd)
+
+            def counting_factory():
+                calls.append(function_name)
+                return factory()
+
+            return counting_factory
+
+    try:
+        output = _process(md_path, CountingLoader(), RenderCache(None))
+        assert calls == ["get_parser"]
+        assert output.count("`--foo FOO`: foo help") == 3
+        assert "## Usage:" in output
+
+        calls.clear()
+        _process(md_path, CountingLoader(memoize=False), RenderCache(None, memoize=False))
+        assert calls == ["get_parser"] * 3
+    finally:
+        sys.modules.pop("cached_cli", None)
+
+
+def test_changed_files_regenerates_affected_blocks_only(tmp_path):
+    write_cli_module(tmp_path / "cached_cli.py", "foo help")
+    (tmp_path / "other_cli.py").write_text((tmp_path / "cached_cli.py").read_text().replace("foo help", "bar help"))
+    md_path = tmp_path / "README.md"
+    md_path.write_text(MARKDOWN + "Other:\n<!--argparse_to_md:other_cli:get_parser-->\n<!--argparse_to_md_end-->\n")
+
+    def run(*changed_files: str) -> None:
+        cmd = [sys.executable, "-m", "argparse_to_md", "-i", "README.md", "--cache-dir", "cache"]
+        if changed_files:
+            cmd += ["--changed-files", *changed_files]
+        env = dict(os.environ, PYTHONPATH=str(Path(__file__).parent.parent))
+        result = subprocess.run(cmd, cwd=tmp_path, env=env, text=True, capture_output=True)
+        assert result.returncode == 0, result.stderr
+
+    run()
+    assert (tmp_path / "cache" / "index.json").exists()
+
+    write_cli_module(tmp_path / "cached_cli.py", "new foo help")
+    (tmp_path / "other_cli.py").write_text((tmp_path / "other_cli.py").read_text().replace("bar help", "new bar help"))
+    # Only other_cli.py is reported as changed, so the block of cached_cli keeps its contents
+    run("other_cli.py")
+    output = md_path.read_text()
+    assert "`--foo FOO`: foo help" in output
+    assert "`--foo FOO`: new bar help" in output
+
+    # When the markdown file itself is changed, all of its blocks are regenerated
+    run("README.md")
+    assert "`--foo FOO`: new foo help" in md_path.read_text()
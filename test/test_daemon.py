@@ -0,0 +1,102 @@
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from argparse_to_md import __version__
+from argparse_to_md.daemon import Daemon
+from argparse_to_md.model import ParserModel
+from argparse_to_md.snapshots import snapshot_text
+
+MODULE_TEMPLATE = """
+import argparse
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog="served_cli")
+    parser.add_argument("--foo", help="{help}")
+    return parser
+"""
+
+MARKDOWN = "<!--argparse_to_md:served_cli:get_parser-->\n<!--argparse_to_md_end-->\n"
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="requires Unix sockets")
+
+
+def _run_client(cwd: Path, env: dict, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-m", "argparse_to_md.client", *args], cwd=cwd, env=env, text=True, capture_output=True
+    )
+
+
+def test_client_without_daemon_processes_in_process(tmp_path):
+    (tmp_path / "served_cli.py").write_text(MODULE_TEMPLATE.format(help="foo help"))
+    (tmp_path / "README.md").write_text(MARKDOWN)
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).parent.parent))
+
+    result = _run_client(tmp_path, env, "-i", "README.md", "--no-cache", "--check")
+    assert result.returncode == 2
+    assert "Changes required in README.md" in result.stderr
+
+
+def test_daemon_serves_requests_and_reloads_modules(tmp_path):
+    module_path = tmp_path / "served_cli.py"
+    module_path.write_text(MODULE_TEMPLATE.format(help="foo help"))
+    md_path = tmp_path / "README.md"
+    md_path.write_text(MARKDOWN)
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).parent.parent))
+    daemon_log = tmp_path / "daemon.log"
+
+    with open(daemon_log, "w") as log:
+        daemon = subprocess.Popen(
+            [sys.executable, "-m", "argparse_to_md", "--daemon", "--socket", "daemon.sock"],
+            cwd=tmp_path,
+            env=env,
+            stderr=log,
+        )
+    try:
+        deadline = time.monotonic() + 20
+        while not (tmp_path / "daemon.sock").exists():
+            assert time.monotonic() < deadline, daemon_log.read_text()
+            time.sleep(0.05)
+
+        result = _run_client(tmp_path, env, "--socket", "daemon.sock", "-i", "README.md", "--no-cache")
+        assert result.returncode == 0, result.stderr
+        assert "Updating README.md..." in result.stderr
+        assert "`--foo FOO`: foo help" in md_path.read_text()
+
+        result = _run_client(tmp_path, env, "--socket", "daemon.sock", "-i", "README.md", "--no-cache", "--check")
+        assert result.returncode == 0, result.stderr
+
+        module_path.write_text(MODULE_TEMPLATE.format(help="updated help"))
+        result = _run_client(tmp_path, env, "--socket", "daemon.sock", "-i", "README.md", "--no-cache", "--check")
+        assert result.returncode == 2
+        assert "Reloaded served_cli" in result.stderr
+        assert "+- `--foo FOO`: updated help" in result.stderr
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+    assert daemon_log.read_text().count("Processed request") == 3
+
+
+def test_daemon_renders_from_model(tmp_path, monkeypatch):
+    # The module would fail to import, the block must be rendered from the snapshot
+    (tmp_path / "served_cli.py").write_text("raise RuntimeError('imported')\n")
+    (tmp_path / "snaps").mkdir()
+    parser = argparse.ArgumentParser(prog="served_cli")
+    parser.add_argument("--foo", help="SNAPSHOT help")
+    snapshot = snapshot_text(ParserModel.from_parser(parser))
+    (tmp_path / "snaps" / "served_cli.get_parser.json").write_text(snapshot)
+    (tmp_path / "README.md").write_text(MARKDOWN)
+    monkeypatch.chdir(tmp_path)
+
+    daemon = Daemon("daemon.sock")
+    argv = ["--no-cache", "--from-model", "snaps", "-i", "README.md"]
+    response = daemon.handle({"version": __version__, "cwd": daemon.cwd, "argv": argv})
+    assert response["exit_code"] == 0, response["stderr"]
+    assert "`--foo FOO`: SNAPSHOT help" in (tmp_path / "README.md").read_text()
@@ -0,0 +1,85 @@
+import os
+
+from argparse_to_md.discovery import find_input_files
+
+MARKER = "<!--argparse_to_md:cli:get_parser-->\n<!--argparse_to_md_end-->\n"
+
+
+def _make_tree(root, files):
+    for path, contents in files.items():
+        full_path = root / path
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        full_path.write_text(contents)
+
+
+def _relative(root, paths):
+    return [os.path.relpath(path, root).replace(os.sep, "/") for path in paths]
+
+
+def test_directory_search(tmp_path):
+    _make_tree(
+        tmp_path,
+        {
+            ".git/HEAD": "",
+            ".gitignore": "build/\n*.generated.md\n!keep.generated.md\n",
+            "README.md": MARKER,
+            "NOTES.md": "no markers here\n",
+            "docs/usage.md": MARKER,
+            "docs/usage.rst": MARKER,
+            "docs/.gitignore": "/private.md\n",
+            "docs/private.md": MARKER,
+            "docs/api/private.md": MARKER,
+            "docs/out.generated.md": MARKER,
+            "docs/keep.generated.md": MARKER,
+            "build/README.md": MARKER,
+        },
+    )
+
+    found = find_input_files([str(tmp_path)])
+    assert _relative(tmp_path, found) == [
+        "README.md",
+        "docs/api/private.md",
+        "docs/keep.generated.md",
+        "docs/usage.md",
+    ]
+
+    found = find_input_files([str(tmp_path)], include=["*.md", "*.rst"], exclude=["api/", "README.md"])
+    assert _relative(tmp_path, found) == ["docs/keep.generated.md", "docs/usage.md", "docs/usage.rst"]
+
+    found = find_input_files([str(tmp_path)], use_gitignore=False)
+    assert "build/README.md" in _relative(tmp_path, found)
+
+
+def test_parent_gitignore_applies(tmp_path):
+    _make_tree(
+        tmp_path,
+        {
+            ".git/HEAD": "",
+            ".gitignore": "docs/drafts/\n",
+            "docs/index.md": MARKER,
+            "docs/drafts/draft.md": MARKER,
+        },
+    )
+    found = find_input_files([str(tmp_path / "docs")])
+    assert _relative(tmp_path, found) == ["docs/index.md"]
+
+
+def test_glob_patterns_and_files(tmp_path, monkeypatch):
+    _make_tree(
+        tmp_path,
+        {
+            "README.md": "no markers, but listed explicitly\n",
+            "docs/index.md": MARKER,
+            "docs/guide/cli.md": MARKER,
+            "docs/guide/cli.txt": MARKER,
+        },
+    )
+    monkeypatch.chdir(tmp_path)
+
+    assert find_input_files(["docs/*.md"]) == [os.path.join("docs", "index.md")]
+    assert find_input_files(["README.md", "docs/**/*.md", "docs/index.md"]) == [
+        "README.md",
+        os.path.join("docs", "guide", "cli.md"),
+        os.path.join("docs", "index.md"),
+    ]
+    assert find_input_files(["missing/*.md"]) == []
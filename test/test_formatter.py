@@ -1,15 +1,22 @@
 import argparse
 import io
 
+import pytest
+
 from argparse_to_md.formatter import (
     MarkdownHelpFormatterOptions,
-    _build_usage_parts,
     _format_action_md,
+    _wrap_usage_line,
+    gen_argparse_help,
+    select_subcommand,
+)
+from argparse_to_md.model import (
+    ParserModel,
+    _build_usage_parts,
+    _Extractor,
     _format_args,
     _format_usage_part,
     _get_metavar,
-    _wrap_usage_line,
-    gen_argparse_help,
 )
 
 # --- _get_metavar ---
@@ -416,3 +423,111 @@ def test_gen_argparse_help_pad_lists_with_subheading():
     result = out.getvalue()
     assert result.startswith("## Usage:\n")
     assert "Optional arguments:\n\n- `--foo FOO`: foo help\n" in result
+
+
+# --- subcommand tree ---
+
+
+def _make_nested_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="tool")
+    subparsers = parser.add_subparsers(dest="cmd")
+    remote = subparsers.add_parser("remote", aliases=["r", "rem"], description="manage remotes")
+    remote_subparsers = remote.add_subparsers(dest="remote_cmd")
+    add = remote_subparsers.add_parser("add", description="add a remote")
+    add.add_argument("--url", help="remote url")
+    remote_subparsers.add_parser("remove", aliases=["rm"], description="remove a remote")
+    subparsers.add_parser("status", description="show status")
+    return parser
+
+
+def test_gen_argparse_help_nested_subcommands():
+    out = io.StringIO()
+    gen_argparse_help(_make_nested_parser(), out, MarkdownHelpFormatterOptions())
+
+    result = out.getvalue()
+    labels = [line for line in result.splitlines() if line.startswith("Usage")]
+    assert labels == [
+        "Usage:",
+        "Usage of `remote` (aliases: `r`, `rem`):",
+        "Usage of `remote add`:",
+        "Usage of `remote remove` (aliases: `rm`):",
+        "Usage of `status`:",
+    ]
+    assert "Optional arguments of `remote add`:\n- `--url URL`: remote url\n" in result
+    assert "tool remote add [-h] [--url URL]" in result
+
+
+def test_gen_argparse_help_max_depth():
+    out = io.StringIO()
+    gen_argparse_help(_make_nested_parser(), out, MarkdownHelpFormatterOptions(max_depth=1))
+    labels = [line for line in out.getvalue().splitlines() if line.startswith("Usage")]
+    assert labels == ["Usage:", "Usage of `remote` (aliases: `r`, `rem`):", "Usage of `status`:"]
+
+    out = io.StringIO()
+    gen_argparse_help(_make_nested_parser(), out, MarkdownHelpFormatterOptions(max_depth=0))
+    assert "Usage of" not in out.getvalue()
+
+
+def _usage_labels(**kwargs) -> list:
+    out = io.StringIO()
+    gen_argparse_help(_make_nested_parser(), out, MarkdownHelpFormatterOptions(**kwargs))
+    return [line for line in out.getvalue().splitlines() if line.startswith("Usage")]
+
+
+def test_gen_argparse_help_path():
+    out = io.StringIO()
+    gen_argparse_help(_make_nested_parser(), out, MarkdownHelpFormatterOptions(path=("remote",)))
+    result = out.getvalue()
+    # The selected subcommand is rendered at the top of the block, without the separating blank line
+    assert result.startswith("Usage of `remote` (aliases: `r`, `rem`):\n```\ntool remote [-h]")
+    assert "tool [-h]" not in result
+    assert _usage_labels(path=("rem", "add")) == ["Usage of `remote add`:"]
+    # max_depth is relative to the selected subcommand
+    assert _usage_labels(path=("remote",), max_depth=0) == ["Usage of `remote` (aliases: `r`, `rem`):"]
+
+
+def test_gen_argparse_help_include_exclude():
+    assert _usage_labels(include=("remote/*",)) == [
+        "Usage:",
+        "Usage of `remote add`:",
+        "Usage of `remote remove` (aliases: `rm`):",
+    ]
+    assert _usage_labels(exclude=("remote",)) == ["Usage:", "Usage of `status`:"]
+    assert _usage_labels(include=("*",), exclude=("remote/r*",)) == [
+        "Usage:",
+        "Usage of `remote` (aliases: `r`, `rem`):",
+        "Usage of `remote add`:",
+        "Usage of `status`:",
+    ]
+    # Patterns are relative to the selected subcommand
+    assert _usage_labels(path=("remote",), include=("add",)) == [
+        "Usage of `remote` (aliases: `r`, `rem`):",
+        "Usage of `remote add`:",
+    ]
+
+
+def test_only_selected_subcommands_are_extracted(monkeypatch):
+    extracted = []
+    parser_fields = _Extractor._parser_fields
+
+    def record(self, parser):
+        extracted.append(parser.prog)
+        return parser_fields(self, parser)
+
+    monkeypatch.setattr(_Extractor, "_parser_fields", record)
+    options = MarkdownHelpFormatterOptions(path=("remote",), exclude=("remove",))
+    gen_argparse_help(_make_nested_parser(), io.StringIO(), options)
+    # The siblings along the path and the excluded subtrees are not visited
+    assert extracted == ["tool", "tool remote", "tool remote add"]
+
+    extracted.clear()
+    gen_argparse_help(_make_nested_parser(), io.StringIO(), MarkdownHelpFormatterOptions(include=("status",)))
+    assert extracted == ["tool", "tool status"]
+
+
+def test_select_subcommand():
+    model = ParserModel.from_parser(_make_nested_parser())
+    path, aliases, parser = select_subcommand(model, ["r", "rm"])
+    assert (path, aliases, parser.prog) == (["remote", "remove"], ["rm"], "tool remote remove")
+    with pytest.raises(ValueError, match="Unknown subcommand 'pull' in path 'remote/pull'. Available subcommands: add"):
+        select_subcommand(model, ["remote", "pull"])
@@ -0,0 +1,60 @@
+import os
+import sys
+import threading
+
+from argparse_to_md.loader import FunctionLoader
+
+
+def test_shared_loader_imports_once(tmp_path):
+    imports_log = tmp_path / "imports.log"
+    (tmp_path / "counted_cli.py").write_text(
+        "import argparse\n"
+        f"with open({str(imports_log)!r}, 'a') as f:\n"
+        "    f.write('imported\\n')\n"
+        "def get_parser():\n"
+        "    return argparse.ArgumentParser(prog='counted_cli')\n"
+    )
+    loader = FunctionLoader()
+    functions = []
+
+    def load():
+        functions.append(loader.load_function("counted_cli", "get_parser", str(tmp_path)))
+
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.modules.pop("counted_cli", None)
+
+    assert len(functions) == 8
+    assert imports_log.read_text() == "imported\n"
+    assert str(tmp_path / "counted_cli.py") in loader.get_dependencies("counted_cli")
+
+
+def test_reload_modules(tmp_path):
+    helper_path = tmp_path / "reloaded_helper.py"
+    helper_path.write_text("HELP = 'old help'\n")
+    (tmp_path / "reloaded_cli.py").write_text(
+        "import argparse\n"
+        "import reloaded_helper\n"
+        "def get_parser():\n"
+        "    parser = argparse.ArgumentParser(prog='reloaded_cli')\n"
+        "    parser.add_argument('--foo', help=reloaded_helper.HELP)\n"
+        "    return parser\n"
+    )
+    loader = FunctionLoader([str(tmp_path)])
+    try:
+        parser = loader.load_parser("reloaded_cli", "get_parser")
+        assert parser._actions[-1].help == "old help"
+        assert loader.reload_modules({"/nonexistent.py"}) == []
+        assert loader.load_parser("reloaded_cli", "get_parser") is parser
+
+        helper_path.write_text("HELP = 'updated help'\n")
+        assert loader.reload_modules({os.path.realpath(helper_path)}) == ["reloaded_cli"]
+        assert loader.load_parser("reloaded_cli", "get_parser")._actions[-1].help == "updated help"
+    finally:
+        sys.modules.pop("reloaded_cli", None)
+        sys.modules.pop("reloaded_helper", None)
@@ -0,0 +1,119 @@
+import argparse
+import io
+
+import pytest
+
+from argparse_to_md.formatter import MarkdownHelpFormatterOptions, gen_argparse_help
+from argparse_to_md.model import ParserModel
+
+
+def _render(parser) -> str:
+    out = io.StringIO()
+    gen_argparse_help(parser, out, MarkdownHelpFormatterOptions(subheading_level=2))
+    return out.getvalue()
+
+
+def _make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="tool", description="A tool")
+    parser.add_argument("input", help="input file")
+    parser.add_argument("--mode", choices=[1, 2], type=int, help="mode")
+    parser.add_argument("--pair", nargs=2, metavar=("SRC", "DST"), help="pair")
+    parser.add_argument("-I", "--include", action="extend", nargs="+", type=str, help="include")
+    parser.add_argument("--hidden", help=argparse.SUPPRESS)
+    group = parser.add_argument_group("Output", "Output options")
+    mutex = group.add_mutually_exclusive_group(required=True)
+    mutex.add_argument("--json", action="store_true", help="JSON output")
+    mutex.add_argument("--text", action="store_true", help="text output")
+    subparsers = parser.add_subparsers(dest="command", help="command")
+    build = subparsers.add_parser("build", aliases=["b"], description="build it")
+    build.add_argument("--jobs", type=lambda s: int(s), help="jobs")
+    nested = build.add_subparsers(dest="target")
+    nested.add_parser("all", usage="%(prog)s [options]")
+    return parser
+
+
+def test_model_renders_the_same_as_parser():
+    parser = _make_parser()
+    assert _render(ParserModel.from_parser(parser)) == _render(parser)
+
+
+def test_model_precomputes_fragments():
+    model = ParserModel.from_parser(_make_parser())
+    actions = {a.dest: a for a in model.actions}
+    assert actions["mode"].metavar == "{1,2}"
+    assert actions["mode"].choices == ("1", "2")
+    assert actions["pair"].usage_part == "[--pair SRC DST]"
+    assert actions["include"].invocations == (
+        "-I INCLUDE [-I INCLUDE ...]",
+        "--include INCLUDE [--include INCLUDE ...]",
+    )
+    assert actions["hidden"].usage_part is None
+    assert "(--json | --text)" in model.usage_parts
+
+
+def test_json_roundtrip():
+    model = ParserModel.from_parser(_make_parser())
+    restored = ParserModel.from_json(model.to_json())
+    assert restored == model
+    assert _render(restored) == _render(model)
+
+
+def test_aliases_share_model():
+    model = ParserModel.from_parser(_make_parser())
+    subcommands = dict(model.subcommands)
+    assert subcommands["build"] is subcommands["b"]
+
+    data = model.to_dict()
+    assert len(data["parsers"]) == 3
+    restored = dict(ParserModel.from_dict(data).subcommands)
+    assert restored["build"] is restored["b"]
+
+
+def test_extractor_is_released_when_all_subparsers_are_filled():
+    model = ParserModel.from_parser(_make_parser())
+    build = dict(model.subcommands)["build"]
+    extractor = object.__getattribute__(build, "_pending")[1]
+    assert extractor.parsers
+
+    nested = dict(build.subcommands)["all"]
+    assert nested.prog == "tool input build all"
+    assert (extractor.pending, extractor.parsers, extractor.actions, extractor.mutex_group_parts) == (0, {}, {}, {})
+
+
+def test_model_is_immutable():
+    model = ParserModel.from_parser(_make_parser())
+    with pytest.raises(AttributeError):
+        model.prog = "other"  # type: ignore[misc]
+
+
+def test_unsupported_version():
+    data = ParserModel.from_parser(_make_parser()).to_dict()
+    data["version"] = 0
+    with pytest.raises(ValueError):
+        ParserModel.from_dict(data)
+
+
+def test_parent_actions_are_shared():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--verbose", action="store_true", help="verbose output")
+    mutex = common.add_mutually_exclusive_group()
+    mutex.add_argument("--json", action="store_true", help="JSON output")
+    mutex.add_argument("--text", action="store_true", help="text output")
+    parser = argparse.ArgumentParser(prog="tool", parents=[common])
+    subparsers = parser.add_subparsers(dest="command")
+    for name in ("build", "clean"):
+        subparsers.add_parser(name, parents=[common])
+
+    model = ParserModel.from_parser(parser)
+    subcommands = dict(model.subcommands)
+    verbose = [next(a for a in p.actions if a.dest == "verbose") for p in [model, *subcommands.values()]]
+    assert verbose[0] is verbose[1] is verbose[2]
+    assert subcommands["build"].usage_parts == ("[-h]", "[--verbose]", "[--json | --text]")
+
+    # Shared actions are stored once, and stay shared after a roundtrip
+    data = model.to_dict()
+    assert [a["dest"] for a in data["actions"]].count("verbose") == 1
+    restored = dict(ParserModel.from_dict(data).subcommands)
+    assert restored["build"].actions[1] is restored["clean"].actions[1]
+
+    assert _render(model).count("- `--verbose`: verbose output\n") == 3
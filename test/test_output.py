@@ -0,0 +1,105 @@
+import codecs
+import io
+import os
+import stat
+import sys
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+from argparse_to_md.cache import RenderCache
+from argparse_to_md.loader import FunctionLoader
+from argparse_to_md.output import ChangeDetectingWriter, write_atomically
+from argparse_to_md.processing import process_file
+
+ORIGINAL = "line 1\nline 2\nline 3\n"
+
+
+def test_unchanged_output_is_not_stored():
+    writer = ChangeDetectingWriter(io.StringIO(ORIGINAL))
+    for line in ORIGINAL.splitlines(keepends=True):
+        writer.write(line)
+    assert not writer.finish()
+    assert writer.spool is None
+
+
+def test_changed_output_is_spooled():
+    writer = ChangeDetectingWriter(io.StringIO(ORIGINAL), spool_max_size=4)
+    writer.write("line 1\n")
+    writer.write("line two\n")
+    writer.write("line 3\n")
+    assert writer.finish()
+    assert writer.getvalue() == "line 1\nline two\nline 3\n"
+    out = io.StringIO()
+    writer.copy_to(out)
+    assert out.getvalue() == "line 1\nline two\nline 3\n"
+    writer.close()
+
+
+def test_truncated_output_is_detected():
+    writer = ChangeDetectingWriter(io.StringIO(ORIGINAL))
+    writer.write("line 1\n")
+    assert writer.finish()
+    assert writer.getvalue() == "line 1\n"
+
+
+def test_write_atomically(tmp_path):
+    path = tmp_path / "file.md"
+    path.write_text(ORIGINAL)
+    path.chmod(0o640)
+
+    with pytest.raises(RuntimeError):
+        with write_atomically(str(path), "utf-8", "\n") as f:
+            f.write("partial")
+            raise RuntimeError()
+    assert path.read_text() == ORIGINAL
+
+    with write_atomically(str(path), "utf-8", "\r\n") as f:
+        f.write("line 1\nline 2\n")
+    assert path.read_bytes() == b"line 1\r\nline 2\r\n"
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
+    assert os.listdir(tmp_path) == ["file.md"]
+
+
+def test_process_file_preserves_format(tmp_path):
+    data_dir = Path(__file__).parent / "data"
+    stale = codecs.BOM_UTF8 + (data_dir / "test2.md.in").read_bytes().replace(b"\n", b"\r\n")
+    up_to_date = (data_dir / "test2.md.expected").read_bytes()
+    stale_path, up_to_date_path = tmp_path / "stale.md", tmp_path / "up_to_date.md"
+    stale_path.write_bytes(stale)
+    up_to_date_path.write_bytes(up_to_date)
+    up_to_date_stat = up_to_date_path.stat()
+    loader = FunctionLoader([str(data_dir)])
+
+    try:
+        assert process_file(str(stale_path), loader, RenderCache(None), check=False).changes_required
+        assert not process_file(str(up_to_date_path), loader, RenderCache(None), check=False).changes_required
+    finally:
+        sys.modules.pop("test2", None)
+
+    expected = codecs.BOM_UTF8 + up_to_date.replace(b"\n", b"\r\n")
+    assert stale_path.read_bytes() == expected
+    # Files which don't need changes are not rewritten
+    assert up_to_date_path.stat().st_mtime_ns == up_to_date_stat.st_mtime_ns
+    assert up_to_date_path.stat().st_ino == up_to_date_stat.st_ino
+
+
+def test_process_file_memory_is_bounded(tmp_path):
+    data_dir = Path(__file__).parent / "data"
+    # 16 MB of text before an up-to-date block, mapped and compared piece by piece
+    filler = "Some text before the block, ü.\r\n" * 500_000
+    path = tmp_path / "large.md"
+    path.write_bytes(filler.encode() + (data_dir / "test2.md.expected").read_bytes().replace(b"\n", b"\r\n"))
+    loader = FunctionLoader([str(data_dir)])
+
+    tracemalloc.start()
+    try:
+        result = process_file(str(path), loader, RenderCache(None), check=True)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        sys.modules.pop("test2", None)
+
+    assert not result.changes_required
+    assert peak < 4 << 20
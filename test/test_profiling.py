@@ -0,0 +1,56 @@
+import io
+import json
+from pathlib import Path
+
+from argparse_to_md.loader import FunctionLoader
+from argparse_to_md.markdown_processor import process_markdown
+from argparse_to_md.profiling import Profiler
+
+
+def test_nested_phases_inherit_context():
+    profiler = Profiler()
+    seen = []
+    profiler.subscribe(seen.append)
+    with profiler.phase("file", file="README.md"):
+        with profiler.phase("block", block="mod:func"):
+            pass
+
+    assert [r.name for r in seen] == ["block", "file"]
+    assert seen[0].context == {"file": "README.md", "block": "mod:func"}
+    assert seen[1].context == {"file": "README.md"}
+    assert seen[0].peak_memory is None
+    assert profiler.records == seen
+
+
+def test_peak_memory():
+    profiler = Profiler(trace_memory=True)
+    profiler.start()
+    try:
+        with profiler.phase("outer"):
+            with profiler.phase("inner"):
+                data = bytearray(1024 * 1024)
+                del data
+    finally:
+        profiler.stop()
+
+    inner, outer = profiler.records
+    assert inner.peak_memory is not None and inner.peak_memory >= 1024 * 1024
+    assert outer.peak_memory is not None and outer.peak_memory >= inner.peak_memory
+
+
+def test_process_markdown_phases():
+    data_dir = Path(__file__).parent / "data"
+    loader = FunctionLoader()
+    loader.profiler = Profiler()
+    with open(data_dir / "test3.md.in") as in_md:
+        process_markdown(in_md, io.StringIO(), loader)
+
+    names = [r.name for r in loader.profiler.records]
+    assert names.count("block") == 1
+    assert {"load", "factory", "render"} <= set(names)
+    block = [r for r in loader.profiler.records if r.name == "block"][0]
+    assert block.context["block"] == "test3:get_parser:subheading_level=2"
+
+    report = json.loads(loader.profiler.report_json())
+    assert report["summary"]["block"]["count"] == 1
+    assert "Slowest blocks:" in loader.profiler.report_text()
@@ -0,0 +1,183 @@
+import argparse
+import gc
+import importlib.metadata
+import io
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from argparse_to_md import renderers
+from argparse_to_md.formatter import MarkdownHelpFormatterOptions, gen_argparse_help
+from argparse_to_md.markdown_processor import args_to_options
+from argparse_to_md.renderers import get_renderer, register_renderer, render, renderer_names
+
+
+def _make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="tool", description="Tool description")
+    parser.add_argument("--level", choices=["low", "high"], help="level of <detail>")
+    subparsers = parser.add_subparsers(dest="command", help="command to run")
+    build = subparsers.add_parser("build", aliases=["b"], help="build the project")
+    build.add_argument("target", help="target to build")
+    return parser
+
+
+def _render(output_format: str, **kwargs) -> str:
+    out = io.StringIO()
+    render(_make_parser(), out, MarkdownHelpFormatterOptions(format=output_format, **kwargs))
+    return out.getvalue()
+
+
+def test_markdown_is_the_default_format():
+    out = io.StringIO()
+    gen_argparse_help(_make_parser(), out, MarkdownHelpFormatterOptions())
+    assert _render("markdown") == out.getvalue()
+
+
+def test_render_rst():
+    output = _render("rst", subheading_level=2)
+    assert "Usage\n-----\n\n.. code-block:: none\n\n    tool [-h] [--level {low,high}]" in output
+    assert "- ``--level {low,high}``: level of <detail>" in output
+    assert "Usage of ``build`` (aliases: ``b``)\n-----------------------------------\n" in output
+    assert "Positional arguments of ``build``:\n\n- ``target``: target to build" in output
+
+
+def test_render_man():
+    output = _render("man")
+    assert output.startswith('.TH "TOOL" "1"\n.SH NAME\ntool\n.SH SYNOPSIS\n.nf\ntool [\\-h]')
+    assert '.SH "OPTIONAL ARGUMENTS"\n' in output
+    assert ".TP\n\\fB\\-\\-level\\fR \\fI{low,high}\\fR\nlevel of <detail>\n" in output
+    assert '.SH "COMMAND BUILD"\n.PP\nAliases: b\n' in output
+    assert '.SS "Positional arguments"\n.TP\n\\fItarget\\fR\ntarget to build\n' in output
+
+
+def test_render_html():
+    output = _render("html")
+    assert "<pre><code>tool [-h] [--level {low,high}]" in output
+    assert "<li><code>--level {low,high}</code>: level of &lt;detail&gt;</li>" in output
+    assert "<p>Usage of <code>build</code> (aliases: <code>b</code>):</p>" in output
+
+
+def test_render_json():
+    document = json.loads(_render("json"))
+    assert document["prog"] == "tool"
+    assert document["description"] == "Tool description"
+    level = next(arg for arg in document["arguments"] if arg["dest"] == "level")
+    assert level["choices"] == ["low", "high"]
+    [build] = document["subcommands"]
+    assert (build["name"], build["aliases"]) == ("build", ["b"])
+    assert [arg["dest"] for arg in build["parser"]["arguments"]] == ["help", "target"]
+
+    # Subcommands beyond max_depth are left out
+    assert json.loads(_render("json", max_depth=0))["subcommands"] == []
+
+
+def test_render_path():
+    assert _render("rst", path=("b",)).startswith("Usage of ``build`` (aliases: ``b``):\n")
+    assert _render("man", path=("build",)).startswith('.TH "TOOL BUILD" "1"\n.SH NAME\ntool build\n')
+    assert _render("html", path=("build",)).startswith("<p>Usage of <code>build</code> (aliases: <code>b</code>):</p>")
+    document = json.loads(_render("json", path=("build",)))
+    assert (document["prog"], document["subcommands"]) == ("tool build", [])
+
+
+def test_render_json_include():
+    parser = argparse.ArgumentParser(prog="tool")
+    db = parser.add_subparsers().add_parser("db")
+    db.add_subparsers().add_parser("migrate")
+    out = io.StringIO()
+    render(parser, out, MarkdownHelpFormatterOptions(format="json", include=("db/*",)))
+    # Subcommands whose parent is left out are nested in the closest rendered ancestor
+    [migrate] = json.loads(out.getvalue())["subcommands"]
+    assert (migrate["name"], migrate["parser"]["prog"]) == ("db migrate", "tool db migrate")
+
+
+def test_register_renderer():
+    @register_renderer("test-names")
+    def render_names(parser, out, options):
+        out.write(",".join(action.dest for action in parser.actions))
+
+    assert "test-names" in renderer_names()
+    assert _render("test-names") == "help,level,command"
+
+    with pytest.raises(ValueError, match="Unknown format: 'unknown'"):
+        get_renderer("unknown")
+
+
+def test_entry_points_before_python_3_10(monkeypatch):
+    class EntryPoint:
+        name = "test-entry-point"
+
+        def load(self):
+            return lambda parser, out, options: out.write("from the entry point")
+
+    def entry_points():
+        # Python 3.9 only returns the dict of all the groups, without the group argument
+        return {renderers.ENTRY_POINT_GROUP: [EntryPoint()]}
+
+    monkeypatch.setattr(renderers, "_RENDERERS", dict(renderers._RENDERERS))
+    monkeypatch.setattr(renderers, "_entry_points_loaded", False)
+    monkeypatch.setattr(importlib.metadata, "entry_points", entry_points)
+    monkeypatch.setattr(sys, "version_info", (3, 9, 18, "final", 0))
+    assert _render("test-entry-point") == "from the entry point"
+
+
+def test_render_without_memoize():
+    parser = _make_parser()
+    render(parser, io.StringIO(), MarkdownHelpFormatterOptions())
+    parser.add_argument("--added", help="added after the first render")
+    out = io.StringIO()
+    render(parser, out, MarkdownHelpFormatterOptions(), memoize=False)
+    assert "- `--added ADDED`: added after the first render" in out.getvalue()
+
+
+def test_memoized_models_do_not_keep_parsers_alive():
+    def make_parser() -> argparse.ArgumentParser:
+        parser = argparse.ArgumentParser(prog="tool")
+        mutex = parser.add_mutually_exclusive_group()
+        mutex.add_argument("--json", action="store_true")
+        mutex.add_argument("--text", action="store_true")
+        subparsers = parser.add_subparsers(dest="command")
+        for name in ("a", "b"):
+            subparsers.add_parser(name).add_argument("--verbose", action="store_true")
+        return parser
+
+    gc.collect()
+    entries_before = len(renderers._models)
+    for _ in range(5):
+        # Only "a" is extracted, the model of "b" stays pending
+        render(make_parser(), io.StringIO(), MarkdownHelpFormatterOptions(path=("a",)))
+    gc.collect()
+    assert len(renderers._models) == entries_before
+
+
+def test_format_option():
+    assert args_to_options("format=rst:subheading_level=2").format == "rst"
+    with pytest.raises(ValueError, match="Unknown format"):
+        args_to_options("format=docx")
+
+
+def test_cli_parser_outputs(tmp_path):
+    data_dir = Path(__file__).parent / "data"
+    man_path, json_path = tmp_path / "testprog.1", tmp_path / "testprog.json"
+    command = [sys.executable, "-m", "argparse_to_md", "--no-cache", "--extra-sys-path", str(data_dir)]
+    command += ["--parser", "test2:get_parser", "-o", f"man={man_path}", f"json={json_path}"]
+
+    result = subprocess.run(command, text=True, capture_output=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stderr.count("Updating") == 2
+    assert man_path.read_text().startswith('.TH "TESTPROG" "1"\n')
+    assert json.loads(json_path.read_text())["arguments"][1]["help"] == "foo help"
+
+    # Up to date outputs are not rewritten
+    man_mtime = man_path.stat().st_mtime_ns
+    result = subprocess.run(command + ["--check"], text=True, capture_output=True)
+    assert result.returncode == 0, result.stderr
+    assert "Updating" not in result.stderr
+    assert man_path.stat().st_mtime_ns == man_mtime
+
+    json_path.write_text("{}\n")
+    result = subprocess.run(command + ["--check"], text=True, capture_output=True)
+    assert result.returncode == 2
+    assert "Changes required in" in result.stderr
@@ -0,0 +1,118 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from argparse_to_md.loader import LoadError
+from argparse_to_md.model import ParserModel
+from argparse_to_md.sandbox import SandboxedFunctionLoader, _set_limits
+
+MODULES = {
+    "good_cli": """
+        import argparse
+
+        def get_parser():
+            parser = argparse.ArgumentParser(prog="good_cli")
+            parser.add_argument("--foo", help="foo help")
+            return parser
+    """,
+    "hanging_cli": """
+        import time
+
+        time.sleep(60)
+    """,
+    "failing_cli": """
+        raise RuntimeError("can't reach the server")
+    """,
+    "spinning_cli": """
+        while True:
+            pass
+    """,
+}
+
+
+def _write_modules(path: Path) -> None:
+    for name, source in MODULES.items():
+        (path / f"{name}.py").write_text(textwrap.dedent(source))
+
+
+def test_sandboxed_loader(tmp_path):
+    _write_modules(tmp_path)
+    with SandboxedFunctionLoader([str(tmp_path)], timeout=2) as loader:
+        model = loader.load_parser("good_cli", "get_parser")
+        assert isinstance(model, ParserModel)
+        assert model.prog == "good_cli"
+        assert str(tmp_path / "good_cli.py") in loader.get_dependencies("good_cli")
+        # Nothing is imported into the current process
+        assert "good_cli" not in sys.modules
+
+        with pytest.raises(LoadError, match="Loading failing_cli:get_parser failed: RuntimeError: can't reach"):
+            loader.load_parser("failing_cli", "get_parser")
+        with pytest.raises(LoadError, match="has no attribute 'missing'"):
+            loader.load_parser("good_cli", "missing")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="resource limits are not supported on Windows")
+def test_sandboxed_loader_limits(tmp_path):
+    _write_modules(tmp_path)
+    with SandboxedFunctionLoader([str(tmp_path)], timeout=1, max_cpu_time=1) as loader:
+        with pytest.raises(LoadError, match="Loading hanging_cli:get_parser timed out after 1 s"):
+            loader.load_parser("hanging_cli", "get_parser")
+    with SandboxedFunctionLoader([str(tmp_path)], timeout=10, max_cpu_time=1) as loader:
+        with pytest.raises(LoadError, match="exceeded the CPU time limit of 1 s"):
+            loader.load_parser("spinning_cli", "get_parser")
+
+
+def test_no_limits_dont_need_resource_module(monkeypatch):
+    # As on Windows, where --sandbox is supported with the timeout only
+    monkeypatch.setitem(sys.modules, "resource", None)
+    _set_limits(None, None)
+    with pytest.raises(ImportError):
+        _set_limits(10, None)
+
+
+def test_cli_sandbox_reports_block_errors(tmp_path):
+    _write_modules(tmp_path)
+    markdown = (
+        "<!--argparse_to_md:failing_cli:get_parser-->\nold contents\n<!--argparse_to_md_end-->\n"
+        "<!--argparse_to_md:good_cli:get_parser-->\n<!--argparse_to_md_end-->\n"
+    )
+    (tmp_path / "first.md").write_text(markdown)
+    (tmp_path / "second.md").write_text(markdown)
+
+    result = subprocess.run(
+        [sys.executable, "-m", "argparse_to_md", "--no-cache", "--sandbox", "--format", "json"]
+        + ["-i", "first.md", "second.md"],
+        cwd=tmp_path,
+        env=dict(os.environ, PYTHONPATH=str(Path(__file__).parent.parent)),
+        text=True,
+        capture_output=True,
+    )
+
+    assert result.returncode == 1, result.stderr
+    report = json.loads(result.stdout)
+    assert [file_report["file"] for file_report in report["files"]] == ["first.md", "second.md"]
+    [error] = report["files"][0]["errors"]
+    assert error["marker"] == "<!--argparse_to_md:failing_cli:get_parser-->"
+    assert error["line"] == 1
+    assert "RuntimeError: can't reach the server" in error["message"]
+    # The failed block keeps its contents, the other blocks of all the files are updated
+    for name in ("first.md", "second.md"):
+        contents = (tmp_path / name).read_text()
+        assert "old contents\n" in contents
+        assert "- `--foo FOO`: foo help\n" in contents
+
+
+def test_cli_limits_require_sandbox():
+    result = subprocess.run(
+        [sys.executable, "-m", "argparse_to_md", "--timeout", "5", "-i", "README.md"],
+        cwd=Path(__file__).parent.parent,
+        text=True,
+        capture_output=True,
+    )
+    assert result.returncode == 1
+    assert "--timeout, --max-cpu-time and --max-memory require --sandbox" in result.stderr
@@ -0,0 +1,77 @@
+import io
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from argparse_to_md.loader import FunctionLoader, LoadError
+from argparse_to_md.markdown_processor import process_markdown
+from argparse_to_md.model import ParserModel
+from argparse_to_md.snapshots import SnapshotFunctionLoader, load_snapshot, snapshot_text
+
+from .helpers import FailingLoader, write_cli_module
+
+MARKDOWN = "Usage:\n<!--argparse_to_md:snapshot_cli:get_parser-->\n<!--argparse_to_md_end-->\n"
+
+
+def _run(cwd: Path, *args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).parent.parent))
+    return subprocess.run(
+        [sys.executable, "-m", "argparse_to_md", "--no-cache", *args], cwd=cwd, env=env, text=True, capture_output=True
+    )
+
+
+def test_dump_and_render_from_model(tmp_path):
+    write_cli_module(tmp_path / "snapshot_cli.py", "foo help")
+    (tmp_path / "README.md").write_text(MARKDOWN)
+
+    result = _run(tmp_path, "-i", "README.md", "--dump-model", "models")
+    assert result.returncode == 0, result.stderr
+    snapshot = tmp_path / "models" / "snapshot_cli.get_parser.json"
+    assert ParserModel.from_json(snapshot.read_text()).prog == "snapshot_cli"
+    # The markdown file itself is not updated
+    assert (tmp_path / "README.md").read_text() == MARKDOWN
+    assert _run(tmp_path, "-i", "README.md", "--dump-model", "models", "--check").returncode == 0
+
+    write_cli_module(tmp_path / "snapshot_cli.py", "new foo help")
+    result = _run(tmp_path, "-i", "README.md", "--dump-model", "models", "--check")
+    assert result.returncode == 2
+    assert "snapshot_cli.get_parser.json is out of date" in result.stderr
+
+    # Rendering from the snapshot doesn't need the module
+    (tmp_path / "snapshot_cli.py").unlink()
+    result = _run(tmp_path, "-i", "README.md", "--from-model", "models")
+    assert result.returncode == 0, result.stderr
+    assert "- `--foo FOO`: foo help\n" in (tmp_path / "README.md").read_text()
+    assert _run(tmp_path, "-i", "README.md", "--from-model", "models", "--check").returncode == 0
+
+
+def test_model_marker_option(tmp_path):
+    write_cli_module(tmp_path / "snapshot_cli.py", "foo help")
+    expected = io.StringIO()
+    with open(tmp_path / "README.md", "w+") as md:
+        md.write(MARKDOWN)
+        md.seek(0)
+        try:
+            process_markdown(md, expected, FunctionLoader())
+            model = ParserModel.from_parser(sys.modules["snapshot_cli"].get_parser())
+        finally:
+            sys.modules.pop("snapshot_cli", None)
+    (tmp_path / "snapshot.json").write_text(snapshot_text(model))
+
+    md_path = tmp_path / "docs.md"
+    md_path.write_text(MARKDOWN.replace("get_parser-->", "get_parser:model=snapshot.json-->"))
+    out = io.StringIO()
+    with open(md_path) as md:
+        process_markdown(md, out, FailingLoader())
+    assert out.getvalue() == expected.getvalue().replace("get_parser-->", "get_parser:model=snapshot.json-->")
+
+
+def test_missing_or_invalid_snapshot(tmp_path):
+    with pytest.raises(LoadError, match="not found, create it with --dump-model"):
+        SnapshotFunctionLoader(str(tmp_path)).load_parser("snapshot_cli", "get_parser")
+    (tmp_path / "invalid.json").write_text('{"version": 0}')
+    with pytest.raises(LoadError, match="Invalid model snapshot"):
+        load_snapshot(str(tmp_path / "invalid.json"))
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+import typing as t
+from pathlib import Path
+
+# Import time budget of "argparse_to_md --version", excluding the interpreter startup, in microseconds.
+# Typically about 20-30 ms; the budget leaves room for slow CI machines.
+STARTUP_IMPORT_BUDGET_US = 100_000
+
+# Modules which are only needed for processing the files, or on cold paths
+DEFERRED_MODULES = [
+    "argparse_to_md.loader",
+    "argparse_to_md.markdown_processor",
+    "argparse_to_md.processing",
+    "unittest.mock",
+    "difflib",
+    "multiprocessing",
+    "concurrent.futures",
+    "ast",
+]
+
+
+def _top_level_import_times(*args: str) -> t.Dict[str, int]:
+    """Run Python with -X importtime, return the cumulative import time of each top level import in microseconds."""
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).parent.parent))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args], env=env, text=True, capture_output=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not name.startswith("  "):
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def _imported_modules(*args: str) -> t.Set[str]:
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).parent.parent))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args], env=env, text=True, capture_output=True, check=True
+    )
+    return {line.split("|")[-1].strip() for line in result.stderr.splitlines() if line.startswith("import time:")}
+
+
+def test_version_does_not_import_processing_modules():
+    modules = _imported_modules("-m", "argparse_to_md", "--version")
+    assert not modules & set(DEFERRED_MODULES)
+
+
+def test_version_startup_within_budget():
+    interpreter_imports = _top_level_import_times("-c", "pass")
+    imports = _top_level_import_times("-m", "argparse_to_md", "--version")
+    startup_time = sum(time for name, time in imports.items() if name not in interpreter_imports)
+    assert startup_time < STARTUP_IMPORT_BUDGET_US, sorted(imports.items(), key=lambda item: -item[1])
+
+
+def test_package_attributes_are_loaded_lazily():
+    modules = _imported_modules("-c", "import argparse_to_md; argparse_to_md.__version__")
+    assert "argparse_to_md.loader" not in modules
+
+    modules = _imported_modules("-c", "from argparse_to_md import process_markdown, FunctionLoader")
+    assert "argparse_to_md.markdown_processor" in modules
+    assert "unittest.mock" not in modules
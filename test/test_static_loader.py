@@ -0,0 +1,164 @@
+import io
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from argparse_to_md.formatter import MarkdownHelpFormatterOptions, gen_argparse_help
+from argparse_to_md.loader import FunctionLoader
+from argparse_to_md.static_loader import StaticFunctionLoader
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def _render(parser) -> str:
+    out = io.StringIO()
+    gen_argparse_help(parser, out, MarkdownHelpFormatterOptions())
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("module_name", ["test1", "test2", "test3"])
+def test_static_matches_import(module_name):
+    static_parser = StaticFunctionLoader().load_function(module_name, "get_parser", str(DATA_DIR))()
+    imported_parser = FunctionLoader().load_function(module_name, "get_parser", str(DATA_DIR))()
+    assert _render(static_parser) == _render(imported_parser)
+
+
+def test_static_does_not_import(tmp_path):
+    (tmp_path / "static_cli.py").write_text(
+        textwrap.dedent(
+            """
+            import argparse
+            import some_heavy_dependency
+
+            COMMANDS = ["build", "flash"]
+
+            def add_common(parser, verbose_help="be verbose"):
+                parser.add_argument("-v", "--verbose", action="store_true", help=verbose_help)
+
+            def get_parser():
+                parser = argparse.ArgumentParser(prog="static_cli", description="A tool")
+                add_common(parser)
+                group = parser.add_argument_group("Output options")
+                mutex = group.add_mutually_exclusive_group()
+                mutex.add_argument("--json", action="store_true", help="JSON output")
+                mutex.add_argument("--text", action="store_true", help="text output")
+                parser.add_argument("--port", type=some_heavy_dependency.Port, help="serial port")
+                subparsers = parser.add_subparsers(dest="command")
+                for name in COMMANDS:
+                    sub = subparsers.add_parser(name, help=f"run {name}")
+                    add_common(sub, verbose_help=name + " verbosely")
+                return parser
+            """
+        )
+    )
+    loader = StaticFunctionLoader()
+    parser = loader.load_function("static_cli", "get_parser", str(tmp_path))()
+
+    assert "static_cli" not in sys.modules
+    assert loader.get_dependencies("static_cli") == [str((tmp_path / "static_cli.py").resolve())]
+    output = _render(parser)
+    assert "static_cli [-h] [-v] [--json | --text] [--port PORT] {build,flash} ..." in output
+    assert "Output options:\n- `--json`: JSON output" in output
+    assert "- `-v`, `--verbose`: flash verbosely" in output
+
+
+def test_static_falls_back_to_import(tmp_path):
+    (tmp_path / "dynamic_cli.py").write_text(
+        textwrap.dedent(
+            """
+            import argparse
+            import sys
+
+            def get_parser():
+                parser = argparse.ArgumentParser(prog="dynamic_cli")
+                if sys.platform:
+                    parser.add_argument("--foo", help="foo help")
+                return parser
+            """
+        )
+    )
+    loader = StaticFunctionLoader()
+    try:
+        parser = loader.load_function("dynamic_cli", "get_parser", str(tmp_path))()
+        assert "dynamic_cli" in sys.modules
+    finally:
+        sys.modules.pop("dynamic_cli", None)
+    assert "- `--foo FOO`: foo help" in _render(parser)
+
+
+@pytest.mark.parametrize(
+    "module_code",
+    [
+        'CHOICES = ["a"]\nCHOICES.append("b")\nHELP = "base"\nHELP += " extended"\n',
+        'CHOICES = ["a", "b"]\nHELP = "base"\nif CHOICES:\n    HELP = "base extended"\n',
+        'CHOICES = ["a"]\nHELP = "base extended"\ndef _init():\n    CHOICES.append("b")\n_init()\n',
+        'CHOICES, HELP = ["a", "b"], "base extended"\n',
+    ],
+)
+def test_static_falls_back_to_import_for_module_state(tmp_path, module_code):
+    # Module-level names which are mutated or rebound can only be resolved by running the module
+    (tmp_path / "stateful_cli.py").write_text(
+        "import argparse\n"
+        f"{module_code}"
+        "def get_parser():\n"
+        "    parser = argparse.ArgumentParser(prog='stateful_cli')\n"
+        "    parser.add_argument('--choice', choices=CHOICES, help=HELP)\n"
+        "    return parser\n"
+    )
+    loader = StaticFunctionLoader()
+    try:
+        parser = loader.load_function("stateful_cli", "get_parser", str(tmp_path))()
+        assert "stateful_cli" in sys.modules
+    finally:
+        sys.modules.pop("stateful_cli", None)
+    assert "- `--choice {a,b}`: base extended" in _render(parser)
+
+
+def test_static_honors_source_encoding(tmp_path):
+    source = textwrap.dedent(
+        """
+        # -*- coding: latin-1 -*-
+        import argparse
+
+        def get_parser():
+            parser = argparse.ArgumentParser(prog="latin_cli", description="Café tool")
+            parser.add_argument("--naïve", action="store_true", help="résumé mode")
+            return parser
+        """
+    ).lstrip()
+    (tmp_path / "latin_cli.py").write_bytes(source.encode("latin-1"))
+    loader = StaticFunctionLoader()
+    parser = loader.load_function("latin_cli", "get_parser", str(tmp_path))()
+
+    assert "latin_cli" not in sys.modules
+    output = _render(parser)
+    assert "Café tool" in output
+    assert "- `--naïve`: résumé mode" in output
+
+
+def test_static_uses_import_search_order(tmp_path, monkeypatch):
+    def write_module(directory, description):
+        directory.mkdir()
+        (directory / "shadowed_cli.py").write_text(
+            textwrap.dedent(
+                f"""
+                import argparse
+
+                def get_parser():
+                    return argparse.ArgumentParser(prog="shadowed_cli", description="{description}")
+                """
+            )
+        )
+
+    write_module(tmp_path / "site", "from sys.path")
+    write_module(tmp_path / "docs", "from the markdown directory")
+    monkeypatch.syspath_prepend(str(tmp_path / "site"))
+
+    loader = StaticFunctionLoader()
+    parser = loader.load_function("shadowed_cli", "get_parser", str(tmp_path / "docs"))()
+
+    assert "shadowed_cli" not in sys.modules
+    assert loader.get_dependencies("shadowed_cli") == [str((tmp_path / "site" / "shadowed_cli.py").resolve())]
+    assert parser.description == "from sys.path"
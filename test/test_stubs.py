@@ -0,0 +1,126 @@
+import sys
+
+import pytest
+
+from argparse_to_md.loader import FunctionLoader
+from argparse_to_md.stubs import StubModule, stub_imports
+
+
+def _write_cli(path, body):
+    path.write_text(
+        "import argparse\n"
+        f"{body}"
+        "def get_parser():\n"
+        "    parser = argparse.ArgumentParser(prog='stubbed_cli')\n"
+        "    parser.add_argument('--foo', help='foo help')\n"
+        "    return parser\n"
+    )
+
+
+def test_missing_modules_are_stubbed(tmp_path, capsys):
+    _write_cli(
+        tmp_path / "stubbed_cli.py",
+        "import missing_pkg.sub\n"
+        "from missing_other import decorator, Base\n"
+        "@decorator(1)\n"
+        "class Command(Base):\n"
+        "    pass\n"
+        "LIMIT = missing_pkg.sub.LIMIT + 1 if missing_pkg.sub.LIMIT else 0\n",
+    )
+    loader = FunctionLoader([str(tmp_path)])
+    try:
+        parser = loader.load_parser("stubbed_cli", "get_parser")
+        module = sys.modules["stubbed_cli"]
+    finally:
+        sys.modules.pop("stubbed_cli", None)
+
+    assert parser._actions[-1].help == "foo help"
+    assert isinstance(module.missing_pkg, StubModule)
+    # Stubs are only visible while the module is imported
+    assert "missing_pkg" not in sys.modules
+    assert "missing_other" not in sys.modules
+    assert "Note: creating stub module missing_pkg\n" in capsys.readouterr().err
+    assert loader.missing_modules == set()
+
+
+def test_guarded_import_is_not_stubbed(tmp_path):
+    _write_cli(
+        tmp_path / "stubbed_cli.py",
+        "try:\n"
+        "    import missing_json as json\n"
+        "except ImportError:\n"
+        "    import json\n"
+        "DUMPED = json.dumps(1)\n",
+    )
+    loader = FunctionLoader([str(tmp_path)])
+    try:
+        loader.load_function("stubbed_cli", "get_parser")
+        assert sys.modules["stubbed_cli"].DUMPED == "1"
+    finally:
+        sys.modules.pop("stubbed_cli", None)
+
+
+def test_missing_module_of_dependency_is_stubbed_on_retry(tmp_path):
+    # Dependencies outside of the project roots get a stub only after failing to import
+    dependency_dir = tmp_path / "deps"
+    dependency_dir.mkdir()
+    (dependency_dir / "stubbed_dependency.py").write_text("import missing_dependency\n")
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    _write_cli(project_dir / "stubbed_cli.py", "import stubbed_dependency\n")
+    sys.path.append(str(dependency_dir))
+    loader = FunctionLoader([str(project_dir)])
+    try:
+        loader.load_function("stubbed_cli", "get_parser")
+    finally:
+        sys.path.remove(str(dependency_dir))
+        sys.modules.pop("stubbed_cli", None)
+        sys.modules.pop("stubbed_dependency", None)
+
+    assert loader.missing_modules == {"missing_dependency"}
+
+
+def test_modules_imported_before_retry_are_dependencies(tmp_path):
+    dependency_dir = tmp_path / "deps"
+    dependency_dir.mkdir()
+    (dependency_dir / "stubbed_dependency.py").write_text("import missing_dependency\n")
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    # The helper is imported by the first, failed attempt, and found in sys.modules by the retry
+    (project_dir / "stubbed_helper.py").write_text("HELP = 'help'\n")
+    _write_cli(project_dir / "stubbed_cli.py", "import stubbed_helper\nimport stubbed_dependency\n")
+    sys.path.append(str(dependency_dir))
+    loader = FunctionLoader([str(project_dir)])
+    try:
+        loader.load_function("stubbed_cli", "get_parser")
+    finally:
+        sys.path.remove(str(dependency_dir))
+        for name in ("stubbed_cli", "stubbed_helper", "stubbed_dependency"):
+            sys.modules.pop(name, None)
+
+    dependencies = loader.module_dependencies["stubbed_cli"]
+    assert str(project_dir / "stubbed_helper.py") in dependencies
+    assert str(project_dir / "stubbed_cli.py") in dependencies
+
+
+def test_missing_target_module_is_an_error(tmp_path, capsys):
+    loader = FunctionLoader([str(tmp_path)])
+    with pytest.raises(ModuleNotFoundError):
+        loader.load_function("missing_cli", "get_parser")
+    assert "Error importing module missing_cli" in capsys.readouterr().err
+
+
+def test_configured_modules_are_stubbed_even_if_installed(tmp_path):
+    (tmp_path / "heavy_dependency.py").write_text("LOADED = True\n")
+    sys.path.append(str(tmp_path))
+    try:
+        with stub_imports(prefixes=["heavy_dependency"]):
+            import heavy_dependency.submodule
+
+            assert isinstance(heavy_dependency.submodule, StubModule)
+        import heavy_dependency
+
+        assert heavy_dependency.LOADED is True
+    finally:
+        sys.path.remove(str(tmp_path))
+        sys.modules.pop("heavy_dependency", None)
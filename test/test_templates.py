@@ -0,0 +1,83 @@
+import io
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from argparse_to_md.cache import RenderCache
+from argparse_to_md.loader import FunctionLoader
+from argparse_to_md.markdown_processor import args_to_options, process_markdown
+from argparse_to_md.templates import compile_template, load_template
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def test_compile_template():
+    template = compile_template("- {invocation}: {help} {{literal}}\n", "action")
+    assert template.fields == {"invocation", "help"}
+    assert template.render({"invocation": "`--foo`", "help": "foo help"}) == "- `--foo`: foo help {literal}\n"
+    # Each distinct template is compiled once
+    assert compile_template("- {invocation}: {help} {{literal}}\n", "action") is template
+
+    with pytest.raises(ValueError, match=r"Unknown field '\{usage\}' in action template"):
+        compile_template("{usage}", "action")
+    with pytest.raises(ValueError, match="format specs are not supported"):
+        compile_template("{help:>10}", "action")
+    with pytest.raises(ValueError, match="Invalid group template"):
+        compile_template("{title", "group")
+
+
+def test_load_template_reloads_changed_file(tmp_path):
+    path = tmp_path / "action.md"
+    path.write_text("* {dest}\n")
+    template = load_template(str(path), "action")
+    assert load_template(str(path), "action") is template
+
+    path.write_text("* {dest}: {help}\n")
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 1_000_000))
+    assert load_template(str(path), "action").fields == {"dest", "help"}
+
+
+def test_template_options(tmp_path):
+    (tmp_path / "action.md").write_text("* {dest}\n")
+    options = args_to_options("action_template=action.md:pad_lists=1", str(tmp_path))
+    assert options.action_template == str(tmp_path / "action.md")
+    assert options.pad_lists
+
+    with pytest.raises(ValueError, match="Can't read usage template"):
+        args_to_options("usage_template=missing.md", str(tmp_path))
+    with pytest.raises(ValueError, match="only supported with format=markdown"):
+        args_to_options("format=rst:action_template=action.md", str(tmp_path))
+
+
+def test_custom_templates(tmp_path):
+    (tmp_path / "usage.md").write_text("{heading}{label} ({command})\n\n    {usage}\n")
+    (tmp_path / "group.md").write_text("\n| {title} | |\n|---|---|\n{actions}")
+    (tmp_path / "action.md").write_text("| {invocations} | {help} |\n")
+    md_path = tmp_path / "cli.md"
+    marker = "<!--argparse_to_md:test3:get_parser:max_depth=1:usage_template=usage.md"
+    marker += ":group_template=group.md:action_template=action.md-->\n"
+    md_path.write_text(marker + "<!--argparse_to_md_end-->\n")
+
+    def process() -> str:
+        out_md = io.StringIO()
+        with open(md_path) as in_md:
+            process_markdown(in_md, out_md, FunctionLoader([str(DATA_DIR)]), RenderCache(str(tmp_path / "cache")))
+        return out_md.getvalue()
+
+    try:
+        output = process()
+    finally:
+        sys.modules.pop("test3", None)
+    assert output.startswith(marker + "Usage ()\n\n    testprog [-h] [--opt5 OPT5] {foo,bar} ...\n")
+    assert "\n| Optional arguments | |\n|---|---|\n| --opt5 OPT5 | option 5 |\n" in output
+    assert "Usage of `foo` (foo)\n" in output
+    assert "\n| Optional arguments of `foo` | |\n" in output
+
+    # The cached block depends on the templates, on the next run
+    (tmp_path / "action.md").write_text("| `{invocations}` | {help} |\n")
+    try:
+        assert "| `--opt5 OPT5` | option 5 |\n" in process()
+    finally:
+        sys.modules.pop("test3", None)
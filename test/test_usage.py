@@ -1,13 +1,22 @@
 import io
+import json
+import mmap
 import subprocess
 import sys
 from pathlib import Path
 
 import pytest
 
+from argparse_to_md import markdown_processor
 from argparse_to_md.formatter import MarkdownHelpFormatterOptions
 from argparse_to_md.loader import FunctionLoader
-from argparse_to_md.markdown_processor import args_to_options, process_markdown
+from argparse_to_md.markdown_processor import (
+    args_to_options,
+    iter_markdown_buffer,
+    map_markdown_file,
+    process_markdown,
+    scan_markers,
+)
 
 
 def test_usage():
@@ -85,9 +94,143 @@ def test_arguments_to_options():
     assert args_to_options("subheading_level=2:pad_lists=1") == MarkdownHelpFormatterOptions(
         subheading_level=2, pad_lists=True
     )
+    assert args_to_options("path=db/migrate:include=up,down*:exclude=down-all ") == MarkdownHelpFormatterOptions(
+        path=("db", "migrate"), include=("up", "down*"), exclude=("down-all",)
+    )
     with pytest.raises(ValueError):
         args_to_options("subheading_level=2:foo=bar")
     with pytest.raises(ValueError):
         args_to_options("opt1:opt2")
     with pytest.raises(ValueError):
         args_to_options("opt=val=val2")
+
+
+def test_cli_jobs(tmp_path):
+    data_dir = Path(__file__).parent / "data"
+    inputs = []
+    for name in ("test1", "test3"):
+        md_path = tmp_path / f"{name}.md"
+        md_path.write_text((data_dir / f"{name}.md.in").read_text())
+        inputs += ["-i", str(md_path)]
+
+    result = subprocess.run(
+        [sys.executable, "-m", "argparse_to_md", "--no-cache", "--jobs", "2", "--extra-sys-path", str(data_dir)]
+        + inputs,
+        text=True,
+        capture_output=True,
+    )
+
+    assert result.returncode == 0, result.stderr
+    for name in ("test1", "test3"):
+        assert (tmp_path / f"{name}.md").read_text() == (data_dir / f"{name}.md.expected").read_text()
+
+
+def test_cli_parallel_check_output_order(tmp_path):
+    data_dir = Path(__file__).parent / "data"
+    inputs = []
+    for i in range(6):
+        name = "test2.md.in" if i % 2 else "test2.md.expected"
+        md_path = tmp_path / f"{i}.md"
+        md_path.write_text((data_dir / name).read_text())
+        inputs += ["-i", str(md_path)]
+
+    result = subprocess.run(
+        [sys.executable, "-m", "argparse_to_md", "--no-cache", "--check", "--jobs", "4"]
+        + ["--extra-sys-path", str(data_dir)]
+        + inputs,
+        text=True,
+        capture_output=True,
+    )
+
+    assert result.returncode == 2
+    reported = [line for line in result.stderr.splitlines() if line.startswith("Changes required in")]
+    assert reported == [f"Changes required in {tmp_path / f'{i}.md'}:" for i in (1, 3, 5)]
+
+
+def test_cli_check_json_report(tmp_path):
+    data_dir = Path(__file__).parent / "data"
+    up_to_date = (data_dir / "test2.md.expected").read_text()
+    stale = (data_dir / "test2.md.in").read_text()
+    md_path = tmp_path / "test.md"
+    md_path.write_text(up_to_date + "\n" + stale)
+
+    result = subprocess.run(
+        [sys.executable, "-m", "argparse_to_md", "--no-cache", "--check", "--format", "json"]
+        + ["--extra-sys-path", str(data_dir), "-i", str(md_path)],
+        text=True,
+        capture_output=True,
+    )
+
+    assert result.returncode == 2
+    assert result.stderr == ""
+    report = json.loads(result.stdout)
+    assert report["check"] is True
+    [file_report] = report["files"]
+    assert file_report["file"] == str(md_path)
+    # Only the stale block is reported, with the line numbers of the file
+    [block] = file_report["blocks"]
+    start_line = up_to_date.count("\n") + 4
+    assert block["marker"] == "<!--argparse_to_md:test2:get_parser-->"
+    assert (block["start_line"], block["end_line"]) == (start_line, start_line + 8)
+    # The changed line is the 7th line of the block contents, preceded by 3 lines of context
+    assert f"@@ -{start_line + 4},4 +{start_line + 4},4 @@" in block["diff"]
+    assert "+- `--foo FOO`: foo help" in block["diff"]
+
+
+def test_scan_markers():
+    buffer = b"text\n<!-- argparse_to_md:mod:func -->\nold\n<!--argparse_to_md_end-->\n  <!--argparse_to_md:x:y-->\n"
+    assert scan_markers(buffer) == [(5, 38), (42, 68)]
+    assert scan_markers(b"no markers here\n") == []
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_buffer_processing_matches_text_processing(tmp_path, monkeypatch, newline):
+    data_dir = Path(__file__).parent / "data"
+    md_path = tmp_path / "test3.md"
+    md_path.write_text((data_dir / "test3.md.in").read_text() + "trailer without newline", newline=newline)
+    # Force the mmap path even for a small file
+    monkeypatch.setattr(markdown_processor, "MMAP_MIN_SIZE", 0)
+
+    with map_markdown_file(str(md_path)) as buffer:
+        assert isinstance(buffer, mmap.mmap)
+        chunks = list(
+            iter_markdown_buffer(buffer, scan_markers(buffer), "utf-8", str(data_dir), FunctionLoader(), None)
+        )
+    expected = io.StringIO()
+    with open(md_path) as f:
+        in_md = io.StringIO(f.read())
+    in_md.name = str(data_dir / "test3.md")  # type: ignore[attr-defined]
+    process_markdown(in_md, expected, FunctionLoader())
+
+    assert "".join(chunks) == expected.getvalue()
+    assert expected.getvalue().endswith("<!--argparse_to_md_end-->\ntrailer without newline")
+
+
+def test_buffer_regions_are_decoded_in_pieces(monkeypatch):
+    monkeypatch.setattr(markdown_processor, "_DECODE_CHUNK_SIZE", 4)
+    # Pieces end in the middle of "\r\n" pairs and of multi-byte characters
+    text = "ab\r\nc\r\r\nüü\rx\r"
+    pieces = list(markdown_processor._iter_decoded(text.encode(), 0, len(text.encode()), "utf-8"))
+    assert len(pieces) > 1
+    assert "".join(pieces) == "ab\nc\n\nüü\nx\n"
+
+
+def test_unknown_subcommand_path_is_reported_for_the_block():
+    data_dir = Path(__file__).parent / "data"
+    text = "<!--argparse_to_md:test3:get_parser:path=foo-->\n<!--argparse_to_md_end-->\n"
+    text += "<!--argparse_to_md:test3:get_parser:path=baz-->\nold\n<!--argparse_to_md_end-->\n"
+    buffer = text.encode()
+    errors = []
+    chunks = iter_markdown_buffer(
+        buffer,
+        scan_markers(buffer),
+        "utf-8",
+        str(data_dir),
+        FunctionLoader(),
+        on_error=lambda marker, line, error: errors.append((line, str(error))),
+    )
+    output = "".join(chunks)
+    assert "Usage of `foo`:\n```\ntestprog foo [-h]" in output
+    assert "Usage:" not in output
+    assert "\nold\n" in output
+    assert errors == [(3, "Unknown subcommand 'baz' in path 'baz'. Available subcommands: foo, bar")]
@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from argparse_to_md.watch import FileWatcher
+
+MODULE_TEMPLATE = """
+import argparse
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog="watched_cli")
+    parser.add_argument("--foo", help="{help}")
+    return parser
+"""
+
+
+def test_file_watcher_reports_changes(tmp_path):
+    existing = tmp_path / "existing.py"
+    existing.write_text("a = 1\n")
+    missing = tmp_path / "missing.py"
+    watcher = FileWatcher()
+    watcher.add([str(existing), str(missing)])
+    assert watcher.poll() == set()
+
+    existing.write_text("a = 12\n")
+    missing.write_text("")
+    assert watcher.poll() == {os.path.realpath(existing), os.path.realpath(missing)}
+    assert watcher.poll() == set()
+
+    # Own changes are not reported after update
+    existing.write_text("a = 123\n")
+    watcher.update([str(existing)])
+    assert watcher.poll() == set()
+
+
+def _wait_for(predicate, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_cli_watch_updates_on_change(tmp_path):
+    module_path = tmp_path / "watched_cli.py"
+    module_path.write_text(MODULE_TEMPLATE.format(help="old help"))
+    md_path = tmp_path / "README.md"
+    md_path.write_text("<!--argparse_to_md:watched_cli:get_parser-->\n<!--argparse_to_md_end-->\n")
+
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).parent.parent))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "argparse_to_md", "-i", "README.md", "--no-cache", "--watch", "0.05"],
+        cwd=tmp_path,
+        env=env,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert process.stderr is not None
+        for line in process.stderr:
+            if line.startswith("Watching for changes"):
+                break
+        assert "`--foo FOO`: old help" in md_path.read_text()
+
+        module_path.write_text(MODULE_TEMPLATE.format(help="updated help"))
+        assert _wait_for(lambda: "`--foo FOO`: updated help" in md_path.read_text())
+    finally:
+        process.terminate()
+        process.wait()